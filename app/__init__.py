@@ -1,9 +1,24 @@
 import os
 from flask import Flask
-from .blueprints.legacy import bp as legacy_bp
+from .blueprints.legacy import bp as legacy_bp, start_background
 from .services.settings import SettingsService
 from .services.preview import PreviewService
 from .services.rclone import RcloneService
+from .services.player import create_player_backend
+from .services.telemetry import PlaybackTelemetry
+from .services.playlist import PlaylistService
+from .services.scheduler import SchedulerService
+from .services.library import LibraryService
+from .services.supervisor import Supervisor
+from .services.resume import ResumeStore
+from .services.cache import ContentCache
+from .services.integrity import IntegrityVerifier
+from .services.fleet import FleetService
+from .services.lockstep import LockstepService
+from .services.lan_share import LanShare
+from .services.commands import CommandLog
+from .server import install_static_offload
+from . import metrics
 
 def create_app():
     app = Flask(__name__, template_folder="templates", static_folder="static")
@@ -21,19 +36,63 @@ def create_app():
     os.makedirs(hls_dir, exist_ok=True)
 
     # Services
-    settings_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "settings.json")
+    # RPI_AVP_SETTINGS : un fichier par instance (plusieurs lecteurs sur une meme machine)
+    settings_path = os.environ.get("RPI_AVP_SETTINGS") or \
+        os.path.join(os.path.dirname(os.path.dirname(__file__)), "settings.json")
     settings = SettingsService(settings_path)
     preview = PreviewService(settings, hls_dir=hls_dir, hls_index=hls_index)
     # Align rclone logs directory with legacy path (no extra 'logs' subdir)
     rclone_logs = os.path.join(user_home, ".local", "share", "rpi-avp")
-    rclone = RcloneService(settings, video_dir=video_dir, log_dir=rclone_logs)
+    # Disk budget / LRU eviction of the synced library (off unless cache_budget_mb is set)
+    cache = ContentCache(settings, video_dir=video_dir, file_path=os.path.join(rclone_logs, "cache_played.json"))
+    # Fleet controller: aggregated status / batched commands over peer players
+    fleet = FleetService(settings)
+    # LAN distribution: missing files fetched from fleet peers before rclone (off unless lan_share)
+    lan = LanShare(settings, video_dir=video_dir, fleet=fleet)
+    # Background checksums of synced media; corrupt files moved out of VIDEO_DIR (the delta sync skips rejected uploads)
+    integrity = IntegrityVerifier(settings, video_dir=video_dir,
+                                  file_path=os.path.join(rclone_logs, "integrity.json"),
+                                  quarantine_dir=os.path.join(rclone_logs, "quarantine"))
+    rclone = RcloneService(settings, video_dir=video_dir, log_dir=rclone_logs, cache=cache, lan=lan,
+                           integrity=integrity)
+    # Player backend: libVLC by default, RPI_AVP_PLAYER=fake for headless benchmarks/CI
+    player = create_player_backend()
+    # Playback timeline (start latency, transition gaps, stalls) fed by player events
+    telemetry = PlaybackTelemetry()
+    # Named playlists / ordering modes, persisted next to the rclone log (user data dir)
+    playlist = PlaylistService(os.path.join(rclone_logs, "playlists.json"))
+    # Time-of-day playlist rules (thread started by start_background())
+    scheduler = SchedulerService(settings, playlist, video_dir=video_dir)
+    # Flat or recursive (folders = collections) listing of VIDEO_DIR
+    library = LibraryService(settings, video_dir=video_dir, thumb_dir=thumb_dir)
+    # Watchdog: player progress + background workers (thread started by start_background())
+    supervisor = Supervisor(settings, player)
+    # Item/position checkpoint for resume after restart or power cut
+    resume = ResumeStore(settings, os.path.join(rclone_logs, "resume.json"), video_dir=video_dir)
+    # Video walls: follow a master player's item and position over UDP (thread started by start_background())
+    lockstep = LockstepService(settings, player)
+    # Batched remote commands (POST /api/control): command-ID idempotency window
+    commands = CommandLog()
 
     app.extensions.setdefault("services", {})
     app.extensions["services"].update({
         "settings": settings,
         "preview": preview,
         "rclone": rclone,
-        # Potential future services (player, library, thumbnails) can be added here.
+        "player": player,
+        "telemetry": telemetry,
+        "playlist": playlist,
+        "scheduler": scheduler,
+        "library": library,
+        "supervisor": supervisor,
+        "resume": resume,
+        "cache": cache,
+        "integrity": integrity,
+        "fleet": fleet,
+        "lockstep": lockstep,
+        "lan": lan,
+        "commands": commands,
+        # Potential future services (thumbnails) can be added here.
     })
     app.extensions.setdefault("paths", {})
     app.extensions["paths"].update({
@@ -44,4 +103,7 @@ def create_app():
     })
 
     app.register_blueprint(legacy_bp)
+    metrics.init_app(app)
+    # Static / thumbnails / HLS segments served before Flask routing
+    install_static_offload(app)
     return app
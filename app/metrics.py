@@ -0,0 +1,268 @@
+# app/metrics.py
+"""
+Metriques au format texte Prometheus, sans dependance externe.
+
+Les metriques sont des objets module-level (comme prometheus_client) pour
+pouvoir instrumenter utils/services sans leur passer l'app. Chaque
+observation = un lock + quelques additions : assez peu couteux pour rester
+actif en permanence sur le Pi. Les valeurs "a la demande" (CPU/RSS, etat
+du lecteur...) passent par des collecteurs appeles uniquement au scrape.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    esc = (lambda v: v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str) -> None:
+        self.name = name
+        self.doc = doc
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str) -> None:
+        super().__init__(name, doc)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        k = _key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items()) or [((), 0.0)]
+        return self.header() + [f"{self.name}{_fmt_labels(k)} {_fmt_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, doc)
+        self.buckets = tuple(sorted(buckets))
+        # label -> [compteurs par bucket..., +Inf], somme
+        self._values: Dict[LabelKey, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        k = _key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(k, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[idx] += 1
+            total[0] += value
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(_key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(c), t[0]) for k, (c, t) in self._values.items()]
+        out = self.header()
+        for k, counts, total in items:
+            cum = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cum += n
+                out.append(f"{self.name}_bucket{_fmt_labels(k, ('le', _fmt_value(bound)))} {cum}")
+            out.append(f"{self.name}_sum{_fmt_labels(k)} {_fmt_value(total)}")
+            out.append(f"{self.name}_count{_fmt_labels(k)} {cum}")
+        return out
+
+
+class _Timer:
+    def __init__(self, hist: Histogram, labels: Dict[str, object]) -> None:
+        self.hist, self.labels = hist, labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0, **self.labels)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+        self._collectors: Dict[str, Callable[[], Iterable[str]]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            self._metrics.append(metric)
+
+    def add_collector(self, fn: Callable[[], Iterable[str]], name: Optional[str] = None) -> None:
+        """`fn` renvoie des lignes d'exposition deja formatees (appele au scrape).
+        Un collecteur de meme nom remplace le precedent (create_app() rappele)."""
+        with self._lock:
+            self._collectors[name or getattr(fn, "__name__", repr(fn))] = fn
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in list(self._metrics):
+            lines.extend(m.render())
+        for fn in list(self._collectors.values()):
+            try:
+                lines.extend(fn())
+            except Exception as e:
+                lines.append(f"# collector {getattr(fn, '__name__', fn)} failed: {type(e).__name__}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def gauge_lines(name: str, doc: str, samples: Iterable[Tuple[Dict[str, object], float]], kind: str = "gauge") -> List[str]:
+    """Helper pour collecteurs : HELP/TYPE + un echantillon par jeu de labels."""
+    out = [f"# HELP {name} {doc}", f"# TYPE {name} {kind}"]
+    out += [f"{name}{_fmt_labels(_key(labels))} {_fmt_value(v)}" for labels, v in samples]
+    return out
+
+
+# ==============================
+# Metriques de l'application
+# ==============================
+HTTP_REQUEST_SECONDS = Histogram(
+    "rpi_avp_http_request_duration_seconds", "Latence des requetes Flask par route.")
+VIDEOS_LOCK_WAIT_SECONDS = Histogram(
+    "rpi_avp_videos_lock_wait_seconds", "Attente pour acquerir videos_lock.",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.2, 0.5, 1.0))
+VIDEOS_LOCK_TIMEOUTS = Counter(
+    "rpi_avp_videos_lock_timeouts_total", "Acquisitions de videos_lock abandonnees (timeout).")
+TRACK_CHANGE_SECONDS = Histogram(
+    "rpi_avp_track_change_seconds", "Delai commande de lecture -> etat Playing.",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0))
+THUMBNAIL_SECONDS = Histogram(
+    "rpi_avp_thumbnail_seconds", "Duree de generation d'une miniature.",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+SYNC_SECONDS = Histogram(
+    "rpi_avp_sync_duration_seconds", "Duree des rclone sync.",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600))
+SYNC_BYTES = Counter(
+    "rpi_avp_sync_transferred_bytes_total", "Octets transferes par rclone sync.")
+CACHE_EVICTIONS = Counter(
+    "rpi_avp_cache_evictions_total", "Fichiers locaux evinces par le budget disque (cache).")
+INTEGRITY_FILES = Counter(
+    "rpi_avp_integrity_checked_files_total", "Fichiers verifies (result=ok|corrupt).")
+LAN_BYTES = Counter(
+    "rpi_avp_lan_fetched_bytes_total", "Octets recus des lecteurs pairs (partage LAN) au lieu du remote.")
+LAN_FILES = Counter(
+    "rpi_avp_lan_fetched_files_total", "Fichiers demandes aux pairs (result=ok|failed).")
+LOCKSTEP_SKEW = Gauge(
+    "rpi_avp_lockstep_skew_seconds", "Ecart de position suiveur - maitre (lecture synchronisee).")
+LOCKSTEP_CORRECTIONS = Counter(
+    "rpi_avp_lockstep_corrections_total", "Corrections du suiveur (kind=load|seek|rate|pause).")
+HLS_SEGMENTS = Counter(
+    "rpi_avp_hls_segments_total", "Segments HLS produits par l'encodeur d'apercu.")
+
+
+def _process_collector() -> List[str]:
+    t = os.times()
+    samples = [({}, t.user + t.system)]
+    out = gauge_lines("process_cpu_seconds_total", "CPU utilisateur + systeme du process.", samples, "counter")
+    try:
+        with open("/proc/self/statm", "r") as f:
+            rss_pages = int(f.read().split()[1])
+        out += gauge_lines("process_resident_memory_bytes", "RSS du process.",
+                           [({}, rss_pages * os.sysconf("SC_PAGE_SIZE"))])
+    except (OSError, ValueError, IndexError):
+        pass
+    out += gauge_lines("process_threads", "Threads Python actifs.", [({}, threading.active_count())])
+    return out
+
+
+REGISTRY.add_collector(_process_collector)
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def init_app(app) -> None:
+    """Latence par route (hooks Flask) + collecteurs lies aux services de l'app."""
+    from flask import g, request
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_t0 = time.perf_counter()
+
+    @app.after_request
+    def _metrics_observe(response):
+        t0 = g.pop("_metrics_t0", None)
+        if t0 is not None:
+            rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - t0, route=rule, method=request.method,
+                                         status=response.status_code)
+        return response
+
+    services = app.extensions.get("services", {})
+
+    def _hls_collector() -> List[str]:
+        # segments comptes par PreviewService (watcher / avant effacement), pas au scrape
+        preview = services.get("preview")
+        viewers = preview.active_viewers() if preview is not None else 0
+        return gauge_lines("rpi_avp_preview_viewers", "Viewers HLS actifs.", [({}, viewers)])
+
+    def _player_collector() -> List[str]:
+        player = services.get("player")
+        if player is None:
+            return []
+        # dernier sondage du superviseur : un libVLC bloque ne bloque pas /metrics
+        supervisor = services.get("supervisor")
+        if not player.ready:
+            state = "uninitialized"
+        else:
+            state = supervisor.probed_state() if supervisor is not None else "unknown"
+        return gauge_lines("rpi_avp_player_state", "Etat courant du lecteur (1 = actif).",
+                           [({"backend": player.name, "state": state}, 1)])
+
+    REGISTRY.add_collector(_hls_collector, "hls")
+    REGISTRY.add_collector(_player_collector, "player")
@@ -0,0 +1,132 @@
+# app/profiler.py
+"""
+Profileur par echantillonnage de piles, a activer a chaud pour diagnostiquer
+une unite lente sans SSH.
+
+Un thread lit sys._current_frames() `hz` fois par seconde pendant `seconds`
+et compte chaque pile (tous les threads : requetes waitress, bootstrap,
+sync rclone, workers miniatures...). Rien n'est installe dans l'interpreteur
+(pas de setprofile/settrace) : le cout n'existe que pendant la capture.
+
+Sortie "collapsed stacks" (une ligne `thread;f1;f2;... N`), directement
+lisible par flamegraph.pl ou speedscope.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_HZ = 50
+MAX_HZ = 250
+MAX_SECONDS = 120.0
+
+_running = threading.Lock()  # une seule capture a la fois
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _stack(frame, max_depth: int = 128) -> List[str]:
+    out = []
+    while frame is not None and len(out) < max_depth:
+        out.append(_frame_label(frame))
+        frame = frame.f_back
+    out.reverse()
+    return out
+
+
+def _thread_group(name: str) -> str:
+    """Regroupe les threads numerotes ("waitress-3", "thumb_1") sous un meme nom."""
+    base = name.rstrip("0123456789").rstrip("-_ ")
+    return base or name
+
+
+def sample(seconds: float, hz: int = DEFAULT_HZ, group_threads: bool = True) -> Tuple[Counter, Dict[str, object]]:
+    """
+    Capture bloquante. Renvoie (Counter pile->echantillons, infos).
+    Leve ProfilerBusy si une capture est deja en cours.
+    """
+    seconds = max(0.1, min(float(seconds), MAX_SECONDS))
+    hz = max(1, min(int(hz), MAX_HZ))
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy("profiling already in progress")
+    try:
+        me = threading.get_ident()
+        stacks: Counter = Counter()
+        interval = 1.0 / hz
+        ticks = 0
+        t0 = time.perf_counter()
+        deadline = t0 + seconds
+        next_tick = t0
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                name = names.get(ident, f"thread-{ident}")
+                thread = _thread_group(name) if group_threads else name
+                stacks[";".join([thread] + _stack(frame))] += 1
+            ticks += 1
+            next_tick += interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()  # en retard : on ne rattrape pas
+        elapsed = time.perf_counter() - t0
+        cpu = os.times()
+        info = {
+            "seconds": round(elapsed, 3),
+            "hz": hz,
+            "ticks": ticks,
+            "effective_hz": round(ticks / elapsed, 1) if elapsed else None,
+            "samples": sum(stacks.values()),
+            "process_cpu_s": round(cpu.user + cpu.system, 2),
+        }
+        return stacks, info
+    finally:
+        _running.release()
+
+
+def collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {n}\n" for stack, n in stacks.most_common())
+
+
+def top_functions(stacks: Counter, limit: int = 20) -> List[Dict[str, object]]:
+    """Fonctions les plus presentes en sommet de pile (temps "self")."""
+    self_counts: Counter = Counter()
+    for stack, n in stacks.items():
+        self_counts[stack.rsplit(";", 1)[-1]] += n
+    total = sum(self_counts.values()) or 1
+    return [{"frame": f, "samples": n, "pct": round(100.0 * n / total, 1)}
+            for f, n in self_counts.most_common(limit)]
+
+
+def by_thread(stacks: Counter) -> Dict[str, int]:
+    out: Counter = Counter()
+    for stack, n in stacks.items():
+        out[stack.split(";", 1)[0]] += n
+    return dict(out.most_common())
+
+
+def is_running() -> bool:
+    return _running.locked()
+
+
+def profile(seconds: float, hz: Optional[int] = None, fmt: str = "collapsed"):
+    """Helper pour la route : texte collapsed ou dict JSON."""
+    stacks, info = sample(seconds, hz or DEFAULT_HZ)
+    if fmt == "json":
+        return dict(info, threads=by_thread(stacks), top=top_functions(stacks), collapsed=collapsed(stacks))
+    return collapsed(stacks)
@@ -0,0 +1,286 @@
+# app/server.py
+import io
+import mimetypes
+import os
+import re
+import threading
+import logging
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from . import metrics
+from .utils import VIDEO_EXTENSIONS
+
+_logger = logging.getLogger('rpi_avp')
+
+# Taille de bloc pour wsgi.file_wrapper (sendfile cote serveur si supporte)
+FILE_BLOCK_SIZE = 256 * 1024
+DEFAULT_MAX_STREAMS = 4  # lectures /media simultanees (carte SD + uplink du Pi)
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+Mount = Tuple[str, str, str, Optional[Tuple[str, ...]], Optional["StreamSlots"], Optional[Callable[[], bool]]]
+
+
+class StreamSlots:
+    """Nombre borne de reponses en cours sur un point de montage (liberees a la fermeture du fichier)."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = max(1, int(limit))
+        self.active = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self.active >= self.limit:
+                self.rejected += 1
+                return False
+            self.active += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.active -= 1
+
+
+class _SlotFile(io.FileIO):
+    """Fichier qui rend son slot a la fermeture (par le serveur, une fois la reponse envoyee)."""
+
+    def __init__(self, path: str, slots: StreamSlots) -> None:
+        super().__init__(path, "rb")
+        self._slots = slots
+
+    def close(self) -> None:
+        if not self.closed:
+            self._slots.release()
+        super().close()
+
+
+class StaticOffload:
+    """
+    Middleware WSGI minimal : sert directement les fichiers statiques,
+    miniatures et segments HLS sans passer par Flask (routing, contexte,
+    sessions). Utilise `wsgi.file_wrapper` pour laisser le serveur faire
+    un envoi zero-copie quand il le supporte.
+
+    Requetes Range (un seul intervalle, If-Range) : 206 avec le morceau
+    demande, envoye lui aussi par `wsgi.file_wrapper` (position du fichier
+    + Content-Length, cf. waitress).
+
+    mounts: liste de (prefixe_url, dossier, cache_control, suffixes|None,
+    slots|None, gate|None). Avec `slots` (StreamSlots), le nombre de
+    reponses en cours est borne : au-dela, 503 + Retry-After. Si `gate()`
+    est faux, ou si le fichier n'existe pas, la requete retombe sur
+    l'application.
+    """
+
+    def __init__(self, app, mounts: Iterable[Mount]):
+        self.app = app
+        self.mounts: List[Mount] = [
+            (prefix.rstrip("/") + "/", os.path.abspath(root), cache, suffixes, slots, gate)
+            for prefix, root, cache, suffixes, slots, gate in mounts
+        ]
+
+    def __call__(self, environ, start_response):
+        if environ.get("REQUEST_METHOD") in ("GET", "HEAD"):
+            try:
+                # PEP 3333 : octets UTF-8 de l'URL decodes en latin-1 (noms accentues)
+                path = environ.get("PATH_INFO", "").encode("latin-1").decode("utf-8")
+            except UnicodeError:
+                return self.app(environ, start_response)
+            for prefix, root, cache, suffixes, slots, gate in self.mounts:
+                if not path.startswith(prefix):
+                    continue
+                rel = path[len(prefix):]
+                if suffixes and not rel.lower().endswith(suffixes):
+                    break
+                if gate is not None and not gate():
+                    break
+                full = self._resolve(root, rel)
+                if full:
+                    return self._serve(environ, start_response, full, cache, slots)
+                break
+        return self.app(environ, start_response)
+
+    @staticmethod
+    def _resolve(root: str, rel: str) -> Optional[str]:
+        if not rel or "\x00" in rel:
+            return None
+        full = os.path.abspath(os.path.join(root, rel))
+        # Pas de sortie du dossier monte (../)
+        if not full.startswith(root + os.sep) or not os.path.isfile(full):
+            return None
+        return full
+
+    @staticmethod
+    def _serve(environ, start_response, full: str, cache: str, slots: Optional[StreamSlots] = None):
+        st = os.stat(full)
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        last_modified = formatdate(st.st_mtime, usegmt=True)
+        headers = [
+            ("ETag", etag),
+            ("Last-Modified", last_modified),
+            ("Cache-Control", cache),
+            ("Accept-Ranges", "bytes"),
+        ]
+        if _not_modified(environ, etag, st.st_mtime):
+            start_response("304 Not Modified", headers)
+            return []
+        size = st.st_size
+        span = None
+        if environ.get("HTTP_RANGE") and _if_range_ok(environ, etag, last_modified):
+            span = _parse_range(environ["HTTP_RANGE"], size)
+            if span == (-1, -1):
+                start_response("416 Range Not Satisfiable", headers + [
+                    ("Content-Range", f"bytes */{size}"), ("Content-Length", "0")])
+                return []
+        head = environ.get("REQUEST_METHOD") == "HEAD"
+        if slots is not None and not head and not slots.acquire():
+            start_response("503 Service Unavailable", [
+                ("Retry-After", "2"), ("Content-Type", "text/plain"), ("Content-Length", "0")])
+            return []
+        ctype = mimetypes.guess_type(full)[0] or "application/octet-stream"
+        headers.append(("Content-Type", ctype))
+        if span is None:
+            start, length, status = 0, size, "200 OK"
+        else:
+            start, length, status = span[0], span[1] - span[0] + 1, "206 Partial Content"
+            headers.append(("Content-Range", f"bytes {span[0]}-{span[1]}/{size}"))
+        headers.append(("Content-Length", str(length)))
+        try:
+            fh = _SlotFile(full, slots) if slots is not None and not head else open(full, "rb")
+        except OSError:
+            if slots is not None and not head:
+                slots.release()
+            raise
+        start_response(status, headers)
+        if head:
+            fh.close()
+            return []
+        fh.seek(start)
+        wrapper = environ.get("wsgi.file_wrapper")
+        # waitress borne l'envoi a Content-Length depuis la position courante (prepare()) ;
+        # les autres file_wrapper lisent jusqu'a la fin : morceau envoye par _iter_file
+        if wrapper is not None and (span is None or hasattr(wrapper, "prepare")):
+            return wrapper(fh, FILE_BLOCK_SIZE)
+        return _iter_file(fh, length)
+
+
+def _not_modified(environ, etag: str, mtime: float) -> bool:
+    inm = environ.get("HTTP_IF_NONE_MATCH")
+    if inm:
+        return etag in [t.strip() for t in inm.split(",")] or inm.strip() == "*"
+    ims = environ.get("HTTP_IF_MODIFIED_SINCE")
+    if ims:
+        try:
+            return int(mtime) <= parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _if_range_ok(environ, etag: str, last_modified: str) -> bool:
+    """If-Range absent, ou validateur identique : la requete Range s'applique (sinon fichier complet)."""
+    cond = environ.get("HTTP_IF_RANGE")
+    return not cond or cond.strip() in (etag, last_modified)
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    "bytes=a-b" / "bytes=a-" / "bytes=-n" -> (debut, fin) inclus ; None si
+    l'en-tete est ignore (invalide, plusieurs intervalles : reponse 200),
+    (-1, -1) si l'intervalle est hors du fichier (416).
+    """
+    m = _RANGE_RE.match(header.strip())
+    if not m or not (m.group(1) or m.group(2)):
+        return None
+    first, last = m.group(1), m.group(2)
+    if not first:
+        n = int(last)
+        if n == 0 or size == 0:
+            return (-1, -1)
+        return max(0, size - n), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return (-1, -1)
+    return start, end
+
+
+def _iter_file(fh, length: Optional[int] = None):
+    remain = length
+    try:
+        while remain is None or remain > 0:
+            block = fh.read(FILE_BLOCK_SIZE if remain is None else min(FILE_BLOCK_SIZE, remain))
+            if not block:
+                break
+            if remain is not None:
+                remain -= len(block)
+            yield block
+    finally:
+        fh.close()
+
+
+def install_static_offload(app) -> None:
+    """
+    Branche StaticOffload devant l'app Flask (static, miniatures, segments
+    HLS) et sert les videos de la bibliotheque sous /media/<chemin>
+    (lecture directe dans un navigateur, sans transcodage), au plus
+    `media_max_streams` (settings, defaut 4) en parallele.
+    """
+    paths = app.extensions.get("paths", {})
+    services = app.extensions.get("services", {})
+    mounts: List[Mount] = [
+        (app.static_url_path or "/static", app.static_folder, "public, max-age=3600", None, None, None)]
+    if paths.get("THUMB_DIR"):
+        mounts.append(("/thumbnails", paths["THUMB_DIR"], "public, max-age=300", (".png",), None, None))
+    if paths.get("HLS_DIR"):
+        # Segments .ts uniquement : les playlists restent dans Flask (suivi des viewers).
+        # no-store : les noms (seg-00000001.ts...) repartent de zero a chaque video ;
+        # apercu desactive -> route Flask (404)
+        preview = services.get("preview")
+        mounts.append(("/hls", paths["HLS_DIR"], "no-store", (".ts",), None,
+                       preview.is_enabled if preview is not None else None))
+    if paths.get("VIDEO_DIR"):
+        settings = services.get("settings")
+        try:
+            limit = int(settings.get("media_max_streams", DEFAULT_MAX_STREAMS)) if settings else DEFAULT_MAX_STREAMS
+        except (TypeError, ValueError):
+            limit = DEFAULT_MAX_STREAMS
+        slots = StreamSlots(limit)
+        # no-cache : revalidation par ETag (un sync peut remplacer le fichier)
+        mounts.append(("/media", paths["VIDEO_DIR"], "no-cache", VIDEO_EXTENSIONS, slots, None))
+
+        def _media_collector() -> List[str]:
+            return (metrics.gauge_lines("rpi_avp_media_streams", "Lectures /media en cours.", [({}, slots.active)])
+                    + metrics.gauge_lines("rpi_avp_media_streams_rejected_total",
+                                          "Lectures /media refusees (limite atteinte).",
+                                          [({}, slots.rejected)], "counter"))
+
+        metrics.REGISTRY.add_collector(_media_collector, "media")
+    app.wsgi_app = StaticOffload(app.wsgi_app, mounts)
+
+
+def serve(app, host: str = "0.0.0.0", port: int = 5000, threads: Optional[int] = None) -> None:
+    """
+    Serveur de production : waitress (multi-thread) si installe,
+    sinon serveur Werkzeug en mode threaded.
+
+    Variables d'environnement :
+      RPI_AVP_SERVER  : "waitress" (defaut) ou "dev" (serveur Flask)
+      RPI_AVP_THREADS : nombre de threads de travail (defaut 8)
+    """
+    kind = os.environ.get("RPI_AVP_SERVER", "waitress").strip().lower()
+    threads = threads or int(os.environ.get("RPI_AVP_THREADS", "8") or 8)
+    if kind == "waitress":
+        try:
+            from waitress import serve as waitress_serve
+        except ImportError:
+            _logger.warning("waitress absent (pip install waitress) -> serveur Werkzeug threaded")
+        else:
+            _logger.info("waitress on %s:%d (threads=%d)", host, port, threads)
+            waitress_serve(app, host=host, port=port, threads=threads, ident="rpi-avp")
+            return
+    app.run(host=host, port=port, threaded=True)
@@ -0,0 +1,209 @@
+import json
+import os
+import shutil
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from ..metrics import CACHE_EVICTIONS
+from .sync_plan import remove_local
+
+try:
+    from flask import current_app
+    _svc_logger = current_app.logger
+except Exception:
+    _svc_logger = logging.getLogger('rpi_avp')
+
+
+MB = 1 << 20
+DEFAULT_RESERVE_MB = 512     # espace libre garde sur la carte SD (logs, HLS, miniatures)
+DEFAULT_FETCH_AHEAD = 1800.0 # s avant un changement de plage horaire
+TICK_INTERVAL = 60.0
+SAVE_INTERVAL = 60.0         # s entre deux ecritures de l'historique de lecture
+
+
+class ContentCache:
+    """
+    Capacity-aware local cache of the remote folder (instead of a full mirror).
+
+    With a budget set, the sync plan (see sync_plan / RcloneService) keeps
+    only what fits: the item on screen first, then the items of the active
+    playlist and of the playlists referenced by the schedule, then the
+    rest. Within each tier, files already on disk are kept by most recent
+    play; the least recently played are evicted (before any transfer, to
+    free the space) and what does not fit is deferred to a later sync.
+
+    A background tick fetches the items of the next scheduled playlist
+    `cache_fetch_ahead` seconds before its slot if some are missing.
+
+    Settings used:
+      - cache_budget_mb: int (default 0 = full mirror, no eviction)
+      - cache_reserve_mb: int free space kept on the filesystem (default 512)
+      - cache_fetch_ahead: float seconds (default 1800)
+    """
+
+    def __init__(self, settings_service, video_dir: str, file_path: str) -> None:
+        self._settings = settings_service
+        self.video_dir = video_dir
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._played: Dict[str, float] = self._load()
+        self._dirty = False
+        self._last_save = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._pinned: Callable[[Sequence[str]], List[str]] = lambda paths: []
+        self._current: Callable[[], Optional[str]] = lambda: None
+        self._prefetched: Optional[str] = None
+        self.last_selection: Optional[Dict[str, Any]] = None
+
+    # ----- configuration -----
+    def _mb(self, key: str, default: int) -> int:
+        try:
+            return max(0, int(self._settings.get(key, default) or 0))
+        except (TypeError, ValueError):
+            return default
+
+    def enabled(self) -> bool:
+        return self._mb("cache_budget_mb", 0) > 0
+
+    def fetch_ahead(self) -> float:
+        try:
+            return max(0.0, float(self._settings.get("cache_fetch_ahead", DEFAULT_FETCH_AHEAD)))
+        except (TypeError, ValueError):
+            return DEFAULT_FETCH_AHEAD
+
+    def budget(self, local_bytes: int) -> int:
+        """Bytes the library may use: the configured budget, capped by free space minus the reserve."""
+        limit = self._mb("cache_budget_mb", 0) * MB
+        try:
+            free = shutil.disk_usage(self.video_dir).free
+        except OSError:
+            return limit
+        return max(0, min(limit, local_bytes + free - self._mb("cache_reserve_mb", DEFAULT_RESERVE_MB) * MB))
+
+    # ----- historique de lecture -----
+    def _load(self) -> Dict[str, float]:
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                return {str(k): float(v) for k, v in (json.load(f) or {}).items()}
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def touch(self, rel: Optional[str]) -> None:
+        """Record that `rel` was just played (LRU order)."""
+        if not rel:
+            return
+        with self._lock:
+            self._played[rel] = time.time()
+            self._dirty = True
+        if time.monotonic() - self._last_save >= SAVE_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            data, self._dirty = dict(self._played), False
+        self._last_save = time.monotonic()
+        try:
+            os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+            tmp = self.file_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.file_path)
+        except OSError as e:
+            _svc_logger.warning("cache history save failed: %s", e)
+
+    # ----- selection -----
+    def select(self, plan: Dict[str, Any], remote: Dict[str, Dict[str, Any]],
+               local: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Restrict a sync plan to the budget. Adds `evict` (local files to
+        drop first), `deferred` (remote files left out) and `budget`;
+        `copy`, `bytes` and `noop` are recomputed.
+        """
+        try:
+            pinned = list(self._pinned(sorted(remote)))
+        except Exception as e:
+            _svc_logger.warning("cache pinned items failed: %s", e)
+            pinned = []
+        current = self._current()
+        rank = {p: i for i, p in reversed(list(enumerate(pinned)))}
+        with self._lock:
+            played = dict(self._played)
+
+        def key(p: str):
+            tier = 0 if p == current else (1 if p in rank else 2)
+            # sur disque d'abord (le plus recemment lu en tete), puis ordre de playlist / chemin
+            if p in local:
+                return (tier, 0, -played.get(p, 0.0), p)
+            return (tier, 1, rank.get(p, 0), p)
+
+        budget = self.budget(sum(e["size"] for e in local.values()))
+        keep, deferred, used = set(), [], 0
+        for p in sorted(remote, key=key):
+            size = remote[p]["size"]
+            if used + size > budget:
+                deferred.append(p)
+                continue
+            keep.add(p)
+            used += size
+        copy = [p for p in plan["copy"] if p in keep]
+        evict = sorted(p for p in local if p in remote and p not in keep)
+        out = dict(plan, copy=copy, evict=evict, deferred=sorted(deferred), budget=budget, cache_bytes=used,
+                   bytes=sum(remote[p]["size"] for p in copy),
+                   noop=not copy and not plan["delete"] and not evict)
+        self.last_selection = {k: out[k] for k in ("budget", "cache_bytes", "evict", "deferred")}
+        return out
+
+    def evict(self, paths: Sequence[str]) -> List[str]:
+        """Remove evicted files (see sync_plan.remove_local); returns failures."""
+        failed = remove_local(self.video_dir, paths)
+        CACHE_EVICTIONS.inc(len(paths) - len(failed))
+        with self._lock:
+            for p in paths:
+                self._played.pop(p, None)
+            self._dirty = True
+        return failed
+
+    # ----- fetch ahead -----
+    def start(self, pinned: Callable[[Sequence[str]], List[str]], current: Callable[[], Optional[str]],
+              tick: Callable[[], None]) -> None:
+        """`pinned(paths)`: items to keep first, in priority order; `tick()` runs every minute."""
+        self._pinned, self._current = pinned, current
+        if self._thread is not None:
+            return
+
+        def _loop():
+            while True:
+                time.sleep(TICK_INTERVAL)
+                self.flush()
+                if not self.enabled():
+                    continue
+                try:
+                    tick()
+                except Exception as e:
+                    _svc_logger.warning("cache tick failed: %s", e)
+
+        self._thread = threading.Thread(target=_loop, name="cache-prefetch", daemon=True)
+        self._thread.start()
+
+    def claim_prefetch(self, key: str) -> bool:
+        """True the first time `key` (one upcoming schedule slot) is claimed."""
+        with self._lock:
+            if self._prefetched == key:
+                return False
+            self._prefetched = key
+            return True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled(),
+            "budget_mb": self._mb("cache_budget_mb", 0),
+            "reserve_mb": self._mb("cache_reserve_mb", DEFAULT_RESERVE_MB),
+            "fetch_ahead": self.fetch_ahead(),
+            "tracked": len(self._played),
+            "prefetched": self._prefetched,
+            "last_selection": self.last_selection,
+        }
@@ -0,0 +1,108 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    from flask import current_app
+    _svc_logger = current_app.logger
+except Exception:
+    _svc_logger = logging.getLogger('rpi_avp')
+
+
+ACTIONS = ("play", "pause", "next", "prev", "volup", "voldown", "play-video")
+MAX_BATCH = 100            # commandes par requete
+WINDOW_SIZE = 512          # IDs retenus (les plus recents)
+WINDOW_SECONDS = 600.0     # un ID rejoue au-dela est traite comme neuf
+
+
+def reduce_commands(commands: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Net effect of a command sequence, applied once by the caller.
+
+    - media: the last "play-video" (video) followed by the net number of
+      next/prev from there (skip; from the current item if no video), so
+      five "next" are one playlist move and one load;
+    - transport: play/pause issued after the last media change (earlier
+      ones are superseded by the reload, which plays); next/prev that
+      cancel out (+1 -1) are no move, the current item keeps playing;
+    - volume: the volup/voldown steps, in order (clamping is per step).
+
+    Raises ValueError on an unknown action or a play-video without video.
+    """
+    video: Optional[str] = None
+    skip = 0
+    transport: List[str] = []
+    since = 0  # transport[since:] : emis apres le dernier changement de media effectif
+    volume: List[int] = []
+    for cmd in commands:
+        action = str(cmd.get("action") or "").lower()
+        if action not in ACTIONS:
+            raise ValueError(f"unknown action {action!r}")
+        if action == "play-video":
+            if not cmd.get("video"):
+                raise ValueError("play-video without video")
+            video, skip, since = str(cmd["video"]), 0, len(transport)
+        elif action in ("next", "prev"):
+            skip += 1 if action == "next" else -1
+            if video is not None or skip != 0:
+                since = len(transport)
+        elif action in ("play", "pause"):
+            transport.append(action)
+        else:
+            volume.append(1 if action == "volup" else -1)
+    media = video is not None or skip != 0
+    return {"media": media, "video": video, "skip": skip,
+            "transport": transport[since:] if media else transport, "volume": volume}
+
+
+class CommandLog:
+    """
+    Idempotency window for client command IDs (POST /api/control).
+
+    A remote retrying a request it thinks was lost (timeout, Wi-Fi roam)
+    resends the same IDs; commands already applied within the window are
+    reported as duplicates and not replayed. IDs are only recorded once
+    their batch has been applied, so a failed batch can be retried as is.
+    Batches are applied one at a time (`lock`), so two remotes do not
+    interleave their playlist moves.
+
+    Settings used: none (window: WINDOW_SIZE IDs, WINDOW_SECONDS).
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self._seen: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._batches = 0
+        self._commands = 0
+        self._duplicates = 0
+        self._loads_saved = 0
+
+    def seen(self, cmd_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Record of an already applied command ID (None if new or expired)."""
+        if not cmd_id:
+            return None
+        entry = self._seen.get(cmd_id)
+        if entry is None or time.time() - entry["at"] > WINDOW_SECONDS:
+            return None
+        return entry
+
+    def record(self, ids: Sequence[str], batch: int) -> None:
+        now = time.time()
+        for cmd_id in ids:
+            self._seen[cmd_id] = {"at": now, "batch": batch}
+            self._seen.move_to_end(cmd_id)
+        while len(self._seen) > WINDOW_SIZE:
+            self._seen.popitem(last=False)
+
+    def next_batch(self, commands: int, duplicates: int, loads_saved: int) -> int:
+        self._batches += 1
+        self._commands += commands
+        self._duplicates += duplicates
+        self._loads_saved += max(0, loads_saved)
+        return self._batches
+
+    def status(self) -> Dict[str, Any]:
+        return {"batches": self._batches, "commands": self._commands, "duplicates": self._duplicates,
+                "loads_saved": self._loads_saved, "window": len(self._seen)}
@@ -0,0 +1,321 @@
+import http.client
+import json
+import socket
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote, urlsplit
+
+try:
+    from flask import current_app
+    _svc_logger = current_app.logger
+except Exception:
+    _svc_logger = logging.getLogger('rpi_avp')
+
+
+DEFAULT_INTERVAL = 3.0     # s entre deux tours de polling
+DEFAULT_CONCURRENCY = 8    # requetes simultanees vers les pairs
+DEFAULT_TIMEOUT = 2.0
+WATCH_TTL = 30.0           # on ne poll que si le tableau de bord a ete consulte recemment
+BEACON_PORT = 5099
+BEACON_QUERY = b"RPI-AVP?"
+BEACON_PREFIX = b"RPI-AVP "
+
+
+class PeerError(RuntimeError):
+    pass
+
+
+class Peer:
+    """One remote player: a single keep-alive HTTP connection, reused by every call."""
+
+    def __init__(self, name: str, url: str) -> None:
+        parts = urlsplit(url if "://" in url else "http://" + url)
+        if parts.scheme != "http" or not parts.hostname:
+            raise ValueError(f"URL de pair invalide: {url!r}")
+        self.name = name or parts.netloc
+        self.url = f"http://{parts.netloc}"
+        self.host, self.port = parts.hostname, parts.port or 80
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._lock = threading.Lock()
+        self.status: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.latency_ms: Optional[float] = None
+        self.last_ok: Optional[float] = None
+
+    def request(self, method: str, path: str, body: Optional[dict] = None,
+                timeout: float = DEFAULT_TIMEOUT) -> Tuple[int, Any]:
+        """(status, decoded JSON); one retry if the kept-alive connection was closed. Raises PeerError."""
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        with self._lock:
+            for attempt in (1, 2):
+                if self._conn is None:
+                    self._conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+                self._conn.timeout = timeout
+                try:
+                    self._conn.request(method, path, body=payload, headers=headers)
+                    resp = self._conn.getresponse()
+                    raw = resp.read()
+                    break
+                except (OSError, http.client.HTTPException) as e:
+                    self._conn.close()
+                    self._conn = None
+                    if attempt == 2 or isinstance(e, socket.timeout):
+                        raise PeerError(f"{type(e).__name__}: {e}")
+        try:
+            return resp.status, json.loads(raw.decode() or "null")
+        except ValueError:
+            return resp.status, raw.decode(errors="replace")[:200]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def view(self) -> Dict[str, Any]:
+        return {"name": self.name, "url": self.url, "ok": self.error is None and self.status is not None,
+                "status": self.status, "error": self.error, "latency_ms": self.latency_ms,
+                "last_ok": self.last_ok}
+
+
+# Commandes groupees : action -> (methode, chemin, corps)
+def _command(action: str, params: Dict[str, Any]) -> Tuple[str, str, Optional[dict]]:
+    if action in ("play", "pause", "next", "prev", "volup", "voldown"):
+        return "POST", f"/control/{action}", None
+    if action == "play-video":
+        if not params.get("video"):
+            raise ValueError("video manquante")
+        return "POST", "/play-video", {"video": params["video"]}
+    if action == "playlist":
+        if not params.get("playlist"):
+            raise ValueError("playlist manquante")
+        body = {"restart": bool(params.get("restart", True)), "play_now": bool(params.get("play_now", False))}
+        return "POST", f"/api/playlists/{quote(str(params['playlist']), safe='')}/activate", body
+    raise ValueError(f"action inconnue: {action}")
+
+
+class FleetService:
+    """
+    Aggregator for many players: one dashboard and one control API.
+
+    Peers come from the `fleet_peers` setting and, optionally, from a UDP
+    broadcast discovery (an instance answers on BEACON_PORT only with
+    `fleet_beacon` on). Each peer keeps one keep-alive HTTP connection;
+    polls and commands fan out on a shared pool bounded to
+    `fleet_concurrency` requests. Polling only runs while someone reads
+    the aggregated status (WATCH_TTL), so an idle controller sends nothing.
+
+    Settings used:
+      - fleet_peers: ["http://10.0.0.12:5000", {"name": "hall", "url": "..."}]
+      - fleet_poll_interval: float seconds (default 3)
+      - fleet_concurrency: int (default 8)
+      - fleet_beacon: bool, answer discovery probes (default False)
+      - fleet_name: name announced to discovery (default: hostname)
+    """
+
+    def __init__(self, settings_service) -> None:
+        self._settings = settings_service
+        self._lock = threading.Lock()
+        self._peers: Dict[str, Peer] = {}  # url -> Peer
+        self.port = 5000  # port HTTP annonce par la balise de decouverte
+        self._discovered: Dict[str, str] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_size = 0
+        self._wake = threading.Event()
+        self._watched_until = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._beacon: Optional[threading.Thread] = None
+        self.polled_at: Optional[float] = None
+        self.poll_seconds: Optional[float] = None
+
+    # ----- configuration -----
+    def _num(self, key: str, default: float) -> float:
+        try:
+            return float(self._settings.get(key, default))
+        except (TypeError, ValueError):
+            return default
+
+    def interval(self) -> float:
+        return max(0.5, self._num("fleet_poll_interval", DEFAULT_INTERVAL))
+
+    def concurrency(self) -> int:
+        return max(1, int(self._num("fleet_concurrency", DEFAULT_CONCURRENCY)))
+
+    def _configured(self) -> Dict[str, str]:
+        out: Dict[str, str] = {}
+        for entry in self._settings.get("fleet_peers") or []:
+            if isinstance(entry, dict):
+                url, name = entry.get("url") or "", entry.get("name") or ""
+            else:
+                url, name = str(entry), ""
+            if url:
+                out[url] = name
+        for url, name in self._discovered.items():
+            out.setdefault(url, name)
+        return out
+
+    def peers(self) -> List[Peer]:
+        """Current peers (configured + discovered); connections kept for unchanged URLs."""
+        wanted = self._configured()
+        with self._lock:
+            current = dict(self._peers)
+            peers: Dict[str, Peer] = {}
+            for url, name in wanted.items():
+                try:
+                    probe = Peer(name, url)
+                except ValueError as e:
+                    _svc_logger.warning("fleet: %s", e)
+                    continue
+                peer = current.pop(probe.url, None) or probe
+                peer.name = probe.name
+                peers[peer.url] = peer
+            for stale in current.values():
+                stale.close()
+            self._peers = peers
+            return list(peers.values())
+
+    def _executor(self) -> ThreadPoolExecutor:
+        size = self.concurrency()
+        with self._lock:
+            if self._pool is None or self._pool_size != size:
+                old, self._pool = self._pool, ThreadPoolExecutor(max_workers=size, thread_name_prefix="fleet")
+                self._pool_size = size
+                if old is not None:
+                    old.shutdown(wait=False)
+            return self._pool
+
+    def _fan_out(self, peers: Sequence[Peer], fn: Callable[[Peer], Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return list(self._executor().map(fn, peers))
+
+    # ----- polling -----
+    def _poll_one(self, peer: Peer) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        try:
+            code, data = peer.request("GET", "/status")
+            if code != 200 or not isinstance(data, dict):
+                raise PeerError(f"HTTP {code}")
+            peer.status, peer.error, peer.last_ok = data, None, time.time()
+        except PeerError as e:
+            peer.error = str(e)
+        peer.latency_ms = round((time.perf_counter() - t0) * 1000, 1)
+        return peer.view()
+
+    def poll(self) -> List[Dict[str, Any]]:
+        t0 = time.perf_counter()
+        out = self._fan_out(self.peers(), self._poll_one)
+        self.poll_seconds = round(time.perf_counter() - t0, 3)
+        self.polled_at = time.time()
+        return out
+
+    def start(self, port: int = 5000) -> None:
+        """Start the poller (idle until status() is read) and the discovery responder."""
+        self.port = port
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="fleet-poller", daemon=True)
+            self._thread.start()
+        if self._beacon is None and self._settings.get("fleet_beacon", False):
+            self._beacon = threading.Thread(target=self._answer_probes, name="fleet-beacon", daemon=True)
+            self._beacon.start()
+
+    def _run(self) -> None:
+        while True:
+            if time.monotonic() >= self._watched_until:
+                self._wake.wait()
+                self._wake.clear()
+                time.sleep(self.interval())  # status() vient de faire un tour synchrone
+                continue
+            started = time.monotonic()
+            try:
+                self.poll()
+            except Exception as e:
+                _svc_logger.warning("fleet poll failed: %s", e)
+            time.sleep(max(0.0, self.interval() - (time.monotonic() - started)))
+
+    def status(self) -> Dict[str, Any]:
+        """Aggregated status (last poll); reading it keeps the poller running for WATCH_TTL."""
+        idle = time.monotonic() >= self._watched_until
+        self._watched_until = time.monotonic() + WATCH_TTL
+        if idle:
+            # premier affichage : tour synchrone (borne par le timeout), puis le thread prend le relais
+            self.poll()
+            self._wake.set()
+        with self._lock:
+            peers = [p.view() for p in self._peers.values()]
+        return {"peers": peers, "online": sum(1 for p in peers if p["ok"]), "total": len(peers),
+                "polled_at": self.polled_at, "poll_seconds": self.poll_seconds,
+                "interval": self.interval(), "concurrency": self.concurrency()}
+
+    # ----- commandes groupees -----
+    def command(self, action: str, params: Optional[Dict[str, Any]] = None,
+                names: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """Send one action to all peers (or `names`) concurrently. Raises ValueError."""
+        params = params or {}
+        method, path, body = _command(action, params)
+        peers = self.peers()
+        if names:
+            unknown = set(names) - {p.name for p in peers}
+            if unknown:
+                raise ValueError(f"pairs inconnus: {', '.join(sorted(unknown))}")
+            peers = [p for p in peers if p.name in names]
+
+        def _send(peer: Peer) -> Dict[str, Any]:
+            t0 = time.perf_counter()
+            try:
+                code, data = peer.request(method, path, body)
+                res = {"ok": 200 <= code < 300, "code": code, "response": data}
+            except PeerError as e:
+                res = {"ok": False, "code": None, "error": str(e)}
+            res.update(name=peer.name, latency_ms=round((time.perf_counter() - t0) * 1000, 1))
+            return res
+
+        results = self._fan_out(peers, _send)
+        return {"action": action, "ok": all(r["ok"] for r in results), "results": results}
+
+    # ----- decouverte -----
+    def _answer_probes(self) -> None:
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(("", BEACON_PORT))
+        except OSError as e:
+            _svc_logger.info("fleet beacon disabled: %s", e)
+            return
+        while True:
+            try:
+                data, addr = sock.recvfrom(64)
+                if data.strip() == BEACON_QUERY:
+                    name = self._settings.get("fleet_name") or socket.gethostname()
+                    port = self.port
+                    sock.sendto(BEACON_PREFIX + json.dumps({"name": name, "port": port}).encode(), addr)
+            except OSError:
+                time.sleep(1.0)
+
+    def discover(self, timeout: float = 1.5) -> List[Dict[str, Any]]:
+        """Broadcast a probe on the LAN; answering players are added as peers (until restart)."""
+        found: List[Dict[str, Any]] = []
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            sock.settimeout(0.2)
+            sock.sendto(BEACON_QUERY, ("<broadcast>", BEACON_PORT))
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                try:
+                    data, addr = sock.recvfrom(512)
+                except socket.timeout:
+                    continue
+                if not data.startswith(BEACON_PREFIX):
+                    continue
+                try:
+                    info = json.loads(data[len(BEACON_PREFIX):].decode())
+                    url = f"http://{addr[0]}:{int(info.get('port') or 5000)}"
+                except (ValueError, TypeError):
+                    continue
+                found.append({"name": info.get("name") or url, "url": url})
+        with self._lock:
+            for f in found:
+                self._discovered[f["url"]] = f["name"]
+        return found
@@ -0,0 +1,338 @@
+import hashlib
+import json
+import os
+import shutil
+import struct
+import threading
+import time
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from ..metrics import INTEGRITY_FILES
+
+try:
+    from flask import current_app
+    _svc_logger = current_app.logger
+except Exception:
+    _svc_logger = logging.getLogger('rpi_avp')
+
+
+DEFAULT_RATE_MB = 8.0        # Mo/s lus pour le hachage (la lecture video passe avant)
+CHUNK = 1 << 20
+MTIME_TOLERANCE = 1.0        # s, cf. sync_plan
+ISO_BMFF = (".mp4", ".m4v", ".mov")
+HASHES = ("md5", "sha1", "sha256")  # types rclone calculables avec hashlib
+
+
+def check_iso_bmff(path: str, size: int) -> Optional[str]:
+    """
+    Walk the top-level boxes of an MP4/MOV file (a few seeks, no full read).
+    Returns a problem description, or None if the boxes cover the file
+    exactly and a 'moov' box is present.
+    """
+    pos, seen = 0, set()
+    try:
+        with open(path, "rb") as f:
+            while pos < size:
+                f.seek(pos)
+                head = f.read(8)
+                if len(head) < 8:
+                    return f"truncated box header at {pos}"
+                box_size, kind = struct.unpack(">I4s", head)
+                if box_size == 1:
+                    ext = f.read(8)
+                    if len(ext) < 8:
+                        return f"truncated box header at {pos}"
+                    box_size = struct.unpack(">Q", ext)[0]
+                elif box_size == 0:
+                    box_size = size - pos  # jusqu'a la fin du fichier
+                if box_size < 8:
+                    return f"invalid box size {box_size} at {pos}"
+                if pos + box_size > size:
+                    return f"truncated: box {kind.decode('latin-1')!r} ends at {pos + box_size} > {size}"
+                seen.add(kind)
+                pos += box_size
+    except OSError as e:
+        return f"read error: {e}"
+    if b"moov" not in seen:
+        return "no 'moov' box"
+    return None
+
+
+class IntegrityVerifier:
+    """
+    Background verification of the media files in VIDEO_DIR.
+
+    Each library rescan hands the file list to a single background thread,
+    which stats the files (off the request path), checks the new or
+    changed ones (by size + mtime) and records the result, so an unchanged
+    file is never checked twice (results persisted to a JSON file).
+    Checks, cheapest first:
+      - MP4/MOV: top-level box walk (truncation, missing 'moov');
+      - size and content hash against the remote manifest of the last
+        sync (rclone lsjson --hash), when the local mtime matches the
+        remote one (i.e. the file is the synced version). Hashing reads
+        the file at `integrity_rate_mb` MB/s and drops it from the page
+        cache afterwards.
+    A corrupt file is moved to the quarantine directory, so it leaves the
+    playlist; if the move fails it stays excluded from the library until
+    it changes. A size/hash mismatch is a bad transfer: the next delta sync
+    downloads the file again. An empty or structurally broken file is the
+    remote version itself: its version (size, mtime, hash) is recorded
+    (`rejected()`) and the delta sync skips it until the remote changes.
+
+    Settings used:
+      - integrity_verify: bool (default True)
+      - integrity_rate_mb: float MB/s for hashing (default 8)
+    """
+
+    def __init__(self, settings_service, video_dir: str, file_path: str, quarantine_dir: str) -> None:
+        self._settings = settings_service
+        self.video_dir = video_dir
+        self.file_path = file_path
+        self.quarantine_dir = quarantine_dir
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._queue: Deque[str] = deque()
+        self._library: Optional[List[str]] = None
+        self._results: Dict[str, Dict[str, Any]] = self._load(file_path)
+        # versions distantes illisibles telles quelles : a ne pas retelecharger
+        self._rejected_path = os.path.splitext(file_path)[0] + "_rejected.json"
+        self._rejected: Dict[str, Dict[str, Any]] = self._load(self._rejected_path)
+        self._quarantined: List[Dict[str, Any]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._expected: Callable[[], Optional[Dict[str, Dict[str, Any]]]] = lambda: None
+        self._on_change: Callable[[str], None] = lambda rel: None
+        self.current: Optional[str] = None
+        self.hashed_bytes = 0
+
+    def enabled(self) -> bool:
+        return bool(self._settings.get("integrity_verify", True))
+
+    def rate(self) -> float:
+        try:
+            return max(0.5, float(self._settings.get("integrity_rate_mb", DEFAULT_RATE_MB))) * (1 << 20)
+        except (TypeError, ValueError):
+            return DEFAULT_RATE_MB * (1 << 20)
+
+    # ----- persistence -----
+    @staticmethod
+    def _load(path: str) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return dict(json.load(f) or {})
+        except (OSError, ValueError, TypeError):
+            return {}
+
+    def _save(self, rejected: bool = False) -> None:
+        path = self._rejected_path if rejected else self.file_path
+        with self._lock:
+            data = dict(self._rejected if rejected else self._results)
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            _svc_logger.warning("integrity results save failed: %s", e)
+
+    def rejected(self) -> Dict[str, Dict[str, Any]]:
+        """Quarantined remote versions not to download again: {path: {size, mtime, hash}}."""
+        with self._lock:
+            return {rel: dict(v) for rel, v in self._rejected.items()}
+
+    # ----- queue -----
+    def _stat(self, rel: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(os.path.join(self.video_dir, rel))
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def submit(self, library: Sequence[str]) -> List[str]:
+        """
+        Hand `library` to the verifier (no I/O here) and return it without
+        the files known to be corrupt (if their quarantine failed).
+        """
+        if not self.enabled():
+            return list(library)
+        with self._lock:
+            self._library = list(library)
+            corrupt = {rel for rel, res in self._results.items() if res["state"] == "corrupt"}
+        self._wake.set()
+        return [rel for rel in library if rel not in corrupt] if corrupt else list(library)
+
+    def _collect(self, library: List[str]) -> None:
+        """Queue the new/changed files of `library` and forget the ones gone."""
+        present = set(library)
+        with self._lock:
+            for rel in [r for r in self._results if r not in present]:
+                del self._results[rel]  # supprime du disque (sync, eviction)
+            known = {rel: (res["size"], res["mtime_ns"]) for rel, res in self._results.items()}
+        changed = [rel for rel in library if known.get(rel) != self._stat(rel)]
+        with self._lock:
+            self._queue = deque(changed)
+
+    # ----- worker -----
+    def start(self, expected: Callable[[], Optional[Dict[str, Dict[str, Any]]]],
+              on_change: Callable[[str], None]) -> None:
+        """
+        `expected()`: remote manifest of the last sync; `on_change(rel)`
+        when a file leaves or re-enters the library (rescan needed).
+        """
+        self._expected, self._on_change = expected, on_change
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="integrity", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            with self._lock:
+                library, self._library = self._library, None
+            if library is None:
+                continue
+            self._collect(library)
+            try:
+                expected = self._expected() or {}
+            except Exception as e:
+                _svc_logger.warning("integrity: remote manifest unavailable: %s", e)
+                expected = {}
+            checked = 0
+            while True:
+                with self._lock:
+                    if not self._queue:
+                        break
+                    rel = self._queue.popleft()
+                try:
+                    self.verify(rel, expected.get(rel))
+                except Exception as e:
+                    _svc_logger.warning("integrity %s: %s", rel, e)
+                checked += 1
+                if checked % 20 == 0:
+                    self._save()
+            if checked:
+                self._save()
+
+    def verify(self, rel: str, remote: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Check one file, record (and act on) the result."""
+        path = os.path.join(self.video_dir, rel)
+        st = self._stat(rel)
+        if st is None:
+            return {"state": "missing"}
+        size, mtime_ns = st
+        self.current = rel
+        try:
+            problem, digest, as_uploaded = self._check(path, size, mtime_ns, remote)
+        finally:
+            self.current = None
+        res = {"size": size, "mtime_ns": mtime_ns, "state": "corrupt" if problem else "ok",
+               "reason": problem, "hash": digest, "checked_at": time.time()}
+        if self._stat(rel) != st:
+            return res  # modifie pendant la verification (sync) : sera revu au prochain scan
+        with self._lock:
+            was = self._results.get(rel, {}).get("state")
+            self._results[rel] = res
+            cleared = not problem and self._rejected.pop(rel, None) is not None
+        INTEGRITY_FILES.inc(result=res["state"])
+        if problem:
+            _svc_logger.warning("integrity: %s corrupt (%s)", rel, problem)
+            version = None
+            if as_uploaded:
+                version = {"size": size, "mtime": mtime_ns / 1e9, "hash": (remote or {}).get("hash")}
+            self._quarantine(rel, problem, version)
+        else:
+            if cleared:
+                self._save(rejected=True)  # nouvelle version distante, lisible
+            if was == "corrupt":
+                self._changed(rel)  # remplace depuis : de retour dans la bibliotheque
+        return res
+
+    def _changed(self, rel: str) -> None:
+        try:
+            self._on_change(rel)
+        except Exception as e:
+            _svc_logger.warning("integrity rescan callback failed: %s", e)
+
+    def _check(self, path: str, size: int, mtime_ns: int,
+               remote: Optional[Dict[str, Any]]) -> Tuple[Optional[str], Optional[str], bool]:
+        """(problem, digest, as_uploaded): as_uploaded = the remote file itself is broken."""
+        synced = remote is not None and remote.get("mtime") is not None \
+            and abs(remote["mtime"] - mtime_ns / 1e9) <= MTIME_TOLERANCE
+        if synced and remote["size"] != size:
+            return f"size {size} != remote {remote['size']}", None, False
+        if size == 0:
+            return "empty file", None, True
+        if path.lower().endswith(ISO_BMFF):
+            problem = check_iso_bmff(path, size)
+            if problem:
+                return problem, None, True
+        if synced and remote.get("hash"):
+            kind, _, want = remote["hash"].partition(":")
+            if kind in HASHES:
+                got = self._hash(path, kind)
+                if got.lower() != want.lower():
+                    return f"{kind} mismatch", f"{kind}:{got}", False
+                return None, f"{kind}:{got}", False
+        return None, None, False
+
+    def _hash(self, path: str, kind: str) -> str:
+        """Throttled hash of `path`; the pages read are dropped from the page cache."""
+        h = hashlib.new(kind)
+        rate = self.rate()
+        with open(path, "rb") as f:
+            fd, offset = f.fileno(), 0
+            started = time.monotonic()
+            while True:
+                chunk = f.read(CHUNK)
+                if not chunk:
+                    break
+                h.update(chunk)
+                offset += len(chunk)
+                self.hashed_bytes += len(chunk)
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(fd, offset - len(chunk), len(chunk), os.POSIX_FADV_DONTNEED)
+                ahead = offset / rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+        return h.hexdigest()
+
+    def _quarantine(self, rel: str, reason: str, version: Optional[Dict[str, Any]] = None) -> None:
+        dest = os.path.join(self.quarantine_dir, *rel.split("/"))
+        try:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.move(os.path.join(self.video_dir, rel), dest)
+        except OSError as e:
+            # reste en place mais hors playlist (submit() l'ecarte)
+            _svc_logger.warning("integrity: quarantine of %s failed: %s", rel, e)
+        else:
+            with self._lock:
+                self._results.pop(rel, None)
+                self._quarantined.append({"media": rel, "reason": reason, "at": time.time()})
+                del self._quarantined[:-50]
+                if version is not None:
+                    self._rejected[rel] = dict(version, reason=reason, at=time.time())
+            if version is not None:
+                self._save(rejected=True)
+        self._changed(rel)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            states: Dict[str, int] = {}
+            for res in self._results.values():
+                states[res["state"]] = states.get(res["state"], 0) + 1
+            corrupt = {rel: res["reason"] for rel, res in self._results.items() if res["state"] == "corrupt"}
+            return {
+                "enabled": self.enabled(),
+                "queued": len(self._queue),
+                "checking": self.current,
+                "results": states,
+                "corrupt": corrupt,
+                "quarantined": list(self._quarantined),
+                "rejected": sorted(self._rejected),
+                "quarantine_dir": self.quarantine_dir,
+                "hashed_bytes": self.hashed_bytes,
+            }
@@ -0,0 +1,155 @@
+import itertools
+import subprocess
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    from flask import current_app
+    _svc_logger = current_app.logger
+except Exception:
+    _svc_logger = logging.getLogger('rpi_avp')
+
+
+MAX_LINES = 2000   # sortie conservee par job
+KEEP_JOBS = 20
+
+
+def run_streamed(cmd: List[str], timeout: float, env: Optional[dict] = None,
+                 on_line: Optional[Callable[[str], Any]] = None) -> Tuple[int, str]:
+    """
+    Run `cmd` (stderr merged), passing each output line to `on_line` as it
+    arrives; (returncode, output). Killed after `timeout` s: returncode 124.
+    """
+    out: List[str] = []
+
+    def _emit(line: str) -> None:
+        out.append(line)
+        if on_line is not None:
+            on_line(line)
+
+    try:
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env)
+    except OSError as e:
+        _emit(f"Error: {type(e).__name__}: {e}\n")
+        return 1, "".join(out)
+    timed_out = threading.Event()
+
+    def _kill():
+        timed_out.set()
+        p.kill()
+
+    killer = threading.Timer(timeout, _kill)
+    killer.daemon = True
+    killer.start()
+    try:
+        for line in p.stdout:
+            _emit(line)
+        rc = p.wait()
+    finally:
+        killer.cancel()
+    if timed_out.is_set():
+        _emit(f"Timeout: {' '.join(cmd[:3])}\n")
+        rc = 124
+    return rc, "".join(out)
+
+
+class Job:
+    """One background operation: state, streamed output lines and final result."""
+
+    def __init__(self, job_id: str, kind: str) -> None:
+        self.id = job_id
+        self.kind = kind
+        self.state = "queued"  # queued | running | done | error
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Dict[str, Any] = {}
+        self._lines: List[str] = []
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def log(self, text: str) -> None:
+        with self._lock:
+            self._lines.extend(text.splitlines() or [""])
+            extra = len(self._lines) - MAX_LINES
+            if extra > 0:
+                del self._lines[:extra]
+                self._dropped += extra
+
+    def run(self, cmd: List[str], timeout: float, env: Optional[dict] = None) -> Tuple[int, str]:
+        """Run `cmd`, streaming its output into the job; (returncode, output). 124 on timeout."""
+        return run_streamed(cmd, timeout, env=env, on_line=lambda line: self.log(line.rstrip("\n")))
+
+    def view(self, since: int = 0) -> Dict[str, Any]:
+        """Public state; `since` = line cursor returned as `next` by the previous poll."""
+        with self._lock:
+            start = max(0, since - self._dropped)
+            lines = self._lines[start:]
+            nxt = self._dropped + len(self._lines)
+        return {
+            "id": self.id, "kind": self.kind, "state": self.state,
+            "ok": self.result.get("ok") if self.state in ("done", "error") else None,
+            "result": self.result if self.state in ("done", "error") else None,
+            "created": self.created, "started": self.started, "finished": self.finished,
+            "output": lines, "next": nxt,
+        }
+
+
+class JobRunner:
+    """
+    Background jobs for slow CLI operations, so request threads never wait
+    on a subprocess: submit() returns at once, callers poll view(since).
+
+    `fn(job, *args)` runs in its own thread and returns a result dict with
+    an `ok` key; an exception ends the job in 'error'. With `exclusive`,
+    a second job of the same kind is refused while one is running.
+    """
+
+    def __init__(self, prefix: str = "job") -> None:
+        self.prefix = prefix
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def submit(self, kind: str, fn: Callable[..., Dict[str, Any]], *args: Any,
+               exclusive: bool = True) -> Optional[Job]:
+        with self._lock:
+            if exclusive and self.active(kind) is not None:
+                return None
+            job = Job(f"{kind}-{next(self._ids)}", kind)
+            self._jobs[job.id] = job
+            while len(self._jobs) > KEEP_JOBS:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.state in ("queued", "running"):
+                    break
+                self._jobs.popitem(last=False)
+        threading.Thread(target=self._run, args=(job, fn, args), name=f"{self.prefix}-{kind}", daemon=True).start()
+        return job
+
+    def _run(self, job: Job, fn, args) -> None:
+        job.state, job.started = "running", time.time()
+        try:
+            result = fn(job, *args) or {}
+            job.result = dict(result, ok=bool(result.get("ok", True)))
+            job.state = "done" if job.result["ok"] else "error"
+        except Exception as e:
+            _svc_logger.warning("job %s failed: %s", job.id, e)
+            job.result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            job.state = "error"
+        finally:
+            job.finished = time.time()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def active(self, kind: str) -> Optional[Job]:
+        for job in list(self._jobs.values()):
+            if job.kind == kind and job.state in ("queued", "running"):
+                return job
+        return None
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [{k: v for k, v in j.view().items() if k != "output"} for j in list(self._jobs.values())]
@@ -0,0 +1,218 @@
+import hashlib
+import http.client
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote, urlsplit
+
+from ..metrics import LAN_BYTES, LAN_FILES
+from . import sync_plan
+from .fleet import PeerError
+
+try:
+    from flask import current_app
+    _svc_logger = current_app.logger
+except Exception:
+    _svc_logger = logging.getLogger('rpi_avp')
+
+
+CHUNK = 8 << 20              # octets par requete Range (reprise sur un autre pair au morceau pres)
+BLOCK = 64 << 10
+TIMEOUT = 10.0
+MANIFEST_TTL = 10.0          # s de cache du manifeste local annonce aux pairs
+DEFAULT_CONCURRENCY = 2      # fichiers telecharges en parallele
+TEMP_SUFFIX = ".lanpart"
+FILES_PATH = "/api/lan/files/"
+
+
+class LanShare:
+    """
+    LAN distribution of the synced library between players.
+
+    Each player advertises the files it holds (GET /api/lan/manifest) and
+    serves them with byte ranges (GET /api/lan/files/<path>). During a
+    delta sync (see RcloneService), the files to copy are first fetched
+    from peers that hold the same version (same size and modification
+    time as in our own remote listing), in CHUNK-sized range requests
+    over one keep-alive connection per peer; if a peer fails mid-file the
+    next one resumes at the current offset. A file is only moved into
+    VIDEO_DIR if its hash matches the remote listing (md5 from Drive), so
+    a peer cannot inject content; anything not fetched is left to rclone.
+    Peers are the fleet peers (configured, else discovered on the LAN:
+    players with fleet_beacon on).
+
+    Settings used:
+      - lan_share: bool (default False): serve local files to peers and fetch from them first
+      - lan_concurrency: int files fetched at once (default 2)
+    """
+
+    def __init__(self, settings_service, video_dir: str, fleet) -> None:
+        self._settings = settings_service
+        self.video_dir = video_dir
+        self._fleet = fleet
+        self._lock = threading.Lock()
+        self._manifest: Optional[sync_plan.Manifest] = None
+        self._manifest_at = 0.0
+        self.last_run: Optional[Dict[str, Any]] = None
+        self.served_bytes = 0
+
+    def enabled(self) -> bool:
+        return bool(self._settings.get("lan_share", False))
+
+    def concurrency(self) -> int:
+        try:
+            return max(1, int(self._settings.get("lan_concurrency", DEFAULT_CONCURRENCY)))
+        except (TypeError, ValueError):
+            return DEFAULT_CONCURRENCY
+
+    # ----- cote serveur -----
+    def manifest(self) -> sync_plan.Manifest:
+        """Local files offered to peers ({path: {size, mtime}}), rescanned at most every MANIFEST_TTL."""
+        with self._lock:
+            if self._manifest is not None and time.monotonic() - self._manifest_at < MANIFEST_TTL:
+                return self._manifest
+        files = {rel: e for rel, e in sync_plan.local_manifest(self.video_dir).items()
+                 if not rel.endswith((".partial", TEMP_SUFFIX))}
+        with self._lock:
+            self._manifest, self._manifest_at = files, time.monotonic()
+        return files
+
+    def served(self, nbytes: int) -> None:
+        self.served_bytes += nbytes
+
+    # ----- cote client -----
+    def _peers(self) -> List[Any]:
+        peers = self._fleet.peers()
+        if not peers:
+            try:
+                self._fleet.discover()
+            except OSError as e:
+                _svc_logger.info("lan: discovery failed: %s", e)
+            peers = self._fleet.peers()
+        return peers
+
+    def _manifests(self, pool: ThreadPoolExecutor) -> Dict[str, Dict[str, Any]]:
+        """{peer url: files} for the peers that answer with lan_share on."""
+        def _one(peer) -> Tuple[str, Optional[Dict[str, Any]]]:
+            try:
+                code, data = peer.request("GET", "/api/lan/manifest", timeout=TIMEOUT)
+            except PeerError as e:
+                _svc_logger.info("lan: %s unavailable: %s", peer.name, e)
+                return peer.url, None
+            files = data.get("files") if code == 200 and isinstance(data, dict) else None
+            return peer.url, files if isinstance(files, dict) else None
+
+        return {url: files for url, files in pool.map(_one, self._peers()) if files}
+
+    @staticmethod
+    def _same(entry: Optional[Dict[str, Any]], remote: Dict[str, Any]) -> bool:
+        if not isinstance(entry, dict) or entry.get("size") != remote["size"]:
+            return False
+        if remote.get("mtime") is None or entry.get("mtime") is None:
+            return True
+        return abs(float(entry["mtime"]) - remote["mtime"]) <= sync_plan.MTIME_TOLERANCE
+
+    def fetch(self, paths: Sequence[str], remote: sync_plan.Manifest,
+              log: Optional[Callable[[str], Any]] = None) -> Tuple[List[str], str, int]:
+        """
+        Fetch `paths` (remote manifest entries) from peers into VIDEO_DIR;
+        (paths fetched and verified, log text, bytes received).
+        """
+        started = time.monotonic()
+        # sans hash dans le listing : pas de verification possible, rclone s'en charge
+        wanted = [p for p in paths
+                  if (remote[p].get("hash") or "").partition(":")[0] in hashlib.algorithms_available]
+        if not wanted:
+            return [], "", 0
+        with ThreadPoolExecutor(max_workers=self.concurrency(), thread_name_prefix="lan") as pool:
+            manifests = self._manifests(pool)
+            jobs = []
+            for i, rel in enumerate(wanted):
+                sources = [url for url, files in manifests.items() if self._same(files.get(rel), remote[rel])]
+                if sources:
+                    k = i % len(sources)  # repartit les fichiers entre les pairs
+                    jobs.append((rel, sources[k:] + sources[:k]))
+            if log is not None and jobs:
+                log(f"lan: {len(jobs)}/{len(paths)} file(s) available on {len(manifests)} peer(s)\n")
+            results = list(pool.map(lambda job: self._fetch_one(job[0], job[1], remote[job[0]]), jobs))
+        fetched, out, total = [], "", 0
+        for (rel, _), (ok, nbytes, detail) in zip(jobs, results):
+            total += nbytes
+            LAN_FILES.inc(result="ok" if ok else "failed")
+            if ok:
+                fetched.append(rel)
+            else:
+                out += f"lan: {rel}: {detail}\n"
+        LAN_BYTES.inc(total)
+        out = f"lan: fetched {len(fetched)} file(s) ({total} B) from {len(manifests)} peer(s)\n" + out
+        self.last_run = {"at": time.time(), "seconds": round(time.monotonic() - started, 2),
+                         "wanted": len(paths), "peers": len(manifests), "available": len(jobs),
+                         "fetched": len(fetched), "bytes": total}
+        return fetched, out, total
+
+    def _fetch_one(self, rel: str, sources: List[str], remote: Dict[str, Any]) -> Tuple[bool, int, str]:
+        """Download `rel` (resuming across `sources`), verify, move into place; (ok, bytes, detail)."""
+        kind, _, want = remote["hash"].partition(":")
+        dest = os.path.join(self.video_dir, *rel.split("/"))
+        tmp = os.path.join(os.path.dirname(dest), "." + os.path.basename(dest) + TEMP_SUFFIX)
+        h = hashlib.new(kind)
+        size, offset, errors = remote["size"], 0, []
+        try:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with open(tmp, "wb") as f:
+                for url in sources:
+                    try:
+                        self._download(url, rel, f, h, size)
+                    except (OSError, http.client.HTTPException, ValueError) as e:
+                        errors.append(f"{url}: {type(e).__name__}: {e}")
+                    offset = f.tell()  # octets recus (et haches) : le pair suivant reprend ici
+                    if offset >= size:
+                        break
+            if offset != size:
+                raise ValueError("; ".join(errors) or "incomplete")
+            if h.hexdigest().lower() != want.lower():
+                raise ValueError(f"{kind} mismatch")
+            if remote.get("mtime") is not None:
+                os.utime(tmp, (remote["mtime"], remote["mtime"]))  # meme date que rclone : plan a jour
+            os.replace(tmp, dest)
+        except (OSError, ValueError) as e:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return False, offset, str(e)
+        return True, offset, "ok"
+
+    @staticmethod
+    def _download(url: str, rel: str, f, h, size: int) -> None:
+        """Ranges [f.tell(), size) of `rel` from one peer, CHUNK by CHUNK, appended to `f` and `h`."""
+        offset = f.tell()
+        parts = urlsplit(url)
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=TIMEOUT)
+        path = FILES_PATH + quote(rel)
+        try:
+            while offset < size:
+                end = min(offset + CHUNK, size) - 1
+                conn.request("GET", path, headers={"Range": f"bytes={offset}-{end}"})
+                resp = conn.getresponse()
+                if resp.status != 206 or not (resp.getheader("Content-Range") or "").startswith(f"bytes {offset}-"):
+                    resp.read()
+                    raise ValueError(f"HTTP {resp.status} for range {offset}-{end}")
+                expected = end - offset + 1
+                while expected > 0:
+                    block = resp.read(min(BLOCK, expected))
+                    if not block:
+                        raise ValueError(f"short read at {offset}")
+                    f.write(block)
+                    h.update(block)
+                    offset += len(block)
+                    expected -= len(block)
+        finally:
+            conn.close()
+
+    def status(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled(), "concurrency": self.concurrency(), "last_run": self.last_run,
+                "served_bytes": self.served_bytes, "fetched_bytes": LAN_BYTES.value()}
@@ -1,7 +1,86 @@
+import os
+import threading
 import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ..utils import refresh_videos_list, scan_video_tree
+
 try:
     from flask import current_app
     _svc_logger = current_app.logger
 except Exception:
     _svc_logger = logging.getLogger('rpi_avp')
 
+
+class LibraryService:
+    """
+    Video library listing, flat (historical) or recursive.
+
+    Settings used:
+      - library_recursive: bool (default False). When on, videos are
+        listed by relative path ("campaign/clip.mp4") and every folder is
+        a collection ("" = root). Thumbnails mirror the tree under
+        THUMB_DIR.
+
+    Recursive scans keep a per-directory cache: a folder whose mtime did
+    not change since the previous scan costs one stat() and is not
+    re-listed (see utils.scan_video_tree). Each scan also indexes the
+    cached entries by relative path, so metadata() is a dict lookup.
+    """
+
+    def __init__(self, settings_service, video_dir: str, thumb_dir: str) -> None:
+        self._settings = settings_service
+        self.video_dir = video_dir
+        self.thumb_dir = thumb_dir
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Any] = {}
+        self._meta: Dict[str, Tuple[int, float]] = {}  # rel -> (taille, mtime), reconstruit a chaque scan
+
+    def recursive(self) -> bool:
+        return bool(self._settings.get("library_recursive", False))
+
+    def scan(self) -> List[str]:
+        """Sorted video list (relative paths in recursive mode)."""
+        if not self.recursive():
+            return refresh_videos_list(self.video_dir)
+        exclude = ()
+        if os.path.dirname(os.path.abspath(self.thumb_dir)) == os.path.abspath(self.video_dir):
+            exclude = (os.path.basename(self.thumb_dir),)
+        with self._lock:
+            videos = scan_video_tree(self.video_dir, self._cache, exclude_dirs=exclude)
+            self._meta = {(f"{folder}/{name}" if folder else name): (size, mtime)
+                          for folder, (_, vids, _) in self._cache.items() for name, size, mtime in vids}
+            return videos
+
+    # ----- collections -----
+    @staticmethod
+    def collection_of(rel: str) -> str:
+        return rel.rsplit("/", 1)[0] if "/" in rel else ""
+
+    def collections(self, videos: Sequence[str]) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        for v in videos:
+            c = self.collection_of(v)
+            out[c] = out.get(c, 0) + 1
+        return dict(sorted(out.items(), key=lambda kv: kv[0].lower()))
+
+    def items(self, collection: str, videos: Sequence[str], nested: bool = False) -> List[str]:
+        """Videos of `collection` (with `nested`, its sub-folders too)."""
+        collection = collection.strip("/")
+        if nested and collection:
+            prefix = collection + "/"
+            return [v for v in videos if v.startswith(prefix)]
+        return [v for v in videos if self.collection_of(v) == collection]
+
+    def metadata(self, rel: str) -> Optional[Dict[str, Any]]:
+        """Size/mtime of a video, from the scan cache when available."""
+        folder = self.collection_of(rel)
+        with self._lock:
+            hit = self._meta.get(rel)
+        if hit is not None:
+            return {"path": rel, "collection": folder, "size": hit[0], "mtime": hit[1]}
+        try:
+            st = os.stat(os.path.join(self.video_dir, rel))
+        except OSError:
+            return None
+        return {"path": rel, "collection": folder, "size": st.st_size, "mtime": st.st_mtime}
@@ -0,0 +1,410 @@
+import json
+import socket
+import statistics
+import threading
+import time
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from ..metrics import LOCKSTEP_CORRECTIONS, LOCKSTEP_SKEW
+
+try:
+    from flask import current_app
+    _svc_logger = current_app.logger
+except Exception:
+    _svc_logger = logging.getLogger('rpi_avp')
+
+
+ROLES = ("off", "master", "follower")
+DEFAULT_PORT = 5098
+STATE_INTERVAL = 0.25        # s entre deux diffusions d'etat du maitre
+HELLO_INTERVAL = 1.0         # s entre deux hello du suiveur (inscription + mesure d'horloge)
+CONFIG_INTERVAL = 2.0        # s entre deux relectures des settings
+FOLLOWER_TTL = 5.0           # suiveur oublie sans hello depuis
+MASTER_TIMEOUT = 3.0         # s sans etat du maitre : le suiveur reprend sa propre boucle
+LOAD_GRACE = 3.0             # s laisses a un chargement avant de le retenter
+DEADBAND_MS = 20.0           # ecart tolere sans correction
+DEFAULT_SEEK_MS = 1000.0     # au-dela : seek ; en dessous : ajustement de vitesse
+MAX_RATE_DELTA = 0.05        # vitesse bornee a 1 +/- 5 %
+CORRECTION_WINDOW_MS = 2000.0  # la vitesse resorbe l'ecart en ~2 s
+TRIM_GAIN = 0.05             # apprentissage du rapport d'horloge (terme integral)
+MAX_LEAD_MS = 5000.0
+CLOCK_SAMPLES = 8
+SKEW_WINDOW = 240
+
+
+class LockstepService:
+    """
+    Synchronised playback of the same loop on several players (video walls).
+
+    One instance is the clock master and keeps its own playlist loop; the
+    followers stop advancing on end-of-media and track the master over UDP:
+      - each follower sends a hello every second (registration, measured
+        skew); the master answers with its state and, every 250 ms and on
+        each player state change, sends {media, state, position, master
+        clock} to all registered followers;
+      - the follower estimates the master clock offset from the hello
+        round trips (NTP-style, minimum-RTT sample of the last 8), so it
+        knows where the master is *now*, not when the datagram left;
+      - different media: load the master's item at the expected position
+        plus a lead learned from the previous loads (start latency);
+      - same media: drift below DEADBAND_MS is left alone, up to
+        `lockstep_seek_ms` it is absorbed by a small playback rate change
+        (at most 5%), beyond it the follower seeks (same learned lead).
+        The rate is centred on a trim learned over time (the clock ratio
+        between the two devices), so a steady drift leaves no steady skew.
+    Without news from the master for MASTER_TIMEOUT the follower falls back
+    to its own loop. The measured skew is reported by each follower to
+    the master (status, metric rpi_avp_lockstep_skew_seconds).
+
+    Settings used:
+      - lockstep_role: 'off' | 'master' | 'follower' (default 'off')
+      - lockstep_master: "host[:port]" of the master (followers)
+      - lockstep_port: UDP port of the master (default 5098)
+      - lockstep_seek_ms: drift (ms) above which the follower seeks (default 1000)
+      - fleet_name: name reported to the master (default: hostname)
+    """
+
+    def __init__(self, settings_service, player) -> None:
+        self._settings = settings_service
+        self._player = player
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._sock: Optional[socket.socket] = None
+        self._cfg: Dict[str, Any] = {"role": "off"}
+        self._cfg_at = 0.0
+        self._current: Callable[[], Optional[str]] = lambda: None
+        self._load: Callable[[str, int], bool] = lambda media, start_ms: False
+        # maitre
+        self._followers: Dict[str, Dict[str, Any]] = {}
+        # suiveur
+        self._master: Optional[Tuple[str, int]] = None
+        self._clock: Deque[Tuple[float, float]] = deque(maxlen=CLOCK_SAMPLES)  # (rtt, offset) en s
+        self._heard_at = 0.0
+        self._loading: Optional[Tuple[str, float]] = None
+        self._pending_lead: Optional[str] = None
+        self._leads = {"load": 0.0, "seek": 0.0}  # ms d'avance apprises (latence de demarrage / seek)
+        self._rate: Optional[float] = 1.0
+        self._trim = 1.0
+        self._skews: Deque[float] = deque(maxlen=SKEW_WINDOW)
+        self.skew_ms: Optional[float] = None
+        self.missing: Optional[str] = None
+        self.corrections = {"load": 0, "seek": 0, "rate": 0, "pause": 0}
+
+    # ----- configuration -----
+    def _num(self, key: str, default: float) -> float:
+        try:
+            return float(self._settings.get(key, default))
+        except (TypeError, ValueError):
+            return default
+
+    def config(self, refresh: bool = False) -> Dict[str, Any]:
+        """Settings re-read at most every CONFIG_INTERVAL (the store reads the JSON file)."""
+        if refresh or time.monotonic() - self._cfg_at >= CONFIG_INTERVAL:
+            role = str(self._settings.get("lockstep_role", "off") or "off").strip().lower()
+            master = str(self._settings.get("lockstep_master", "") or "").strip()
+            port = int(self._num("lockstep_port", DEFAULT_PORT))
+            host, _, mport = master.rpartition(":") if ":" in master else (master, "", "")
+            self._cfg = {
+                "role": role if role in ROLES else "off",
+                "port": port,
+                "master": (host, int(mport) if mport.isdigit() else port) if host else None,
+                "seek_ms": max(DEADBAND_MS * 2, self._num("lockstep_seek_ms", DEFAULT_SEEK_MS)),
+                "name": self._settings.get("fleet_name") or socket.gethostname(),
+            }
+            self._cfg_at = time.monotonic()
+        return self._cfg
+
+    def role(self) -> str:
+        return self.config()["role"]
+
+    def following(self) -> bool:
+        """True while a master drives this player (its own end-of-media chaining is off)."""
+        return self._cfg["role"] == "follower" and time.monotonic() - self._heard_at < MASTER_TIMEOUT
+
+    # ----- boucle -----
+    def start(self, current: Callable[[], Optional[str]], load: Callable[[str, int], bool]) -> None:
+        """`current()`: item on screen; `load(media, start_ms)`: load and play an item (follower)."""
+        self._current, self._load = current, load
+        if self._thread is None:
+            self._player.on_state_change(self._on_player_state)
+            self._thread = threading.Thread(target=self._run, name="lockstep", daemon=True)
+            self._thread.start()
+
+    def _open(self, port: int) -> Optional[socket.socket]:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.bind(("", port))  # pas de SO_REUSEADDR : deux maitres sur un port = erreur visible
+        except OSError as e:
+            sock.close()
+            _svc_logger.warning("lockstep: UDP port %s unavailable: %s", port, e)
+            return None
+        return sock
+
+    def _close(self) -> None:
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            sock.close()
+        self._reset_rate()
+
+    def _run(self) -> None:
+        bound: Optional[Tuple[str, int]] = None
+        next_tick = 0.0
+        while True:
+            cfg = self.config()
+            role = cfg["role"]
+            want = (role, cfg["port"] if role == "master" else 0)
+            if role == "off" or (role == "follower" and cfg["master"] is None):
+                self._close()
+                bound = None
+                time.sleep(CONFIG_INTERVAL)
+                continue
+            if self._sock is None or bound != want:
+                self._close()
+                self._sock = self._open(want[1])
+                if self._sock is None:
+                    time.sleep(CONFIG_INTERVAL)
+                    continue
+                bound, next_tick = want, 0.0
+                _svc_logger.info("lockstep: %s (udp %s)", role, want[1] or cfg["master"])
+            sock = self._sock
+            now = time.monotonic()
+            if now >= next_tick:
+                try:
+                    if role == "master":
+                        self._broadcast()
+                    else:
+                        self._hello(cfg)
+                except OSError as e:
+                    _svc_logger.debug("lockstep send failed: %s", e)
+                except Exception as e:
+                    # etat du lecteur / de la bibliotheque illisible : on retente au tour suivant
+                    _svc_logger.warning("lockstep %s failed: %s", "broadcast" if role == "master" else "hello", e)
+                next_tick = now + (STATE_INTERVAL if role == "master" else HELLO_INTERVAL)
+            try:
+                sock.settimeout(max(0.01, next_tick - time.monotonic()))
+                data, addr = sock.recvfrom(2048)
+                msg = json.loads(data.decode())
+            except socket.timeout:
+                continue
+            except (OSError, ValueError):
+                time.sleep(0.05)
+                continue
+            if not isinstance(msg, dict):
+                continue
+            try:
+                if role == "master" and msg.get("op") == "hello":
+                    self._on_hello(msg, addr)
+                elif role == "follower" and msg.get("op") == "state":
+                    self._on_state(msg, addr)
+            except Exception as e:
+                _svc_logger.warning("lockstep %s failed: %s", msg.get("op"), e)
+
+    # ----- maitre -----
+    def _state(self) -> Dict[str, Any]:
+        player = self._player
+        ready = player.ready
+        state = player.get_state() if ready else "uninitialized"
+        pos = player.get_time() if ready and player.has_media() else 0
+        return {"op": "state", "media": self._current(), "state": state, "pos": pos, "tm": time.monotonic()}
+
+    def _send(self, msg: Dict[str, Any], addr: Tuple[str, int]) -> None:
+        sock = self._sock
+        if sock is not None:
+            sock.sendto(json.dumps(msg).encode(), addr)
+
+    def _broadcast(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, f in self._followers.items() if now - f["last_seen"] > FOLLOWER_TTL]:
+                del self._followers[key]
+            targets = [f["addr"] for f in self._followers.values()]
+        if targets:
+            msg = self._state()
+            for addr in targets:
+                self._send(msg, addr)
+
+    def _on_player_state(self, state: str) -> None:
+        # changement de piste / pause du maitre : diffuse sans attendre le prochain tour
+        if self._cfg["role"] == "master" and state in ("playing", "paused"):
+            try:
+                self._broadcast()
+            except OSError:
+                pass
+            except Exception as e:
+                _svc_logger.warning("lockstep broadcast failed: %s", e)
+
+    def _on_hello(self, msg: Dict[str, Any], addr: Tuple[str, int]) -> None:
+        key = f"{addr[0]}:{addr[1]}"
+        name = str(msg.get("name") or key)
+        skew = msg.get("skew_ms")
+        with self._lock:
+            self._followers[key] = {"name": name, "addr": addr, "skew_ms": skew, "rtt_ms": msg.get("rtt_ms"),
+                                    "media": msg.get("media"), "last_seen": time.monotonic()}
+        if isinstance(skew, (int, float)):
+            LOCKSTEP_SKEW.set(skew / 1000.0, follower=name)
+        reply = self._state()
+        reply["t0"] = msg.get("t0")
+        self._send(reply, addr)
+
+    # ----- suiveur -----
+    def _hello(self, cfg: Dict[str, Any]) -> None:
+        host, port = cfg["master"]
+        try:
+            self._master = (socket.gethostbyname(host), port)
+        except OSError as e:
+            _svc_logger.debug("lockstep: master %s unresolved: %s", host, e)
+            return
+        if not self.following():
+            self._reset_rate()
+        _, rtt = self._offset()
+        self._send({"op": "hello", "name": cfg["name"], "t0": time.monotonic(), "media": self._current(),
+                    "skew_ms": self.skew_ms, "rtt_ms": None if rtt is None else round(rtt * 1000, 2)},
+                   self._master)
+
+    def _offset(self) -> Tuple[Optional[float], Optional[float]]:
+        """(master clock - local clock, rtt) of the fastest recent round trip, in s."""
+        with self._lock:
+            if not self._clock:
+                return None, None
+            rtt, offset = min(self._clock)
+        return offset, rtt
+
+    def _on_state(self, msg: Dict[str, Any], addr: Tuple[str, int]) -> None:
+        if self._master is None or addr != self._master:
+            return
+        now = time.monotonic()
+        t0 = msg.get("t0")
+        if isinstance(t0, (int, float)):
+            # tm ~ milieu de l'aller-retour t0 -> now
+            with self._lock:
+                self._clock.append((now - t0, msg["tm"] - (t0 + now) / 2.0))
+        offset, _ = self._offset()
+        if offset is None:
+            return  # pas encore de mesure d'horloge
+        self._heard_at = now
+        self._follow(msg, now, offset)
+
+    def _correct(self, kind: str) -> None:
+        self.corrections[kind] += 1
+        LOCKSTEP_CORRECTIONS.inc(kind=kind)
+
+    def _set_rate(self, rate: float) -> None:
+        if self._rate is not None and abs(rate - self._rate) < 0.001:
+            return
+        try:
+            self._player.set_rate(rate)
+        except NotImplementedError:
+            return
+        if abs(rate - self._trim) > 0.001:
+            self._correct("rate")  # hors simple trim
+        self._rate = rate
+
+    def _reset_rate(self) -> None:
+        if self._rate != 1.0 and self._player.ready:
+            try:
+                self._player.set_rate(1.0)
+            except Exception:
+                pass
+            self._rate = 1.0
+
+    def _follow(self, msg: Dict[str, Any], now: float, offset: float) -> None:
+        media, state = msg.get("media"), msg.get("state")
+        if not media or state not in ("playing", "paused"):
+            return  # maitre arrete ou en ouverture : on attend
+        player = self._player
+        expected = float(msg["pos"])
+        if state == "playing":
+            expected += (now + offset - msg["tm"]) * 1000.0
+        local = player.get_state()
+        if self._current() != media or (state == "playing" and local in ("idle", "stopped", "ended")
+                                        and expected < player.get_length() - DEFAULT_SEEK_MS):
+            # autre element (ou lecture locale terminee trop tot) : charge a la position du maitre
+            self._start(media, expected, now)
+            return
+        if local in ("opening", "buffering"):
+            return
+        if state == "paused":
+            if local == "playing":
+                player.pause()
+                player.set_time(int(expected))
+                self._correct("pause")
+            return
+        if local == "paused":
+            player.pause()  # bascule : reprise
+            self._correct("pause")
+            return
+        if local != "playing":
+            return
+        drift = player.get_time() - expected
+        self.skew_ms = round(drift, 1)
+        self._skews.append(drift)
+        LOCKSTEP_SKEW.set(drift / 1000.0, follower=self._cfg["name"])
+        if self._pending_lead:
+            # premiere mesure apres un chargement / seek : ajuste l'avance prise la prochaine fois
+            kind, self._pending_lead = self._pending_lead, None
+            self._leads[kind] = max(0.0, min(MAX_LEAD_MS, self._leads[kind] - drift))
+        if abs(drift) >= self._cfg["seek_ms"]:
+            player.set_time(int(expected + self._leads["seek"]))
+            self._set_rate(self._trim)
+            self._pending_lead = "seek"
+            self._correct("seek")
+            return
+        # en avance -> ralentit, en retard -> accelere : proportionnel + trim (integral), borne
+        self._trim = max(1.0 - MAX_RATE_DELTA, min(1.0 + MAX_RATE_DELTA,
+                                                   self._trim - TRIM_GAIN * drift / CORRECTION_WINDOW_MS))
+        rate = self._trim
+        if abs(drift) > DEADBAND_MS:
+            rate -= drift / CORRECTION_WINDOW_MS
+        self._set_rate(max(1.0 - MAX_RATE_DELTA, min(1.0 + MAX_RATE_DELTA, rate)))
+
+    def _start(self, media: str, expected: float, now: float) -> None:
+        if self._loading and self._loading[0] == media and now - self._loading[1] < LOAD_GRACE:
+            return  # chargement en cours
+        self._loading = (media, now)
+        if not self._load(media, int(max(0.0, expected + self._leads["load"]))):
+            if self.missing != media:
+                _svc_logger.warning("lockstep: %s indisponible localement", media)
+            self.missing = media
+            return
+        self.missing = None
+        self._rate = None  # vitesse a reappliquer sur le nouveau media
+        self._pending_lead = "load"
+        self._correct("load")
+
+    # ----- statut -----
+    def status(self) -> Dict[str, Any]:
+        cfg = self.config()
+        player = self._player
+        ready = player.ready
+        position = player.get_time() if ready and player.has_media() else None
+        out: Dict[str, Any] = {
+            "role": cfg["role"], "name": cfg["name"], "media": self._current(),
+            "state": player.get_state() if ready else "uninitialized",
+            # position et horloge monotone relevees ensemble (mesure externe de l'ecart)
+            "position_ms": position, "clock": time.monotonic(),
+        }
+        if cfg["role"] == "master":
+            now = time.monotonic()
+            with self._lock:
+                followers = [{"name": f["name"], "addr": key, "media": f["media"], "skew_ms": f["skew_ms"],
+                              "rtt_ms": f["rtt_ms"], "age_s": round(now - f["last_seen"], 1)}
+                             for key, f in self._followers.items()]
+            worst = [abs(f["skew_ms"]) for f in followers if isinstance(f["skew_ms"], (int, float))]
+            out.update(port=cfg["port"], followers=followers, max_skew_ms=max(worst) if worst else None)
+        elif cfg["role"] == "follower":
+            offset, rtt = self._offset()
+            skews: List[float] = sorted(abs(s) for s in self._skews)
+            out.update(
+                master=f"{cfg['master'][0]}:{cfg['master'][1]}" if cfg["master"] else None,
+                following=self.following(),
+                offset_ms=None if offset is None else round(offset * 1000, 2),
+                rtt_ms=None if rtt is None else round(rtt * 1000, 2),
+                skew_ms=self.skew_ms,
+                skew_p50_ms=round(statistics.median(skews), 1) if skews else None,
+                skew_p95_ms=round(skews[int(0.95 * (len(skews) - 1))], 1) if skews else None,
+                rate=None if self._rate is None else round(self._rate, 4), trim=round(self._trim, 4), leads_ms={k: round(v, 1) for k, v in self._leads.items()},
+                corrections=dict(self.corrections), missing=self.missing,
+            )
+        return out
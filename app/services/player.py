@@ -1,7 +1,574 @@
+import os
+import threading
+import time
 import logging
+from typing import Callable, Dict, List, Optional
+
+from ..metrics import Counter
+
 try:
     from flask import current_app
     _svc_logger = current_app.logger
 except Exception:
     _svc_logger = logging.getLogger('rpi_avp')
 
+
+# Etats normalises exposes par tous les backends (cf. /status)
+STATES = ("idle", "opening", "buffering", "playing", "paused", "stopped", "ended", "error")
+
+PLAYER_INIT_ATTEMPTS = Counter(
+    "rpi_avp_player_init_attempts_total", "Tentatives d'init du lecteur (par backend et resultat).")
+
+
+class PlayerBackend:
+    """
+    Minimal player interface used by the control plane (routes, autoplay,
+    end-of-media chaining). Times are in milliseconds, volume in 0..100.
+    """
+
+    name = "base"
+
+    def __init__(self) -> None:
+        self.last_error: Optional[str] = None
+        self._end_callbacks: List[Callable[[], None]] = []
+        self._state_callbacks: List[Callable[[str], None]] = []
+        self._position_callbacks: List[Callable[[int], None]] = []
+        self._buffering_callbacks: List[Callable[[float], None]] = []
+
+    # ----- lifecycle -----
+    def ensure_ready(self) -> bool:
+        raise NotImplementedError
+
+    @property
+    def ready(self) -> bool:
+        raise NotImplementedError
+
+    def restart(self) -> bool:
+        """Tear down and re-create the player (watchdog recovery). Media must be reloaded."""
+        raise NotImplementedError
+
+    # ----- media -----
+    def load(self, path: str, options: Optional[List[str]] = None) -> bool:
+        """
+        Load `path`; options are libVLC media options (":start-time=12.5" =
+        start offset in s). False if the player is not ready (last_error set).
+        """
+        raise NotImplementedError
+
+    def has_media(self) -> bool:
+        raise NotImplementedError
+
+    def play(self) -> bool:
+        """False if the player is not ready (or nothing is loaded)."""
+        raise NotImplementedError
+
+    def pause(self) -> None:
+        raise NotImplementedError
+
+    def stop(self) -> None:
+        raise NotImplementedError
+
+    def get_state(self) -> str:
+        raise NotImplementedError
+
+    def get_time(self) -> int:
+        raise NotImplementedError
+
+    def set_time(self, ms: int) -> None:
+        raise NotImplementedError
+
+    def set_rate(self, rate: float) -> None:
+        """Playback speed (1.0 = normal); small offsets are used to absorb drift."""
+        raise NotImplementedError
+
+    def get_length(self) -> int:
+        raise NotImplementedError
+
+    def get_volume(self) -> Optional[int]:
+        raise NotImplementedError
+
+    def set_volume(self, value: int) -> None:
+        raise NotImplementedError
+
+    # ----- events -----
+    def on_end(self, callback: Callable[[], None]) -> None:
+        """Register a callback fired (from a backend thread) at end of media."""
+        self._end_callbacks.append(callback)
+
+    def on_state_change(self, callback: Callable[[str], None]) -> None:
+        """Register a callback receiving the new state name (see STATES)."""
+        self._state_callbacks.append(callback)
+
+    def on_position(self, callback: Callable[[int], None]) -> None:
+        """Register a callback receiving the playback position (ms) while playing."""
+        self._position_callbacks.append(callback)
+
+    def on_buffering(self, callback: Callable[[float], None]) -> None:
+        """Register a callback receiving the input cache fill (%, 100 = playable) during playback."""
+        self._buffering_callbacks.append(callback)
+
+    def _fire_end(self) -> None:
+        for cb in list(self._end_callbacks):
+            try:
+                cb()
+            except Exception as e:
+                _svc_logger.warning("end-of-media callback failed: %s", e)
+
+    def _fire_state(self, state: str) -> None:
+        for cb in list(self._state_callbacks):
+            try:
+                cb(state)
+            except Exception as e:
+                _svc_logger.warning("state callback failed: %s", e)
+
+    def _fire_position(self, ms: int) -> None:
+        for cb in list(self._position_callbacks):
+            try:
+                cb(ms)
+            except Exception as e:
+                _svc_logger.warning("position callback failed: %s", e)
+
+    def _fire_buffering(self, percent: float) -> None:
+        for cb in list(self._buffering_callbacks):
+            try:
+                cb(percent)
+            except Exception as e:
+                _svc_logger.warning("buffering callback failed: %s", e)
+
+
+class VlcBackend(PlayerBackend):
+    """libVLC backend (python-vlc imported lazily on first ensure_ready())."""
+
+    name = "vlc"
+
+    def __init__(self, initial_volume: int = 80) -> None:
+        super().__init__()
+        self._vlc = None
+        self._instance = None
+        self._player = None
+        self._init_lock = threading.Lock()
+        self._initial_volume = initial_volume
+        self.options: Optional[List[str]] = None  # options libVLC retenues
+
+    @staticmethod
+    def opts_base() -> List[str]:
+        # Audio ALSA par defaut (PulseAudio souvent absent en headless)
+        return ["--no-video-title-show", "--fullscreen", "--aout=alsa", "--alsa-audio-device=default", "--fbdev=/dev/fb0"]
+
+    @staticmethod
+    def opts_candidates() -> List[List[str]]:
+        headless = not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+        if headless:
+            return [["--vout=fb"], ["--vout=kmsdrm"], []]
+        return [[], ["--vout=opengl"], ["--vout=xcb"]]
+
+    @property
+    def ready(self) -> bool:
+        return self._player is not None
+
+    def ensure_ready(self) -> bool:
+        if self._player is not None:
+            return True
+        with self._init_lock:
+            if self._player is not None:
+                return True
+            try:
+                import vlc
+            except Exception as exc:
+                self.last_error = "python-vlc requis. Installez : sudo apt install python3-vlc"
+                _svc_logger.error("%s (%s)", self.last_error, exc)
+                return False
+            self._vlc = vlc
+            base = self.opts_base()
+            candidates = [base + extra for extra in self.opts_candidates()]
+            if self.options is not None:
+                # redemarrage : les options qui ont deja marche d'abord
+                candidates = [self.options] + [c for c in candidates if c != self.options]
+            for opts in candidates:
+                try:
+                    _svc_logger.info("VLC init try: %s", " ".join(opts) or "(default)")
+                    inst = vlc.Instance(*opts)
+                    ply = inst.media_player_new()
+                    try:
+                        ply.audio_set_volume(self._initial_volume)
+                    except Exception:
+                        pass
+                    self._attach_events(ply)
+                    self._instance = inst
+                    self._player = ply
+                    self.options = opts
+                    self.last_error = None
+                    PLAYER_INIT_ATTEMPTS.inc(backend=self.name, result="ok")
+                    _svc_logger.info("VLC init success.")
+                    return True
+                except Exception as e:
+                    PLAYER_INIT_ATTEMPTS.inc(backend=self.name, result="error")
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    _svc_logger.warning(
+                        "VLC init failed with opts %s -> %s",
+                        " ".join(opts) or "(default)", self.last_error
+                    )
+            _svc_logger.error("VLC init impossible avec les options testees.")
+            return False
+
+    def restart(self) -> bool:
+        with self._init_lock:
+            old_player, old_instance = self._player, self._instance
+            self._player = self._instance = None
+        # release() peut bloquer si libVLC est fige : on ne l'attend pas
+        threading.Thread(target=self._release, args=(old_player, old_instance),
+                         name="vlc-release", daemon=True).start()
+        return self.ensure_ready()
+
+    @staticmethod
+    def _release(player, instance) -> None:
+        for obj in (player, instance):
+            if obj is None:
+                continue
+            try:
+                obj.release()
+            except Exception as e:
+                _svc_logger.warning("VLC release failed: %s", e)
+
+    def _attach_events(self, ply) -> None:
+        et = self._vlc.EventType
+        try:
+            em = ply.event_manager()
+            em.event_attach(et.MediaPlayerEndReached, lambda event: (self._fire_state("ended"), self._fire_end()))
+            _svc_logger.info("VLC MediaPlayerEndReached attached")
+        except Exception as e:
+            _svc_logger.warning("attach_end_reached failed: %s", e)
+            return
+        states = {
+            et.MediaPlayerOpening: "opening",
+            et.MediaPlayerPlaying: "playing",
+            et.MediaPlayerPaused: "paused",
+            et.MediaPlayerStopped: "stopped",
+            et.MediaPlayerEncounteredError: "error",
+        }
+        for ev, state in states.items():
+            try:
+                em.event_attach(ev, lambda event, _s=state: self._fire_state(_s))
+            except Exception as e:
+                _svc_logger.warning("attach %s failed: %s", state, e)
+        try:
+            em.event_attach(et.MediaPlayerTimeChanged, lambda event: self._fire_position(int(event.u.new_time)))
+        except Exception as e:
+            _svc_logger.warning("attach time_changed failed: %s", e)
+        try:
+            # libVLC 3 : Buffering(cache %) arrive aussi pendant la lecture, sans Playing a la suite ;
+            # ce n'est donc pas un etat, juste le remplissage du cache
+            em.event_attach(et.MediaPlayerBuffering, lambda event: self._fire_buffering(float(event.u.new_cache)))
+        except Exception as e:
+            _svc_logger.warning("attach buffering failed: %s", e)
+
+    def _not_ready(self) -> bool:
+        """Player torn down (restart() failed, or never initialised)."""
+        if self._player is None or self._instance is None:
+            self.last_error = self.last_error or "VLC not ready"
+            return True
+        return False
+
+    def load(self, path: str, options: Optional[List[str]] = None) -> bool:
+        if self._not_ready():
+            return False
+        media = self._instance.media_new(path)
+        for opt in options or []:
+            media.add_option(opt)
+        self._player.set_media(media)
+        return True
+
+    def has_media(self) -> bool:
+        return self._player is not None and self._player.get_media() is not None
+
+    def play(self) -> bool:
+        if self._not_ready():
+            return False
+        self._player.play()
+        return True
+
+    def pause(self) -> None:
+        if not self._not_ready():
+            self._player.pause()
+
+    def stop(self) -> None:
+        if not self._not_ready():
+            self._player.stop()
+
+    def get_state(self) -> str:
+        if self._player is None:
+            return "uninitialized"
+        st = self._player.get_state()
+        vlc = self._vlc
+        mapping = {
+            vlc.State.NothingSpecial: "idle",
+            vlc.State.Opening: "opening",
+            vlc.State.Buffering: "buffering",
+            vlc.State.Playing: "playing",
+            vlc.State.Paused: "paused",
+            vlc.State.Stopped: "stopped",
+            vlc.State.Ended: "ended",
+            vlc.State.Error: "error",
+        }
+        return mapping.get(st, str(st))
+
+    def get_time(self) -> int:
+        return 0 if self._player is None else int(self._player.get_time() or 0)
+
+    def set_time(self, ms: int) -> None:
+        if not self._not_ready():
+            self._player.set_time(int(ms))
+
+    def set_rate(self, rate: float) -> None:
+        if not self._not_ready():
+            self._player.set_rate(float(rate))
+
+    def get_length(self) -> int:
+        return 0 if self._player is None else int(self._player.get_length() or 0)
+
+    def get_volume(self) -> Optional[int]:
+        return None if self._player is None else self._player.audio_get_volume()
+
+    def set_volume(self, value: int) -> None:
+        if not self._not_ready():
+            self._player.audio_set_volume(int(value))
+
+
+class FakeBackend(PlayerBackend):
+    """
+    Deterministic in-process player for benchmarks and tests (no display,
+    no libVLC). Position is derived from `clock`; durations come from
+    `durations` (path or basename -> seconds) or `default_duration`.
+
+    With `realtime=True` a ticker thread fires end-of-media events; with a
+    manual clock, call advance(seconds) to move time and fire them.
+    `speed` skews the simulated decoder clock (1.01 = 1% fast), to test
+    drift between several players.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        default_duration: float = 30.0,
+        durations: Optional[Dict[str, float]] = None,
+        open_delay: float = 0.0,
+        clock: Optional[Callable[[], float]] = None,
+        realtime: bool = True,
+        tick_interval: float = 0.05,
+        speed: float = 1.0,
+    ) -> None:
+        super().__init__()
+        self.default_duration = float(default_duration)
+        self.durations = dict(durations or {})
+        self.open_delay = float(open_delay)
+        self._manual_now = 0.0
+        self._clock = clock or (time.monotonic if realtime else (lambda: self._manual_now))
+        self._lock = threading.RLock()
+        self._ready = False
+        self._path: Optional[str] = None
+        self.options: List[str] = []
+        self._state = "idle"
+        self._pending_states: List[str] = []
+        self._volume = 80
+        self._pos = 0.0            # position (s) at _anchor
+        self._anchor: Optional[float] = None  # clock value when playing started
+        self._played_at: Optional[float] = None
+        self._rate = 1.0
+        self.speed = float(speed)
+        self.loads = 0
+        self._realtime = realtime
+        self._tick_interval = tick_interval
+        self._ticker: Optional[threading.Thread] = None
+        self.wedged = False
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def restart(self) -> bool:
+        with self._lock:
+            PLAYER_INIT_ATTEMPTS.inc(backend=self.name, result="ok")
+            self.wedged = False
+            self._path = None
+            self._state = "idle"
+            self._pos = 0.0
+            self._anchor = None
+        return True
+
+    def wedge(self) -> None:
+        """Simulate a stuck decoder: position frozen, state left at 'playing', no events."""
+        with self._lock:
+            self._pos = self._position(self._clock())
+            self._anchor = None
+            self.wedged = True
+
+    def ensure_ready(self) -> bool:
+        with self._lock:
+            if not self._ready:
+                PLAYER_INIT_ATTEMPTS.inc(backend=self.name, result="ok")
+                self._ready = True
+                self.last_error = None
+                if self._realtime and self._ticker is None:
+                    self._ticker = threading.Thread(target=self._tick_loop, name="fake-player", daemon=True)
+                    self._ticker.start()
+        return True
+
+    def _tick_loop(self) -> None:
+        while True:
+            time.sleep(self._tick_interval)
+            self.tick()
+
+    # ----- helpers -----
+    def _duration(self) -> float:
+        if self._path is None:
+            return 0.0
+        return float(self.durations.get(self._path, self.durations.get(os.path.basename(self._path), self.default_duration)))
+
+    def _start_offset(self) -> float:
+        for opt in self.options:
+            if opt.startswith(":start-time="):
+                return min(float(opt.split("=", 1)[1]), self._duration())
+        return 0.0
+
+    def _position(self, now: float) -> float:
+        if self._state == "playing" and self._anchor is not None:
+            return self._pos + (now - self._anchor) * self._rate * self.speed
+        return self._pos
+
+    def _set_state(self, state: str) -> None:
+        """Change d'etat (lock tenu) ; les callbacks partent apres le lock."""
+        if state != self._state:
+            self._state = state
+            self._pending_states.append(state)
+
+    def _flush_states(self) -> None:
+        with self._lock:
+            pending, self._pending_states = self._pending_states, []
+        for state in pending:
+            self._fire_state(state)
+            if state == "ended":
+                self._fire_end()
+
+    def tick(self) -> None:
+        """Advance the state machine (opening -> playing -> ended)."""
+        position = None
+        with self._lock:
+            if self.wedged:
+                return
+            now = self._clock()
+            if self._state == "opening" and self._played_at is not None and now - self._played_at >= self.open_delay:
+                self._set_state("playing")
+                self._anchor = now
+            if self._state == "playing" and self._position(now) >= self._duration():
+                self._pos = self._duration()
+                self._anchor = None
+                self._set_state("ended")
+            if self._state == "playing":
+                position = int(self._position(now) * 1000)
+        self._flush_states()
+        if position is not None:
+            self._fire_position(position)
+
+    def advance(self, seconds: float) -> None:
+        """Manual clock only: move time forward and process transitions."""
+        with self._lock:
+            self._manual_now += float(seconds)
+        self.tick()
+        self.tick()
+
+    # ----- interface -----
+    def load(self, path: str, options: Optional[List[str]] = None) -> bool:
+        with self._lock:
+            self._path = path
+            self.options = list(options or [])
+            self._set_state("idle")
+            self._pos = self._start_offset()
+            self._anchor = None
+            self.loads += 1
+        self._flush_states()
+        return True
+
+    def has_media(self) -> bool:
+        return self._path is not None
+
+    def play(self) -> bool:
+        with self._lock:
+            if self._path is None:
+                return False
+            if self._state == "playing":
+                return True
+            if self._state in ("idle", "stopped", "ended"):
+                self._pos = self._start_offset()  # comme VLC : les options media s'appliquent a chaque play()
+            self._played_at = self._clock()
+            self._set_state("opening")
+        self.tick()
+        return True
+
+    def pause(self) -> None:
+        with self._lock:
+            if self._state == "playing":
+                self._pos = self._position(self._clock())
+                self._anchor = None
+                self._set_state("paused")
+            elif self._state == "paused":
+                self._anchor = self._clock()
+                self._set_state("playing")
+        self._flush_states()
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._path is not None:
+                self._set_state("stopped")
+            self._pos = 0.0
+            self._anchor = None
+        self._flush_states()
+
+    def get_state(self) -> str:
+        self.tick()
+        return self._state if self._ready else "uninitialized"
+
+    def get_time(self) -> int:
+        with self._lock:
+            return int(self._position(self._clock()) * 1000)
+
+    def set_time(self, ms: int) -> None:
+        with self._lock:
+            now = self._clock()
+            self._pos = max(0.0, min(ms / 1000.0, self._duration()))
+            if self._state == "playing":
+                self._anchor = now
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            now = self._clock()
+            self._pos = self._position(now)
+            if self._anchor is not None:
+                self._anchor = now
+            self._rate = float(rate)
+
+    def get_length(self) -> int:
+        with self._lock:
+            return int(self._duration() * 1000)
+
+    def get_volume(self) -> Optional[int]:
+        return self._volume
+
+    def set_volume(self, value: int) -> None:
+        self._volume = max(0, min(100, int(value)))
+
+
+def create_player_backend(kind: Optional[str] = None) -> PlayerBackend:
+    """
+    Backend from `kind` or env RPI_AVP_PLAYER ("vlc" by default, "fake"
+    for benchmarks/CI; RPI_AVP_FAKE_DURATION sets the fake clip length,
+    RPI_AVP_FAKE_OPEN_DELAY its start latency, RPI_AVP_FAKE_SPEED its clock skew).
+    """
+    kind = (kind or os.environ.get("RPI_AVP_PLAYER", "vlc")).strip().lower()
+    if kind == "fake":
+        return FakeBackend(default_duration=float(os.environ.get("RPI_AVP_FAKE_DURATION", "30") or 30),
+                           open_delay=float(os.environ.get("RPI_AVP_FAKE_OPEN_DELAY", "0") or 0),
+                           speed=float(os.environ.get("RPI_AVP_FAKE_SPEED", "1") or 1))
+    if kind != "vlc":
+        _svc_logger.warning("unknown player backend %r, using vlc", kind)
+    return VlcBackend()
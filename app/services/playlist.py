@@ -0,0 +1,325 @@
+import atexit
+import json
+import os
+import random
+import threading
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+try:
+    from flask import current_app
+    _svc_logger = current_app.logger
+except Exception:
+    _svc_logger = logging.getLogger('rpi_avp')
+
+
+ALL = "all"  # playlist implicite : toute la bibliotheque, ordre alphabetique
+MODES = ("sequential", "shuffle", "weighted")
+RECENT_MAX = 100
+SAVE_DELAY = 30.0  # s : compteurs de lecture ecrits au plus une fois par intervalle (carte SD)
+
+
+class PlaylistService:
+    """
+    Named playlists over the in-memory library index.
+
+    Every operation works on the filename list the caller already holds
+    (legacy `videos`), so switching playlist, reordering or reshuffling is
+    O(n) in memory and never rescans VIDEO_DIR nor reloads the player.
+
+    Playlist fields:
+      - items: list of filenames, or None for the whole library
+      - collection: folder (recursive library) used when items is None;
+        sub-folders included
+      - mode: 'sequential' | 'shuffle' | 'weighted'
+      - no_repeat: int, an item is not picked again within this many plays
+        (shuffle/weighted; capped to the playlist size - 1)
+      - weights: {filename: float} for 'weighted' (default 1.0)
+
+    Persisted to a JSON file with the active playlist and per-item play
+    counts (play counts alone are written at most every SAVE_DELAY s).
+    The implicit 'all' playlist always exists (sequential, whole library)
+    and matches the historical loop_all behaviour.
+    """
+
+    def __init__(self, file_path: str, rng: Optional[random.Random] = None) -> None:
+        self.file_path = file_path
+        self._lock = threading.RLock()
+        self._rng = rng or random.Random()
+        self._playlists: Dict[str, Dict[str, Any]] = {}
+        self._active = ALL
+        self._counts: Dict[str, int] = {}
+        self._recent: Deque[str] = deque(maxlen=RECENT_MAX)
+        self._deck: List[str] = []
+        self._deck_key: Optional[tuple] = None
+        self._restart = False  # prochaine video = debut de playlist (ignore `current`)
+        self._reserved: Optional[tuple] = None  # (playlist, item) choisi d'avance (pre-chauffe)
+        self._save_timer: Optional[threading.Timer] = None
+        self._load()
+        atexit.register(self.flush)  # arret propre : compteurs en attente ecrits
+
+    # ----- persistence -----
+    def _load(self) -> None:
+        try:
+            if not os.path.isfile(self.file_path):
+                return
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                data = json.load(f) or {}
+        except Exception as e:
+            _svc_logger.warning("playlists load failed: %s", e)
+            return
+        for name, pl in (data.get("playlists") or {}).items():
+            try:
+                self._playlists[name] = self._normalize(pl)
+            except ValueError as e:
+                _svc_logger.warning("playlist %r ignored: %s", name, e)
+        self._active = data.get("active") or ALL
+        if self._active != ALL and self._active not in self._playlists:
+            self._active = ALL
+        self._counts = {k: int(v) for k, v in (data.get("play_counts") or {}).items()}
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+        data = {"active": self._active, "playlists": self._playlists, "play_counts": self._counts}
+        try:
+            tmp = self.file_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.file_path)
+        except Exception as e:
+            _svc_logger.error("playlists save failed: %s", e)
+
+    def _save_later(self) -> None:
+        """Coalesced _save() (play counts change on every track)."""
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(SAVE_DELAY, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self) -> None:
+        """Write pending play counts now."""
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+            if timer is not None:
+                timer.cancel()
+                self._save()
+
+    @staticmethod
+    def _normalize(pl: Dict[str, Any]) -> Dict[str, Any]:
+        mode = pl.get("mode") or "sequential"
+        if not isinstance(mode, str):
+            raise ValueError("mode doit etre une chaine")
+        mode = mode.strip().lower()
+        if mode not in MODES:
+            raise ValueError(f"mode inconnu: {mode}")
+        items = pl.get("items")
+        if items is not None:
+            if not isinstance(items, list):
+                raise ValueError("items doit etre une liste")
+            items = [str(x) for x in items]
+        weights = pl.get("weights") or {}
+        if not isinstance(weights, dict):
+            raise ValueError("weights doit etre un objet {fichier: poids}")
+        weights = {str(k): float(v) for k, v in weights.items()}
+        if any(w < 0 for w in weights.values()):
+            raise ValueError("poids negatif")
+        collection = pl.get("collection") or ""
+        if not isinstance(collection, str):
+            raise ValueError("collection doit etre une chaine")
+        collection = collection.strip("/") or None
+        return {"items": items, "collection": collection, "mode": mode,
+                "no_repeat": max(0, int(pl.get("no_repeat") or 0)), "weights": weights}
+
+    # ----- CRUD -----
+    def list_playlists(self) -> Dict[str, Any]:
+        with self._lock:
+            pls = {ALL: {"items": None, "mode": "sequential", "no_repeat": 0, "weights": {}}}
+            pls.update(self._playlists)
+            return {"active": self._active, "playlists": pls}
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        return self.list_playlists()["playlists"].get(name)
+
+    def save(self, name: str, **fields: Any) -> Dict[str, Any]:
+        """Create or replace a playlist. Raises ValueError on bad input."""
+        name = (name or "").strip()
+        if not name or name == ALL:
+            raise ValueError("nom de playlist invalide")
+        pl = self._normalize(fields)
+        with self._lock:
+            self._playlists[name] = pl
+            self._invalidate()
+            self._save()
+        return pl
+
+    def delete(self, name: str) -> bool:
+        with self._lock:
+            if name not in self._playlists:
+                return False
+            del self._playlists[name]
+            if self._active == name:
+                self._active = ALL
+            self._invalidate()
+            self._save()
+            return True
+
+    def activate(self, name: str, restart: bool = False) -> None:
+        """Switch playlist; with `restart` the next item starts the new playlist."""
+        with self._lock:
+            if name != ALL and name not in self._playlists:
+                raise KeyError(name)
+            self._active = name
+            self._invalidate()
+            self._restart = restart
+            self._save()
+
+    def active_name(self) -> str:
+        return self._active
+
+    # ----- ordering -----
+    def _invalidate(self) -> None:
+        self._deck, self._deck_key = [], None
+
+    def _active_pl(self) -> Dict[str, Any]:
+        if self._active == ALL:
+            return {"items": None, "mode": "sequential", "no_repeat": 0, "weights": {}}
+        return self._playlists[self._active]
+
+    @staticmethod
+    def _entries(pl: Dict[str, Any], library: Sequence[str]) -> List[str]:
+        if pl["items"] is None:
+            collection = pl.get("collection")
+            if collection:
+                prefix = collection + "/"
+                return [x for x in library if x.startswith(prefix)]
+            return list(library)
+        present = set(library)
+        return [x for x in pl["items"] if x in present]
+
+    def members(self, name: str, library: Sequence[str]) -> List[str]:
+        """Items of playlist `name` found in `library` (no deck/reservation side effects)."""
+        pl = self.get(name)
+        return self._entries(pl, library) if pl is not None else []
+
+    def _window(self, pl: Dict[str, Any], size: int) -> set:
+        n = min(pl["no_repeat"], max(0, size - 1))
+        return set(list(self._recent)[-n:]) if n else set()
+
+    def _reshuffle(self, entries: List[str], pl: Dict[str, Any]) -> None:
+        deck = list(entries)
+        self._rng.shuffle(deck)
+        recent = self._window(pl, len(deck))
+        if recent:
+            # les derniers joues passent en fin de paquet (fenetre anti-repetition)
+            deck = [x for x in deck if x not in recent] + [x for x in deck if x in recent]
+        self._deck = deck
+
+    def order(self, library: Sequence[str]) -> List[str]:
+        """Upcoming order for the active playlist (deck for shuffle)."""
+        with self._lock:
+            pl = self._active_pl()
+            entries = self._entries(pl, library)
+            if pl["mode"] == "shuffle":
+                self._sync_deck(entries, pl)
+                return list(self._deck)
+            return entries
+
+    def _sync_deck(self, entries: List[str], pl: Dict[str, Any]) -> None:
+        key = (self._active, tuple(entries))
+        if key != self._deck_key:
+            self._deck_key = key
+            self._reshuffle(entries, pl)
+
+    def first_item(self, name: str, library: Sequence[str]) -> Optional[str]:
+        """
+        Pick (and reserve) the item that playlist `name` will start with, so
+        it can be pre-warmed before the switch. Used by the scheduler.
+        """
+        with self._lock:
+            pl = self.get(name)
+            if pl is None:
+                return None
+            entries = self._entries(pl, library)
+            if not entries:
+                return None
+            if pl["mode"] == "sequential":
+                item = entries[0]
+            else:
+                window = self._window(pl, len(entries))
+                item = self._rng.choice([x for x in entries if x not in window] or entries)
+            self._reserved = (name, item)
+            return item
+
+    def next_item(self, library: Sequence[str], current: Optional[str]) -> Optional[str]:
+        """Item to play after `current` according to the active playlist."""
+        with self._lock:
+            pl = self._active_pl()
+            entries = self._entries(pl, library)
+            if not entries:
+                return None
+            if self._restart:
+                self._restart, current = False, None
+                reserved, self._reserved = self._reserved, None
+                if reserved and reserved[0] == self._active and reserved[1] in entries:
+                    if pl["mode"] == "shuffle":
+                        self._sync_deck(entries, pl)
+                        if reserved[1] in self._deck:
+                            self._deck.remove(reserved[1])
+                    return reserved[1]
+            mode = pl["mode"]
+            if mode == "sequential":
+                try:
+                    return entries[(entries.index(current) + 1) % len(entries)]
+                except ValueError:
+                    return entries[0]
+            if mode == "shuffle":
+                self._sync_deck(entries, pl)
+                if not self._deck:
+                    self._reshuffle(entries, pl)
+                return self._deck.pop(0)
+            # weighted
+            recent = self._window(pl, len(entries))
+            candidates = [x for x in entries if x not in recent] or [x for x in entries if x != current] or entries
+            weights = [pl["weights"].get(x, 1.0) for x in candidates]
+            if not any(weights):
+                weights = None
+            return self._rng.choices(candidates, weights=weights, k=1)[0]
+
+    def prev_item(self, library: Sequence[str], current: Optional[str]) -> Optional[str]:
+        """Previously played item (history), or the previous one in order."""
+        with self._lock:
+            pl = self._active_pl()
+            entries = self._entries(pl, library)
+            if not entries:
+                return None
+            if pl["mode"] != "sequential":
+                allowed = set(entries)
+                history = list(self._recent)
+                idx = [i for i, x in enumerate(history) if x in allowed]
+                drop = set()
+                if idx and history[idx[-1]] == current:
+                    drop.add(idx.pop())
+                if idx:
+                    # on "remonte" l'historique : courant et cible en sont retires,
+                    # record_play() remet la cible en fin (pas de doublon)
+                    drop.add(idx[-1])
+                    self._recent = deque((x for i, x in enumerate(history) if i not in drop), maxlen=RECENT_MAX)
+                    return history[idx[-1]]
+            try:
+                return entries[(entries.index(current) - 1) % len(entries)]
+            except ValueError:
+                return entries[-1]
+
+    # ----- play counts -----
+    def record_play(self, name: Optional[str]) -> None:
+        if not name:
+            return
+        with self._lock:
+            self._recent.append(name)
+            self._counts[name] = self._counts.get(name, 0) + 1
+            self._save_later()
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
@@ -1,7 +1,11 @@
 import os
 import shutil
+import threading
+import time
 import logging
-from typing import Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..metrics import HLS_SEGMENTS
 
 try:
     from flask import current_app
@@ -10,15 +14,48 @@ except Exception:
     _svc_logger = logging.getLogger('rpi_avp')
 
 
+# Default adaptive ladder (lowest first). Each rung is transcoded by VLC into
+# its own HLS sub-playlist under HLS_DIR/<name>/ and referenced by master.m3u8.
+DEFAULT_LADDER: List[Dict[str, Any]] = [
+    {"name": "240p", "height": 240, "vb": 400, "ab": 64},
+    {"name": "480p", "height": 480, "vb": 1200, "ab": 96},
+]
+DEFAULT_MAX_KBPS = 1500
+DEFAULT_IDLE_TIMEOUT = 30.0
+ENCODER_WARMUP = 6.0  # s laissees a VLC pour ecrire la 1re playlist apres le demarrage de l'encodeur
+MASTER_NAME = "master.m3u8"
+SEGMENT_TEMPLATE = "seg-########.ts"
+
+
 class PreviewService:
     """
     Controls the HLS preview flag and helpers to manage the HLS directory.
+
+    Settings used:
+      - preview_enabled: bool
+      - preview_ladder: list of {name, height, vb, ab} (kbps); [] = single
+        passthrough rendition (legacy index.m3u8, no transcode)
+      - preview_max_kbps: int, cap applied to every rung's video bitrate
+      - preview_idle_timeout: float seconds without HLS request before the
+        encoder is torn down (default 30)
+
+    The flag only allows the preview; the encoder itself runs while at least
+    one viewer has fetched a playlist/segment within the idle timeout.
+    Produced segments are counted (rpi_avp_hls_segments_total) by the idle
+    watcher while the encoder runs, and before the HLS directory is cleared.
     """
 
     def __init__(self, settings_service, hls_dir: str, hls_index: str) -> None:
         self._settings = settings_service
         self.hls_dir = hls_dir
         self.hls_index = hls_index
+        self.hls_master = os.path.join(hls_dir, MASTER_NAME)
+        self._lock = threading.Lock()
+        self._viewers: Dict[str, float] = {}
+        self._encoder_started_at: Optional[float] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._segment_seq: Dict[str, int] = {}
+        self._segment_lock = threading.Lock()
 
     def is_enabled(self) -> bool:
         return bool(self._settings.get("preview_enabled", False))
@@ -26,10 +63,186 @@ class PreviewService:
     def set_enabled(self, value: bool) -> None:
         self._settings.set(preview_enabled=bool(value))
 
+    def url(self) -> str:
+        return f"/hls/{MASTER_NAME}" if self.ladder() else "/hls/index.m3u8"
+
     def status(self) -> dict:
-        return {"enabled": self.is_enabled(), "url": "/hls/index.m3u8"}
+        return {
+            "enabled": self.is_enabled(),
+            "url": self.url(),
+            "ladder": self.ladder(),
+            "viewers": self.active_viewers(),
+            "encoder_active": self.encoder_active(),
+            "encoder_uptime": self.encoder_uptime(),
+        }
+
+    # ----- viewers / encoder lifecycle -----
+    def idle_timeout(self) -> float:
+        try:
+            return max(1.0, float(self._settings.get("preview_idle_timeout", DEFAULT_IDLE_TIMEOUT)))
+        except (TypeError, ValueError):
+            return DEFAULT_IDLE_TIMEOUT
+
+    def touch_viewer(self, key: str) -> bool:
+        """Record an HLS request from `key`.
+        Returns True when the encoder must be started for this viewer."""
+        with self._lock:
+            self._viewers[key] = time.monotonic()
+            return self._encoder_started_at is None and self.is_enabled()
+
+    def active_viewers(self) -> int:
+        cutoff = time.monotonic() - self.idle_timeout()
+        with self._lock:
+            for key in [k for k, ts in self._viewers.items() if ts < cutoff]:
+                del self._viewers[key]
+            return len(self._viewers)
+
+    def encoder_active(self) -> bool:
+        return self._encoder_started_at is not None
+
+    def encoder_uptime(self) -> Optional[float]:
+        started = self._encoder_started_at
+        return round(time.monotonic() - started, 1) if started is not None else None
+
+    def mark_encoder_started(self) -> None:
+        with self._lock:
+            if self._encoder_started_at is None:
+                self._encoder_started_at = time.monotonic()
+
+    def mark_encoder_stopped(self) -> None:
+        with self._lock:
+            self._encoder_started_at = None
+            self._viewers.clear()
+
+    def idle_expired(self) -> bool:
+        """Encoder running but nobody fetched anything within the idle timeout."""
+        return self.encoder_active() and (self.active_viewers() == 0 or not self.is_enabled())
+
+    def start_idle_watcher(self, on_idle: Callable[[], None], interval: float = 5.0) -> None:
+        """Background thread calling `on_idle` whenever idle_expired() is True."""
+        with self._lock:
+            if self._watcher is not None and self._watcher.is_alive():
+                return
+
+            def _run():
+                while True:
+                    time.sleep(interval)
+                    try:
+                        if self.encoder_active():
+                            self.count_segments()
+                        if self.idle_expired():
+                            on_idle()
+                    except Exception as e:
+                        _svc_logger.warning("preview idle watcher: %s", e)
+
+            self._watcher = threading.Thread(target=_run, name="preview-idle", daemon=True)
+            self._watcher.start()
+
+    def warming_up(self) -> Optional[float]:
+        """Seconds left of ENCODER_WARMUP since the encoder start (None once warmed up / stopped)."""
+        uptime = self.encoder_uptime()
+        if uptime is None or uptime >= ENCODER_WARMUP:
+            return None
+        return ENCODER_WARMUP - uptime
+
+    def wait_for_file(self, path: str, timeout: float = ENCODER_WARMUP) -> bool:
+        """Wait (polling) for VLC to write a playlist after the encoder start."""
+        deadline = time.monotonic() + timeout
+        while not os.path.isfile(path):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+    # ----- ladder -----
+    def max_kbps(self) -> int:
+        try:
+            return max(0, int(self._settings.get("preview_max_kbps", DEFAULT_MAX_KBPS) or 0))
+        except (TypeError, ValueError):
+            return DEFAULT_MAX_KBPS
+
+    def ladder(self) -> List[Dict[str, Any]]:
+        """Normalised ladder (sorted by height, bitrate capped, invalid rungs dropped)."""
+        raw = self._settings.get("preview_ladder", None)
+        if raw is None:
+            raw = DEFAULT_LADDER
+        cap = self.max_kbps()
+        out: List[Dict[str, Any]] = []
+        seen = set()
+        for rung in raw if isinstance(raw, list) else []:
+            try:
+                height = int(rung["height"])
+                vb = int(rung.get("vb", 0))
+                ab = int(rung.get("ab", 64))
+            except (KeyError, TypeError, ValueError):
+                _svc_logger.warning("preview ladder: invalid rung %r", rung)
+                continue
+            if height <= 0 or vb <= 0:
+                continue
+            name = str(rung.get("name") or f"{height}p")
+            if not name.replace("_", "").replace("-", "").isalnum() or name in seen:
+                continue
+            seen.add(name)
+            if cap:
+                vb = min(vb, cap)
+            # 16:9 width, rounded to an even number for the encoder
+            width = int(round(height * 16 / 9 / 2)) * 2
+            out.append({"name": name, "width": width, "height": height, "vb": vb, "ab": ab})
+        out.sort(key=lambda r: r["height"])
+        return out
+
+    def build_sout(self) -> str:
+        """VLC sout chain: local display plus one livehttp output per rung."""
+        dsts = ["display"]
+        ladder = self.ladder()
+        if not ladder:
+            dsts.append(self._livehttp(self.hls_dir, "/hls"))
+        for r in ladder:
+            transcode = (
+                f"transcode{{vcodec=h264,venc=x264{{preset=ultrafast,tune=zerolatency,keyint=50}},"
+                f"vb={r['vb']},height={r['height']},acodec=mp4a,ab={r['ab']},channels=2}}"
+            )
+            sub_dir = os.path.join(self.hls_dir, r["name"])
+            dsts.append(f"{transcode}:{self._livehttp(sub_dir, '/hls/' + r['name'])}")
+        return "#duplicate{" + ",".join(f"dst={d}" for d in dsts) + "}"
+
+    @staticmethod
+    def _livehttp(out_dir: str, url_prefix: str) -> str:
+        index_path = os.path.join(out_dir, "index.m3u8")
+        seg_path_tmpl = os.path.join(out_dir, SEGMENT_TEMPLATE)
+        return (
+            f"std{{access=livehttp{{"
+            f"seglen=2,delsegs=true,numsegs=5,"
+            f"index={index_path},index-url={url_prefix}/{SEGMENT_TEMPLATE}"
+            f"}},mux=ts{{use-key-frames}},dst={seg_path_tmpl}}}"
+        )
+
+    def master_playlist(self) -> str:
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+        for r in self.ladder():
+            bandwidth = (r["vb"] + r["ab"]) * 1000
+            lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={r['width']}x{r['height']}")
+            lines.append(f"{r['name']}/index.m3u8")
+        return "\n".join(lines) + "\n"
+
+    def write_master_playlist(self) -> str:
+        """Write master.m3u8 atomically and return its path."""
+        os.makedirs(self.hls_dir, exist_ok=True)
+        tmp = self.hls_master + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.master_playlist())
+        os.replace(tmp, self.hls_master)
+        return self.hls_master
+
+    def prepare_dirs(self) -> None:
+        """Create HLS_DIR and one sub-directory per rung (VLC does not)."""
+        os.makedirs(self.hls_dir, exist_ok=True)
+        for r in self.ladder():
+            os.makedirs(os.path.join(self.hls_dir, r["name"]), exist_ok=True)
 
     def clear_hls_dir(self) -> None:
+        # segments ecrits depuis le dernier passage du watcher : comptes avant de disparaitre
+        self.count_segments(reset=True)
         os.makedirs(self.hls_dir, exist_ok=True)
         # Remove segments but keep directory
         try:
@@ -45,6 +258,36 @@ class PreviewService:
         except FileNotFoundError:
             os.makedirs(self.hls_dir, exist_ok=True)
 
+    def new_segments(self) -> int:
+        """Segments written since the previous call (from seg-N.ts numbering)."""
+        produced = 0
+        dirs = [self.hls_dir] + [os.path.join(self.hls_dir, r["name"]) for r in self.ladder()]
+        with self._segment_lock:
+            for d in dirs:
+                try:
+                    names = os.listdir(d)
+                except OSError:
+                    continue
+                seqs = [int(n[4:-3]) for n in names
+                        if n.startswith("seg-") and n.endswith(".ts") and n[4:-3].isdigit()]
+                if not seqs:
+                    continue
+                top = max(seqs)
+                last = self._segment_seq.get(d)
+                # Numerotation repartie de 1 apres un clear_hls_dir()
+                produced += top if last is None or top < last else top - last
+                self._segment_seq[d] = top
+        return produced
+
+    def count_segments(self, reset: bool = False) -> int:
+        """Add the new segments to rpi_avp_hls_segments_total; `reset` before a clear (numbering restarts)."""
+        produced = self.new_segments()
+        if produced:
+            HLS_SEGMENTS.inc(produced)
+        if reset:
+            with self._segment_lock:
+                self._segment_seq.clear()
+        return produced
+
     def hls_paths(self) -> Tuple[str, str]:
         return self.hls_dir, self.hls_index
-
@@ -1,10 +1,19 @@
+import atexit
 import json
 import os
+import re
 import subprocess
 import time
 import logging
 import shutil
-from typing import Tuple, List, Optional
+import threading
+from typing import Any, Callable, Dict, Tuple, List, Optional
+
+from ..metrics import SYNC_BYTES, SYNC_SECONDS
+from .jobs import Job, JobRunner, run_streamed
+from .rclone_rcd import RcdClient, RcdError
+from . import sync_plan
+from .sync_plan import ManifestStore
 
 try:
     from flask import current_app
@@ -12,23 +21,140 @@ try:
 except Exception:
     _svc_logger = logging.getLogger('rpi_avp')
 
+# "Transferred:   1.234 GiB / 1.234 GiB, 100%, ..." (la ligne "N / N" des fichiers n'a pas d'unite)
+_TRANSFERRED_RE = re.compile(r"Transferred:\s+([\d.]+)\s*(B|Bytes|[KMGTP]i?B)\s*/")
+SYNC_TIMEOUT = 6 * 3600.0  # s : un rclone sync/copy plus long est considere bloque (tue)
+WHICH_RETRY = 30.0  # s avant de re-chercher un binaire absent (PATH scanne une fois)
+_UNITS = {"B": 1, "Bytes": 1, "KiB": 1 << 10, "MiB": 1 << 20, "GiB": 1 << 30, "TiB": 1 << 40, "PiB": 1 << 50,
+          "KB": 10 ** 3, "MB": 10 ** 6, "GB": 10 ** 9, "TB": 10 ** 12, "PB": 10 ** 15}
+
 
 class RcloneService:
-    """rclone orchestration: check/install/config/sync and log tailing."""
+    """
+    rclone orchestration: check/install/config/sync and log tailing.
+
+    Binary path, version and remote list are cached: the version is keyed
+    on the binary mtime, the remotes on rclone.conf mtime, so any config
+    change (ours or `rclone config` by hand) invalidates them. state()
+    never runs rclone itself; a stale cache is refreshed by a background
+    job. Slow operations take an optional `job` (see JobRunner) to stream
+    their output; the routes run them through `self.jobs`.
+
+    Settings used:
+      - rclone_mode: 'cli' (default, one process per operation) | 'rcd'
+        (one long-lived `rclone rcd` on localhost driven over HTTP, see
+        RcdClient; falls back to the CLI if the daemon cannot start)
+      - sync_delta: bool (default True, forced with a cache budget). Sync lists the remote once, diffs
+        it locally against VIDEO_DIR (see sync_plan), skips rclone when
+        nothing changed, copies only the changed paths (--files-from) and
+        deletes locally; the remote manifest of the last successful run is
+        kept to report what changed upstream. Falls back to a full
+        `rclone sync` if the listing fails. With lan_share on, the paths to
+        copy are first fetched from peer players (see LanShare); rclone
+        only downloads the rest. Remote versions the integrity check
+        quarantined as broken uploads are not downloaded again until they
+        change (see IntegrityVerifier.rejected()).
+    """
 
-    def __init__(self, settings_service, video_dir: str, log_dir: str):
+    def __init__(self, settings_service, video_dir: str, log_dir: str, cache=None, lan=None, integrity=None):
         self._settings = settings_service
         self.video_dir = video_dir
         self.log_dir = log_dir
         # Align with legacy filename for continuity
         self.log_path = os.path.join(self.log_dir, "rclone_sync.log")
+        self.jobs = JobRunner(prefix="rclone")
+        self._which: Optional[str] = None
+        self._which_checked = 0.0
+        self._state: Optional[Dict[str, Any]] = None
+        self._state_lock = threading.Lock()
+        self._rcd: Optional[RcdClient] = None
+        self._rcd_lock = threading.Lock()
+        self.live_stats: Optional[Dict[str, Any]] = None  # core/stats du sync en cours (rcd)
+        self.manifests = ManifestStore(os.path.join(log_dir, "remote_manifest.json"))
+        self.last_plan: Optional[Dict[str, Any]] = None
+        self.cache = cache  # ContentCache : budget disque / eviction LRU (optionnel)
+        self.lan = lan  # LanShare : fichiers deja presents sur les lecteurs du LAN (optionnel)
+        self.integrity = integrity  # IntegrityVerifier : versions distantes rejetees (optionnel)
 
     # ----- helpers -----
     def which_rclone(self) -> Optional[str]:
+        path = self._which
+        if path and os.access(path, os.X_OK):
+            return path
+        now = time.monotonic()
+        if path is None and self._which_checked and now - self._which_checked < WHICH_RETRY:
+            return None
+        self._which_checked = now
+        self._which = None
         for exe in ("rclone", "/usr/bin/rclone", "/usr/local/bin/rclone"):
-            if shutil.which(exe):
-                return exe
-        return None
+            found = shutil.which(exe)
+            if found:
+                self._which = found
+                break
+        return self._which
+
+    def _forget_binary(self) -> None:
+        self._which, self._which_checked = None, 0.0
+
+    @staticmethod
+    def _mtime_ns(path: Optional[str]) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns if path else None
+        except OSError:
+            return None
+
+    # ----- rcd -----
+    def mode(self) -> str:
+        return "rcd" if (self._settings.get("rclone_mode") or "cli") == "rcd" else "cli"
+
+    def rcd(self) -> Optional[RcdClient]:
+        """Running rcd client in 'rcd' mode (started on first use), else None."""
+        if self.mode() != "rcd":
+            if self._rcd is not None:
+                self.stop_rcd()
+            return None
+        rc = self.which_rclone()
+        if not rc:
+            return None
+        with self._rcd_lock:
+            if self._rcd is not None and self._rcd.running and self._rcd.rc_path == rc:
+                return self._rcd
+            if self._rcd is not None:
+                self._rcd.stop()
+            os.makedirs(self.log_dir, exist_ok=True)
+            client = RcdClient(rc, env=self.rclone_base_env(), log_path=os.path.join(self.log_dir, "rclone_rcd.log"))
+            try:
+                client.start()
+            except (RcdError, OSError) as e:
+                _svc_logger.warning("rclone rcd unavailable, using the CLI: %s", e)
+                self._rcd = None
+                return None
+            atexit.register(client.stop)
+            self._rcd = client
+            return client
+
+    def sync_stats(self) -> Dict[str, Any]:
+        return {"mode": self.mode(), "rcd_running": bool(self._rcd is not None and self._rcd.running),
+                "live": self.live_stats}
+
+    def stop_rcd(self) -> None:
+        with self._rcd_lock:
+            client, self._rcd = self._rcd, None
+        if client is not None:
+            client.stop()
+
+    def _exec(self, cmd: List[str], timeout: float, job: Optional[Job] = None) -> Tuple[int, str]:
+        """Run an rclone command (streamed into `job` when given); (returncode, output)."""
+        if job is not None:
+            return job.run(cmd, timeout, env=self.rclone_base_env())
+        try:
+            p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                               env=self.rclone_base_env(), timeout=timeout)
+            return p.returncode, p.stdout or ""
+        except subprocess.TimeoutExpired:
+            return 124, f"Timeout: {' '.join(cmd[:3])}"
+        except OSError as e:
+            return 1, f"Error: {type(e).__name__}: {e}"
 
     def rclone_conf_path(self) -> str:
         home = os.path.expanduser("~")
@@ -42,35 +168,240 @@ class RcloneService:
         env.setdefault("RCLONE_CONFIG_DIR", os.path.dirname(self.rclone_conf_path()))
         return env
 
-    # ----- API-like operations -----
-    def check(self) -> dict:
-        rc = self.which_rclone()
-        result = {"which": rc, "version": None, "remotes": []}
-        if not rc:
-            return result
+    def _stream(self, cmd: List[str], log: Optional[Callable[[str], Any]]) -> Tuple[int, str, str]:
+        """
+        Long rclone transfer (SYNC_TIMEOUT), each line passed to `log` as it
+        arrives; (returncode, text not yet logged, full output for stats).
+        """
+        code, out = run_streamed(cmd, SYNC_TIMEOUT, env=self.rclone_base_env(), on_line=log)
+        return code, ("" if log is not None else out), out
+
+    def sync_cmd(self, rc: str, target: str) -> List[str]:
+        """rclone sync command line; the periodic stats feed the sync metrics."""
+        return [rc, "sync", target, self.video_dir, "--delete-during", "--fast-list",
+                "--stats", "30s", "--stats-log-level", "NOTICE"]
+
+    @staticmethod
+    def transferred_bytes(output: str) -> int:
+        """Bytes transferred according to the last rclone stats block in `output`."""
+        matches = _TRANSFERRED_RE.findall(output or "")
+        if not matches:
+            return 0
+        value, unit = matches[-1]
         try:
-            out = subprocess.check_output([rc, "version"], text=True, env=self.rclone_base_env())
-            result["version"] = (out.splitlines()[0] if out else None)
-        except Exception as e:
-            _svc_logger.warning("rclone version failed: %s", e)
+            return int(float(value) * _UNITS.get(unit, 1))
+        except ValueError:
+            return 0
+
+    def record_sync(self, started: float, output: str, ok: bool, transferred: Optional[int] = None,
+                    result: Optional[str] = None) -> None:
+        result = result or ("ok" if ok else "error")
+        SYNC_SECONDS.observe(time.monotonic() - started, result=result)
+        SYNC_BYTES.inc(self.transferred_bytes(output) if transferred is None else transferred)
+
+    def run_sync(self, rc: str, target: str, log: Optional[Callable[[str], Any]] = None) -> Tuple[int, str]:
+        """
+        One sync `target` -> video_dir (delta plan, or full rcd/CLI sync);
+        (returncode, output not yet passed to `log`). `log` receives the
+        planned transfer set before any transfer starts, then the rclone
+        output line by line (CLI mode). Records metrics.
+        """
+        started = time.monotonic()
+        cached = self.cache is not None and self.cache.enabled()
+        if cached or self._settings.get("sync_delta", True):
+            try:
+                return self._delta_sync(rc, target, started, log)
+            except (RcdError, RuntimeError) as e:
+                if cached:
+                    # pas de sync complet : il depasserait le budget disque
+                    self.record_sync(started, "", False, transferred=0)
+                    return 1, f"sync plan unavailable: {e}\n"
+                _svc_logger.warning("sync plan unavailable, full sync: %s", e)
+                if log is not None:
+                    log(f"sync plan unavailable ({e}), full sync\n")
+        return self._full_sync(rc, target, started, log)
+
+    # ----- delta sync -----
+    def remote_listing(self, rc: str, target: str) -> sync_plan.Manifest:
+        """Recursive file listing of `target` (one lsjson / operations/list). Raises RuntimeError."""
+        # md5 (natif sur Drive, sans cout) pour la verification d'integrite
+        hashes = ["md5"] if self._settings.get("integrity_verify", True) else []
+        client = self.rcd()
+        if client is not None:
+            return sync_plan.remote_manifest(client.list(target, recurse=True, hash_types=hashes))
+        cmd = [rc, "lsjson", "-R", "--files-only", "--fast-list", target]
+        for h in hashes:
+            cmd += ["--hash", "--hash-type", h]
+        code, out = self._exec(cmd, 600)
+        if code != 0:
+            raise RuntimeError(f"lsjson {target} failed (rc={code}): {out.strip()[:200]}")
         try:
-            out = subprocess.check_output([rc, "listremotes"], text=True, env=self.rclone_base_env())
-            result["remotes"] = [x.strip().rstrip(":") for x in out.splitlines() if x.strip()]
-        except Exception as e:
-            _svc_logger.warning("rclone listremotes failed: %s", e)
-        return result
+            return sync_plan.remote_manifest(json.loads(out))
+        except ValueError as e:
+            raise RuntimeError(f"lsjson {target}: invalid output ({e})")
+
+    def plan_sync(self, rc: str, target: str) -> Tuple[Dict[str, Any], sync_plan.Manifest]:
+        """Delta between the remote and VIDEO_DIR, without transferring; (plan, remote manifest)."""
+        remote = self.remote_listing(rc, target)
+        local = sync_plan.local_manifest(self.video_dir)
+        rejected = self.integrity.rejected() if self.integrity is not None else None
+        plan = sync_plan.plan(remote, local, self.manifests.load(target), rejected)
+        if self.cache is not None and self.cache.enabled():
+            plan = self.cache.select(plan, remote, local)
+        plan.update(target=target, planned_at=time.time())
+        self.last_plan = plan
+        return plan, remote
+
+    def _delta_sync(self, rc: str, target: str, started: float,
+                    log: Optional[Callable[[str], Any]]) -> Tuple[int, str]:
+        plan, remote = self.plan_sync(rc, target)
+        head = sync_plan.summary(plan)
+        if log is not None:
+            log(head)
+            head = ""
+        if plan["noop"]:
+            self.manifests.save(target, remote, time.time())
+            self.record_sync(started, "", True, transferred=0, result="skipped")
+            return 0, head + "nothing to sync\n"
+        code, out, transferred = 0, "", 0
+        if plan.get("evict"):
+            # avant les transferts : libere la place
+            failed = self.cache.evict(plan["evict"])
+            out += f"evicted {len(plan['evict']) - len(failed)} local file(s)\n"
+            out += "".join(f"evict failed: {f}\n" for f in failed)
+        pending = plan["copy"]
+        if pending and self.lan is not None and self.lan.enabled():
+            # pairs du LAN d'abord (verifies par hash), le remote pour le reste
+            fetched, lan_out, _ = self.lan.fetch(pending, remote, log)
+            out += lan_out
+            done = set(fetched)
+            pending = [p for p in pending if p not in done]
+        if pending:
+            list_path = os.path.join(self.log_dir, "sync_files.txt")
+            with open(list_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(pending) + "\n")
+            code, copied, transferred = self._copy_files(rc, target, list_path, log)
+            out += copied
+        if code == 0 and plan["delete"]:
+            failed = sync_plan.remove_local(self.video_dir, plan["delete"])
+            out += f"deleted {len(plan['delete']) - len(failed)} local file(s)\n"
+            out += "".join(f"delete failed: {f}\n" for f in failed)
+        if code == 0:
+            self.manifests.save(target, remote, time.time())
+        self.record_sync(started, "", code == 0, transferred=transferred)
+        return code, head + out
+
+    def _copy_files(self, rc: str, target: str, list_path: str,
+                    log: Optional[Callable[[str], Any]] = None) -> Tuple[int, str, int]:
+        """Copy only the paths listed in `list_path`; (returncode, output, bytes)."""
+        client = self.rcd()
+        if client is None:
+            cmd = [rc, "copy", target, self.video_dir, "--files-from-raw", list_path, "--no-traverse",
+                   "--stats", "30s", "--stats-log-level", "NOTICE"]
+            code, out, full = self._stream(cmd, log)
+            return code, out, self.transferred_bytes(full)
+        try:
+            # meme borne que le CLI : job/stop a l'expiration, le slot exclusif du JobRunner se libere
+            status = client.copy(target, self.video_dir, files_from=list_path, config={"NoTraverse": True},
+                                 on_stats=lambda st: setattr(self, "live_stats", st), timeout=SYNC_TIMEOUT)
+        except RcdError as e:
+            return 1, f"rcd copy error: {e}\n", 0
+        finally:
+            self.live_stats = None
+        stats = status.get("stats") or {}
+        ok = bool(status.get("success"))
+        out = f"rcd job {status.get('id')}: success={ok} transfers={stats.get('transfers')} bytes={stats.get('bytes')}\n"
+        if status.get("error"):
+            out += f"error: {status['error']}\n"
+        return (0 if ok else 1), out, int(stats.get("bytes") or 0)
+
+    def _full_sync(self, rc: str, target: str, started: float,
+                   log: Optional[Callable[[str], Any]] = None) -> Tuple[int, str]:
+        client = self.rcd()
+        if client is None:
+            code, out, full = self._stream(self.sync_cmd(rc, target), log)
+            self.record_sync(started, full, code == 0)
+            return code, out
+        try:
+            # UseListR = --fast-list ; le daemon garde son cache de repertoires entre deux syncs
+            status = client.sync(target, self.video_dir, config={"UseListR": True},
+                                 on_stats=lambda st: setattr(self, "live_stats", st), timeout=SYNC_TIMEOUT)
+        except RcdError as e:
+            self.record_sync(started, "", False)
+            return 1, f"rcd sync error: {e}\n"
+        finally:
+            self.live_stats = None
+        stats = status.get("stats") or {}
+        ok = bool(status.get("success"))
+        out = (f"rcd job {status.get('id')}: success={ok} duration={status.get('duration')}s "
+               f"transfers={stats.get('transfers')} bytes={stats.get('bytes')} errors={stats.get('errors')}\n")
+        if status.get("error"):
+            out += f"error: {status['error']}\n"
+        self.record_sync(started, "", ok, transferred=int(stats.get("bytes") or 0))
+        return (0 if ok else 1), out
+
+    # ----- API-like operations -----
+    # ----- cached state -----
+    def _state_key(self, rc: Optional[str]) -> tuple:
+        return (rc, self._mtime_ns(rc), self._mtime_ns(self.rclone_conf_path()))
+
+    def refresh_state(self, job: Optional[Job] = None) -> Dict[str, Any]:
+        """Run `rclone version` + `rclone listremotes` and cache the result (blocking)."""
+        rc = self.which_rclone()
+        key = self._state_key(rc)
+        state: Dict[str, Any] = {"key": key, "version": None, "remotes": [], "at": time.time()}
+        client = self.rcd() if rc else None
+        if client is not None:
+            try:
+                state["version"] = client.version()
+                state["remotes"] = client.list_remotes()
+                rc = None  # rien a faire cote CLI
+            except RcdError as e:
+                _svc_logger.warning("rcd state failed, using the CLI: %s", e)
+        if rc:
+            code, out = self._exec([rc, "version"], 30, job)
+            if code == 0 and out:
+                state["version"] = out.splitlines()[0]
+            else:
+                _svc_logger.warning("rclone version failed: %s", out.strip()[:200])
+            code, out = self._exec([rc, "listremotes"], 30, job)
+            if code == 0:
+                state["remotes"] = [x.strip().rstrip(":") for x in out.splitlines() if x.strip()]
+            else:
+                _svc_logger.warning("rclone listremotes failed: %s", out.strip()[:200])
+        with self._state_lock:
+            self._state = state
+        return state
+
+    def _fresh_state(self) -> Optional[Dict[str, Any]]:
+        st = self._state
+        if st is not None and st["key"] == self._state_key(self.which_rclone()):
+            return st
+        return None
+
+    def state(self) -> Dict[str, Any]:
+        """Cached binary/version/remotes, never blocking; a stale cache is refreshed in background."""
+        rc = self.which_rclone()
+        st, fresh = self._state, self._fresh_state()
+        if fresh is None and rc:
+            self.jobs.submit("state", lambda job: {"ok": bool(self.refresh_state(job))})
+        return {
+            "which": rc,
+            "version": st["version"] if st else None,
+            "remotes": list(st["remotes"]) if st else [],
+            "stale": fresh is None,
+            "pending": fresh is None and rc is not None and self.jobs.active("state") is not None,
+        }
 
-    def install(self) -> Tuple[bool, str]:
+    def check(self) -> dict:
+        return self.state()
+
+    def install(self, job: Optional[Job] = None) -> Tuple[bool, str]:
         # Best effort: run upstream install script; requires sudo when called under system user.
         # Caller should handle permissions/UX.
-        try:
-            p = subprocess.run(
-                ["bash", "-lc", "curl -fsSL https://rclone.org/install.sh | sudo bash"],
-                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
-            )
-            return (p.returncode == 0), p.stdout or ""
-        except Exception as e:
-            return False, f"install error: {e}"
+        code, out = self._exec(["bash", "-lc", "curl -fsSL https://rclone.org/install.sh | sudo bash"], 600, job)
+        self._forget_binary()
+        return code == 0, out
 
     def save_settings(self, remote_name: Optional[str], remote_folder: Optional[str]) -> dict:
         data = {}
@@ -80,7 +411,8 @@ class RcloneService:
             data["remote_folder"] = remote_folder
         return self._settings.set(**data)
 
-    def create_remote(self, remote_name: str, token_json: str, scope: str = "drive") -> Tuple[bool, str]:
+    def create_remote(self, remote_name: str, token_json: str, scope: str = "drive",
+                      job: Optional[Job] = None) -> Tuple[bool, str]:
         rc = self.which_rclone()
         if not rc:
             return False, "rclone non installé"
@@ -92,17 +424,26 @@ class RcloneService:
         # Configure via `rclone config create` with pre-authorized token
         name = (remote_name or "gdrive").strip()
         args = [rc, "config", "create", name, scope, "token", json.dumps(token)]
-        p = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=self.rclone_base_env(), timeout=60)
-        ok = (p.returncode == 0)
-        return ok, p.stdout or ""
+        code, out = self._exec(args, 60, job)
+        return code == 0, out
 
-    def test_list(self, remote_name: str, remote_folder: str) -> Tuple[bool, str]:
+    def test_list(self, remote_name: str, remote_folder: str, job: Optional[Job] = None) -> Tuple[bool, str]:
         rc = self.which_rclone()
         if not rc:
             return False, "rclone non installé"
         target = f"{remote_name}:{remote_folder}" if remote_folder else f"{remote_name}:"
-        p = subprocess.run([rc, "lsd", target], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=self.rclone_base_env(), timeout=60)
-        return (p.returncode == 0), (p.stdout or "")
+        client = self.rcd()
+        if client is not None:
+            try:
+                entries = client.list(target, dirs_only=True)
+            except RcdError as e:
+                return False, f"{e}\n"
+            out = "".join(f"{e.get('ModTime', '')[:19]} {e.get('Path')}\n" for e in entries)
+            if job is not None and out:
+                job.log(out.rstrip("\n"))
+            return True, out
+        code, out = self._exec([rc, "lsd", target], 60, job)
+        return code == 0, out
 
     def sync_async(self, remote_name: str, remote_folder: str) -> None:
         rc = self.which_rclone()
@@ -113,12 +454,11 @@ class RcloneService:
 
         def _run():
             try:
-                with open(self.log_path, "a", encoding="utf-8") as fh:
+                with open(self.log_path, "a", encoding="utf-8", buffering=1) as fh:
                     fh.write(f"\n--- sync started {time.ctime()} ---\n")
-                    cmd = [rc, "sync", target, self.video_dir, "--delete-during", "--fast-list"]
-                    p = subprocess.Popen(cmd, stdout=fh, stderr=subprocess.STDOUT, env=self.rclone_base_env())
-                    p.communicate()
-                    fh.write(f"--- sync finished {time.ctime()} exit={p.returncode} ---\n")
+                    code, out = self.run_sync(rc, target, log=fh.write)
+                    fh.write(out)
+                    fh.write(f"--- sync finished {time.ctime()} exit={code} ---\n")
             except Exception as e:
                 try:
                     with open(self.log_path, "a", encoding="utf-8") as fh:
@@ -127,7 +467,7 @@ class RcloneService:
                     pass
 
         import threading
-        threading.Thread(target=_run, daemon=True).start()
+        threading.Thread(target=_run, name="rclone-sync", daemon=True).start()
 
     def sync_blocking(self, remote_name: str, remote_folder: str) -> Tuple[bool, int]:
         """Run rclone sync blocking and log to the service log path.
@@ -138,12 +478,12 @@ class RcloneService:
         os.makedirs(self.log_dir, exist_ok=True)
         target = f"{remote_name}:{remote_folder}" if remote_folder else f"{remote_name}:"
         try:
-            with open(self.log_path, "a", encoding="utf-8") as fh:
+            with open(self.log_path, "a", encoding="utf-8", buffering=1) as fh:
                 fh.write(f"\n--- sync started {time.ctime()} ---\n")
-                cmd = [rc, "sync", target, self.video_dir, "--delete-during", "--fast-list"]
-                p = subprocess.run(cmd, stdout=fh, stderr=subprocess.STDOUT, text=True, env=self.rclone_base_env())
-                fh.write(f"--- sync finished {time.ctime()} exit={p.returncode} ---\n")
-                return (p.returncode == 0), p.returncode
+                code, out = self.run_sync(rc, target, log=fh.write)
+                fh.write(out)
+                fh.write(f"--- sync finished {time.ctime()} exit={code} ---\n")
+                return code == 0, code
         except Exception:
             try:
                 with open(self.log_path, "a", encoding="utf-8") as fh:
@@ -163,34 +503,37 @@ class RcloneService:
         banner = f"--- boot sync {time.ctime()} -> {target} ---\n"
         ok = False
         try:
-            with open(self.log_path, "a", encoding="utf-8") as fh:
+            with open(self.log_path, "a", encoding="utf-8", buffering=1) as fh:
                 fh.write(banner)
-                p = subprocess.run([rc, "sync", target, self.video_dir, "--delete-during", "--fast-list"],
-                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=self.rclone_base_env())
-                fh.write(p.stdout or "")
-                fh.write(f"--- boot sync done rc={p.returncode} ---\n")
-                ok = (p.returncode == 0)
+                code, out = self.run_sync(rc, target, log=fh.write)
+                fh.write(out)
+                fh.write(f"--- boot sync done rc={code} ---\n")
+                ok = (code == 0)
         except Exception as e:
             with open(self.log_path, "a", encoding="utf-8") as fh:
                 fh.write(f"ERROR boot sync: {type(e).__name__}: {e}\n")
         return ok, ("OK" if ok else "Échec")
 
-    def delete_remote(self, remote_name: str) -> Tuple[bool, str]:
+    def delete_remote(self, remote_name: str, job: Optional[Job] = None) -> Tuple[bool, str]:
         rc = self.which_rclone()
         if not rc:
             return False, "rclone non installé"
-        p = subprocess.run([rc, "config", "delete", remote_name], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=self.rclone_base_env(), timeout=60)
-        return (p.returncode == 0), (p.stdout or "")
+        client = self.rcd()
+        if client is not None:
+            try:
+                client.config_delete(remote_name)
+                return True, ""
+            except RcdError as e:
+                return False, f"{e}\n"
+        code, out = self._exec([rc, "config", "delete", remote_name], 60, job)
+        return code == 0, out
 
     def list_remotes(self) -> List[str]:
-        rc = self.which_rclone()
-        if not rc:
-            return []
-        try:
-            out = subprocess.check_output([rc, "listremotes"], text=True, env=self.rclone_base_env())
-            return [x.strip().rstrip(":") for x in out.splitlines() if x.strip()]
-        except Exception:
+        """Remote names (cache, refreshed synchronously when rclone.conf changed)."""
+        if not self.which_rclone():
             return []
+        st = self._fresh_state() or self.refresh_state()
+        return list(st["remotes"])
 
     def create_or_update_remote(
         self,
@@ -199,6 +542,7 @@ class RcloneService:
         scope: str = "drive",
         client_id: Optional[str] = None,
         client_secret: Optional[str] = None,
+        job: Optional[Job] = None,
     ) -> Tuple[bool, str]:
         """Create or update a Drive remote using a pre-authorized token JSON.
         Mirrors legacy behavior (create if missing, otherwise update).
@@ -216,6 +560,19 @@ class RcloneService:
         existing = set(self.list_remotes())
         exists = rn in existing
 
+        client = self.rcd()
+        if client is not None:
+            params = {"scope": scope, "token": token_min}
+            if client_id:
+                params["client_id"] = client_id
+            if client_secret:
+                params["client_secret"] = client_secret
+            try:
+                reply = client.config_update(rn, params) if exists else client.config_create(rn, "drive", params)
+                return True, json.dumps(reply) if reply else ""
+            except RcdError as e:
+                return False, f"{e}\n"
+
         base = [rc, "config", "update" if exists else "create", "--non-interactive", "--auto-confirm", rn]
         if not exists:
             base.append("drive")
@@ -225,19 +582,16 @@ class RcloneService:
         if client_secret:
             kv.append(f"client_secret={client_secret}")
 
-        p = subprocess.run(base + kv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
-                           env=self.rclone_base_env(), timeout=180)
-        if p.returncode == 0:
-            return True, (p.stdout or "")
+        code, out = self._exec(base + kv, 180, job)
+        if code == 0:
+            return True, out
 
         # If create failed because it exists, try update once
-        msg = (p.stdout or "").lower()
+        msg = out.lower()
         if not exists and ("exist" in msg or "already" in msg):
-            p2 = subprocess.run([rc, "config", "update", "--non-interactive", "--auto-confirm", rn] + kv,
-                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
-                                env=self.rclone_base_env(), timeout=120)
-            return (p2.returncode == 0), (p2.stdout or "")
-        return False, (p.stdout or "")
+            code, out = self._exec([rc, "config", "update", "--non-interactive", "--auto-confirm", rn] + kv, 120, job)
+            return code == 0, out
+        return False, out
 
     def tail_log(self, tail: int = 200) -> str:
         if not os.path.isfile(self.log_path):
@@ -0,0 +1,208 @@
+import base64
+import http.client
+import json
+import os
+import secrets
+import socket
+import subprocess
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from flask import current_app
+    _svc_logger = current_app.logger
+except Exception:
+    _svc_logger = logging.getLogger('rpi_avp')
+
+
+START_TIMEOUT = 15.0     # s pour que rcd reponde a rc/noop
+CALL_TIMEOUT = 120.0
+POLL_INTERVAL = 1.0      # job/status + core/stats pendant un sync (0.1 s au debut, puis x2)
+
+
+class RcdError(RuntimeError):
+    pass
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class RcdClient:
+    """
+    One long-lived `rclone rcd` bound to 127.0.0.1, driven over its HTTP API.
+
+    The daemon reads rclone.conf and authenticates with remotes once, then
+    keeps its directory cache across operations; requests reuse a single
+    keep-alive HTTP connection. Credentials are random per start (HTTP basic
+    auth) and passed through the environment, not argv, so other local
+    users cannot read them from `ps` and drive the daemon.
+
+    Calls raise RcdError on transport failure or an rclone error reply.
+    """
+
+    def __init__(self, rc_path: str, env: Optional[dict] = None, log_path: Optional[str] = None,
+                 extra_args: Optional[List[str]] = None) -> None:
+        self.rc_path = rc_path
+        self.env = env
+        self.log_path = log_path
+        self.extra_args = list(extra_args or [])
+        self.port: Optional[int] = None
+        self._proc: Optional[subprocess.Popen] = None
+        self._auth = ""
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._lock = threading.Lock()
+        self.started_at: Optional[float] = None
+
+    # ----- lifecycle -----
+    @property
+    def running(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self) -> None:
+        """Start the daemon (idempotent) and wait until it answers."""
+        if self.running:
+            return
+        self.port = _free_port()
+        user, password = "avp", secrets.token_urlsafe(16)
+        self._auth = "Basic " + base64.b64encode(f"{user}:{password}".encode()).decode()
+        cmd = [self.rc_path, "rcd", f"--rc-addr=127.0.0.1:{self.port}"] + self.extra_args
+        env = dict(self.env if self.env is not None else os.environ, RCLONE_RC_USER=user, RCLONE_RC_PASS=password)
+        log = open(self.log_path, "a", encoding="utf-8") if self.log_path else subprocess.DEVNULL
+        try:
+            self._proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, env=env)
+        finally:
+            if log is not subprocess.DEVNULL:
+                log.close()
+        deadline = time.monotonic() + START_TIMEOUT
+        while True:
+            try:
+                self.call("rc/noop", timeout=2.0)
+                break
+            except RcdError as e:
+                if not self.running or time.monotonic() > deadline:
+                    self.stop()
+                    raise RcdError(f"rclone rcd did not start: {e}")
+                time.sleep(0.2)
+        self.started_at = time.time()
+        _svc_logger.info("rclone rcd listening on 127.0.0.1:%d", self.port)
+
+    def stop(self) -> None:
+        proc, self._proc = self._proc, None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        if proc is not None and proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    # ----- transport -----
+    def call(self, method: str, timeout: float = CALL_TIMEOUT, **params: Any) -> Dict[str, Any]:
+        """POST /<method> with JSON `params`; returns the decoded reply."""
+        if self.port is None:
+            raise RcdError("rcd not started")
+        body = json.dumps(params).encode()
+        headers = {"Content-Type": "application/json", "Authorization": self._auth}
+        with self._lock:
+            for attempt in (1, 2):
+                if self._conn is None:
+                    self._conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=timeout)
+                self._conn.timeout = timeout
+                try:
+                    self._conn.request("POST", "/" + method, body=body, headers=headers)
+                    resp = self._conn.getresponse()
+                    raw = resp.read()
+                    break
+                except (OSError, http.client.HTTPException) as e:
+                    # connexion keep-alive fermee cote serveur : une seconde tentative
+                    self._conn.close()
+                    self._conn = None
+                    if attempt == 2:
+                        raise RcdError(f"{method}: {type(e).__name__}: {e}")
+        try:
+            data = json.loads(raw.decode() or "{}")
+        except ValueError:
+            data = {"error": raw.decode(errors="replace")[:200]}
+        if resp.status != 200:
+            raise RcdError(f"{method}: {data.get('error') or resp.status}")
+        return data
+
+    # ----- operations -----
+    def version(self) -> Optional[str]:
+        return self.call("core/version").get("version")
+
+    def list_remotes(self) -> List[str]:
+        return list(self.call("config/listremotes").get("remotes") or [])
+
+    def list(self, fs: str, remote: str = "", recurse: bool = False, dirs_only: bool = False,
+             hash_types: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        opt: Dict[str, Any] = {"recurse": recurse, "dirsOnly": dirs_only}
+        if hash_types:
+            opt.update(showHash=True, hashTypes=hash_types)
+        return list(self.call("operations/list", fs=fs, remote=remote, opt=opt).get("list") or [])
+
+    def config_create(self, name: str, type_: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        return self.call("config/create", name=name, type=type_, parameters=parameters,
+                         opt={"nonInteractive": True, "obscure": True})
+
+    def config_update(self, name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        return self.call("config/update", name=name, parameters=parameters,
+                         opt={"nonInteractive": True, "obscure": True})
+
+    def config_delete(self, name: str) -> None:
+        self.call("config/delete", name=name)
+
+    def stats(self, group: Optional[str] = None) -> Dict[str, Any]:
+        return self.call("core/stats", **({"group": group} if group else {}))
+
+    def sync(self, src: str, dst: str, config: Optional[Dict[str, Any]] = None,
+             on_stats: Optional[Callable[[Dict[str, Any]], None]] = None,
+             timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        sync/sync as an async rcd job, polled until done; `on_stats` gets
+        the live core/stats of the job. Returns job/status + final stats.
+        """
+        return self._transfer("sync/sync", src, dst, config, None, on_stats, timeout)
+
+    def copy(self, src: str, dst: str, files_from: Optional[str] = None,
+             config: Optional[Dict[str, Any]] = None,
+             on_stats: Optional[Callable[[Dict[str, Any]], None]] = None,
+             timeout: Optional[float] = None) -> Dict[str, Any]:
+        """sync/copy, restricted to the paths listed in `files_from` (one per line) if given."""
+        flt = {"FilesFromRaw": [files_from]} if files_from else None
+        return self._transfer("sync/copy", src, dst, config, flt, on_stats, timeout)
+
+    def _transfer(self, method: str, src: str, dst: str, config: Optional[Dict[str, Any]],
+                  flt: Optional[Dict[str, Any]], on_stats, timeout: Optional[float]) -> Dict[str, Any]:
+        params: Dict[str, Any] = {"srcFs": src, "dstFs": dst, "_async": True}
+        if config:
+            params["_config"] = config
+        if flt:
+            params["_filter"] = flt
+        jobid = self.call(method, **params)["jobid"]
+        group = f"job/{jobid}"
+        started = time.monotonic()
+        delay = 0.1  # un sync sans changement finit en quelques centaines de ms
+        while True:
+            time.sleep(delay)
+            delay = min(POLL_INTERVAL, delay * 2)
+            status = self.call("job/status", jobid=jobid)
+            stats = self.stats(group)
+            if on_stats is not None:
+                on_stats(stats)
+            if status.get("finished"):
+                return dict(status, stats=stats)
+            if timeout is not None and time.monotonic() - started > timeout:
+                try:
+                    self.call("job/stop", jobid=jobid)
+                except RcdError as e:
+                    _svc_logger.warning("rcd: job/stop %s failed: %s", jobid, e)
+                raise RcdError(f"sync timeout after {timeout:.0f}s")
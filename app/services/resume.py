@@ -0,0 +1,182 @@
+import json
+import os
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, Optional
+
+try:
+    from flask import current_app
+    _svc_logger = current_app.logger
+except Exception:
+    _svc_logger = logging.getLogger('rpi_avp')
+
+
+DEFAULT_INTERVAL = 15.0   # s entre deux checkpoints pendant la lecture
+END_MARGIN_MS = 3000      # checkpoint a moins de 3 s de la fin = media suivant
+CONFIG_INTERVAL = 5.0     # s entre deux relectures des settings (appele a chaque TimeChanged)
+
+
+class ResumeStore:
+    """
+    Playback checkpoint (item + position) that survives restarts and power cuts.
+
+    Position events from the player backend only update an in-memory
+    record; a writer thread persists it at most every `interval` seconds
+    (immediately on item change, pause or stop). Each write is a ~150-byte
+    tmp file + fsync + rename, so a power cut leaves either the previous or
+    the new checkpoint, never a torn one, for a few SD writes per minute.
+
+    The item is identified by its path relative to VIDEO_DIR plus size and
+    mtime, so a file replaced by a sync is not resumed mid-way.
+
+    Settings used:
+      - resume_on_boot: bool (default True)
+      - resume_interval: float seconds (default 15)
+    """
+
+    def __init__(self, settings_service, file_path: str, video_dir: str) -> None:
+        self._settings = settings_service
+        self.file_path = file_path
+        self.video_dir = video_dir
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._record: Optional[Dict[str, Any]] = None
+        self._dirty = False
+        self._urgent = False
+        self._last_write = 0.0
+        self._writes = 0
+        self._thread: Optional[threading.Thread] = None
+        self._current: Callable[[], Optional[str]] = lambda: None
+        self._length: Callable[[], int] = lambda: 0
+        self._cfg: Dict[str, Any] = {}
+        self._cfg_at = float("-inf")
+
+    def config(self, refresh: bool = False) -> Dict[str, Any]:
+        """Settings re-read at most every CONFIG_INTERVAL (the store reads the JSON file)."""
+        if refresh or time.monotonic() - self._cfg_at >= CONFIG_INTERVAL:
+            try:
+                interval = max(1.0, float(self._settings.get("resume_interval", DEFAULT_INTERVAL)))
+            except (TypeError, ValueError):
+                interval = DEFAULT_INTERVAL
+            self._cfg = {"enabled": bool(self._settings.get("resume_on_boot", True)), "interval": interval}
+            self._cfg_at = time.monotonic()
+        return self._cfg
+
+    def enabled(self) -> bool:
+        return self.config()["enabled"]
+
+    def interval(self) -> float:
+        return self.config()["interval"]
+
+    # ----- capture -----
+    def attach(self, backend, current: Callable[[], Optional[str]]) -> None:
+        """Follow `backend` events; `current()` gives the loaded item (relative path)."""
+        self._current = current
+        self._length = backend.get_length
+        backend.on_position(self._on_position)
+        backend.on_state_change(self._on_state)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._writer, name="resume-writer", daemon=True)
+            self._thread.start()
+
+    def _on_position(self, ms: int) -> None:
+        media = self._current()
+        if media is None:
+            return
+        with self._lock:
+            rec = self._record
+            changed = rec is None or rec["media"] != media
+            if changed:
+                rec = self._record = self._identity(media)
+            rec["position_ms"] = int(ms)
+            self._dirty = True
+            self._urgent = self._urgent or changed
+        if changed or time.monotonic() - self._last_write >= self.interval():
+            self._wake.set()
+
+    def _on_state(self, state: str) -> None:
+        if state in ("paused", "stopped") and self._dirty:
+            self._urgent = True
+            self._wake.set()
+
+    def _identity(self, media: str) -> Dict[str, Any]:
+        rec: Dict[str, Any] = {"media": media, "position_ms": 0, "size": None, "mtime": None, "length_ms": 0}
+        try:
+            st = os.stat(os.path.join(self.video_dir, media))
+            rec["size"], rec["mtime"] = st.st_size, int(st.st_mtime)
+        except OSError:
+            pass
+        return rec
+
+    # ----- persistence -----
+    def _writer(self) -> None:
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            wait = self.interval() - (time.monotonic() - self._last_write)
+            if not self._urgent and wait > 0:
+                time.sleep(wait)  # limite le nombre d'ecritures sur la carte SD
+            self.flush()
+
+    def flush(self) -> bool:
+        with self._lock:
+            if not self._dirty or self._record is None:
+                return False
+            rec = dict(self._record, saved_at=int(time.time()))
+            self._dirty = self._urgent = False
+        if not rec["length_ms"]:
+            try:
+                rec["length_ms"] = int(self._length() or 0)
+                with self._lock:
+                    if self._record is not None and self._record["media"] == rec["media"]:
+                        self._record["length_ms"] = rec["length_ms"]
+            except Exception:
+                pass
+        self._last_write = time.monotonic()
+        try:
+            os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+            tmp = self.file_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(rec, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.file_path)
+            self._writes += 1
+            return True
+        except OSError as e:
+            _svc_logger.warning("resume checkpoint failed: %s", e)
+            return False
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                return json.load(f) or None
+        except (OSError, ValueError):
+            return None
+
+    # ----- boot -----
+    def resume_point(self) -> Optional[Dict[str, Any]]:
+        """
+        Checkpoint to resume from, or None (disabled, missing, file changed).
+        `position_ms` is 0 and `advance` True when it was saved near the end.
+        """
+        if not self.enabled():
+            return None
+        rec = self.load()
+        if not rec or not rec.get("media"):
+            return None
+        current = self._identity(rec["media"])
+        if current["size"] is None:
+            return None
+        if rec.get("size") is not None and (rec["size"], rec.get("mtime")) != (current["size"], current["mtime"]):
+            return None  # remplace entre-temps (sync) : on ne reprend pas au milieu
+        pos, length = int(rec.get("position_ms") or 0), int(rec.get("length_ms") or 0)
+        advance = bool(length) and pos >= length - END_MARGIN_MS
+        return {"media": rec["media"], "position_ms": 0 if advance else max(0, pos), "advance": advance}
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            rec = dict(self._record) if self._record else None
+        return {"enabled": self.enabled(), "interval": self.interval(), "current": rec,
+                "saved": self.load(), "writes": self._writes}
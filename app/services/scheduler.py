@@ -1,7 +1,279 @@
+import os
+import threading
 import logging
+from datetime import datetime, time as dtime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
 try:
     from flask import current_app
     _svc_logger = current_app.logger
 except Exception:
     _svc_logger = logging.getLogger('rpi_avp')
 
+
+DAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+SWITCH_MODES = ("end", "exact")
+DEFAULT_PREWARM = 30.0       # s avant le changement
+PREWARM_BYTES = 8 << 20      # debut du fichier lu en cache page
+MAX_SLEEP = 3600.0           # re-planification au moins toutes les heures (sauts d'horloge, DST)
+HORIZON_DAYS = 8
+
+
+def _parse_time(value: str) -> dtime:
+    try:
+        hh, mm = str(value).strip().split(":", 1)
+        return dtime(int(hh) % 24, int(mm))
+    except (ValueError, TypeError):
+        raise ValueError(f"heure invalide: {value!r} (HH:MM)")
+
+
+def _parse_days(value: Any) -> List[int]:
+    """'mon-fri', 'sat,sun', ['mon', 2], None (= tous les jours) -> [0..6]."""
+    if value in (None, "", "*", "all"):
+        return list(range(7))
+    parts = value if isinstance(value, list) else str(value).split(",")
+    days: List[int] = []
+    for part in parts:
+        if isinstance(part, int):
+            days.append(part % 7)
+            continue
+        part = str(part).strip().lower()
+        if "-" in part:
+            a, b = (DAY_NAMES.index(x.strip()[:3]) for x in part.split("-", 1))
+            days.extend(range(a, b + 1) if a <= b else list(range(a, 7)) + list(range(0, b + 1)))
+        else:
+            try:
+                days.append(DAY_NAMES.index(part[:3]))
+            except ValueError:
+                raise ValueError(f"jour invalide: {part!r}")
+    return sorted(set(days))
+
+
+class SchedulerService:
+    """
+    Time-of-day playlist scheduling.
+
+    Settings used (settings.json):
+      - schedule: {
+          "rules": [{"playlist": "morning", "days": "mon-fri",
+                     "start": "07:00", "end": "12:00", "switch": "end"}],
+          "default": "all",          # playlist outside any rule
+          "prewarm_seconds": 30
+        }
+        The first matching rule wins; end < start wraps past midnight.
+        switch = 'end' waits for the current video to finish, 'exact' cuts
+        at the boundary.
+
+    One thread sleeps until the next precomputed change (no per-minute
+    polling). `prewarm_seconds` before it, the new playlist's first item
+    is picked and its head read into the page cache. At the boundary the
+    playlist is activated; `on_switch(name, exact)` lets the caller cut
+    the current video.
+    """
+
+    def __init__(self, settings_service, playlist_service, video_dir: str,
+                 now: Callable[[], datetime] = datetime.now) -> None:
+        self._settings = settings_service
+        self._playlists = playlist_service
+        self.video_dir = video_dir
+        self._now = now
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._library: Callable[[], Sequence[str]] = lambda: []
+        self._on_switch: Optional[Callable[[str, bool], None]] = None
+        self._last_switch: Optional[Dict[str, Any]] = None
+        self._prewarmed: Optional[Dict[str, Any]] = None
+
+    # ----- configuration -----
+    def config(self) -> Dict[str, Any]:
+        cfg = self._settings.get("schedule") or {}
+        return {
+            "rules": cfg.get("rules") or [],
+            "default": cfg.get("default") or "all",
+            "prewarm_seconds": float(cfg.get("prewarm_seconds", DEFAULT_PREWARM)),
+        }
+
+    @staticmethod
+    def _compile(rules: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        out = []
+        for i, r in enumerate(rules):
+            if not r.get("playlist"):
+                raise ValueError(f"regle {i}: playlist manquante")
+            switch = (r.get("switch") or "end").lower()
+            if switch not in SWITCH_MODES:
+                raise ValueError(f"regle {i}: switch doit etre 'end' ou 'exact'")
+            out.append({
+                "playlist": str(r["playlist"]),
+                "days": _parse_days(r.get("days")),
+                "start": _parse_time(r.get("start", "00:00")),
+                "end": _parse_time(r.get("end", "00:00")),
+                "switch": switch,
+            })
+        return out
+
+    def save(self, rules: List[Dict[str, Any]], default: Optional[str] = None,
+             prewarm_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """Validate and persist the schedule, then re-plan. Raises ValueError."""
+        self._compile(rules)
+        cfg = self.config()
+        cfg["rules"] = rules
+        if default is not None:
+            cfg["default"] = default
+        if prewarm_seconds is not None:
+            cfg["prewarm_seconds"] = max(0.0, float(prewarm_seconds))
+        self._settings.set(schedule=cfg)
+        self._wake.set()
+        return cfg
+
+    # ----- evaluation -----
+    @staticmethod
+    def _matches(rule: Dict[str, Any], at: datetime) -> bool:
+        t, day = at.time(), at.weekday()
+        start, end = rule["start"], rule["end"]
+        if start < end:
+            return day in rule["days"] and start <= t < end
+        # passe minuit (ou 24 h si start == end)
+        return (day in rule["days"] and t >= start) or ((day - 1) % 7 in rule["days"] and t < end)
+
+    def resolve(self, at: datetime, rules: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Rule active at `at` (or the default playlist)."""
+        cfg = self.config()
+        rules = self._compile(cfg["rules"]) if rules is None else rules
+        for rule in rules:
+            if self._matches(rule, at):
+                return {"playlist": rule["playlist"], "switch": rule["switch"]}
+        return {"playlist": cfg["default"], "switch": "end"}
+
+    def next_change(self, at: datetime) -> Optional[Dict[str, Any]]:
+        """First boundary after `at` where the resolved playlist changes."""
+        try:
+            rules = self._compile(self.config()["rules"])
+        except ValueError as e:
+            _svc_logger.warning("schedule invalide: %s", e)
+            return None
+        if not rules:
+            return None
+        current = self.resolve(at, rules)["playlist"]
+        boundaries = set()
+        day0 = at.date()
+        for offset in range(HORIZON_DAYS):
+            day = day0 + timedelta(days=offset)
+            for rule in rules:
+                for t in (rule["start"], rule["end"]):
+                    b = datetime.combine(day, t)
+                    if b > at:
+                        boundaries.add(b)
+        for b in sorted(boundaries):
+            target = self.resolve(b, rules)
+            if target["playlist"] != current:
+                return dict(target, at=b)
+        return None
+
+    # ----- runtime -----
+    def start(self, library: Callable[[], Sequence[str]],
+              on_switch: Optional[Callable[[str, bool], None]] = None) -> None:
+        """Start the planning thread (idempotent)."""
+        with self._lock:
+            self._library = library
+            self._on_switch = on_switch
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+            self._thread.start()
+
+    def _sleep_until(self, when: datetime) -> bool:
+        """True if `when` was reached, False if woken early (rules changed)."""
+        while True:
+            remaining = (when - self._now()).total_seconds()
+            if remaining <= 0:
+                return True
+            if self._wake.wait(min(remaining, MAX_SLEEP)):
+                self._wake.clear()
+                return False
+
+    def _run(self) -> None:
+        applied = False
+        realign = True  # au demarrage et apres modification des regles seulement
+        while True:
+            now = self._now()
+            if realign and self.config()["rules"]:
+                try:
+                    current = self.resolve(now)["playlist"]
+                except ValueError as e:
+                    _svc_logger.warning("schedule invalide: %s", e)
+                    current = None
+                if current and current != self._playlists.active_name():
+                    # demarrage / regles modifiees : on s'aligne sans couper la video
+                    self._activate(current, exact=False, announce=applied)
+                applied = True
+            realign = False
+            nxt = self.next_change(now)
+            if nxt is None:
+                realign = self._wake.wait(MAX_SLEEP)
+                self._wake.clear()
+                continue
+            prewarm_at = nxt["at"] - timedelta(seconds=self.config()["prewarm_seconds"])
+            if prewarm_at > now and not self._sleep_until(prewarm_at):
+                realign = True
+                continue
+            self._prewarm(nxt["playlist"])
+            if not self._sleep_until(nxt["at"]):
+                realign = True
+                continue
+            self._activate(nxt["playlist"], exact=(nxt["switch"] == "exact"), announce=True)
+
+    def _activate(self, name: str, exact: bool, announce: bool) -> None:
+        try:
+            self._playlists.activate(name, restart=True)
+        except KeyError:
+            _svc_logger.warning("schedule: playlist %r inconnue", name)
+            return
+        self._last_switch = {"playlist": name, "at": self._now().isoformat(timespec="seconds"), "exact": exact}
+        _svc_logger.info("schedule: playlist -> %s (%s)", name, "exact" if exact else "fin de video")
+        if announce and self._on_switch is not None:
+            try:
+                self._on_switch(name, exact)
+            except Exception as e:
+                _svc_logger.warning("schedule switch callback failed: %s", e)
+
+    def _prewarm(self, name: str) -> None:
+        """Reserve the first item of `name` and pull its head into the page cache."""
+        try:
+            item = self._playlists.first_item(name, list(self._library()))
+        except Exception as e:
+            _svc_logger.warning("schedule prewarm failed: %s", e)
+            return
+        if not item:
+            return
+        path = os.path.join(self.video_dir, item)
+        warmed = 0
+        try:
+            with open(path, "rb") as f:
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), 0, PREWARM_BYTES, os.POSIX_FADV_WILLNEED)
+                while warmed < PREWARM_BYTES:
+                    chunk = f.read(1 << 20)
+                    if not chunk:
+                        break
+                    warmed += len(chunk)
+        except OSError as e:
+            _svc_logger.warning("schedule prewarm %s: %s", item, e)
+        self._prewarmed = {"playlist": name, "item": item, "bytes": warmed}
+
+    def status(self) -> Dict[str, Any]:
+        cfg = self.config()
+        now = self._now()
+        nxt = self.next_change(now)
+        try:
+            current = self.resolve(now) if cfg["rules"] else None
+        except ValueError as e:
+            current = {"error": str(e)}
+        return dict(
+            cfg,
+            running=self._thread is not None,
+            current=current,
+            next_change=(dict(nxt, at=nxt["at"].isoformat(timespec="seconds")) if nxt else None),
+            last_switch=self._last_switch,
+            prewarmed=self._prewarmed,
+        )
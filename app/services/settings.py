@@ -19,9 +19,31 @@ class SettingsService:
       - remote_name: str (optional)
       - remote_folder: str (default 'VideosRPi')
       - preview_enabled: bool
-      - autoplay: bool
+      - preview_ladder: list (see PreviewService)
+      - preview_max_kbps: int
+      - preview_idle_timeout: float (seconds)
+      - autoplay: bool (start playback at boot, resuming the last checkpoint)
       - loop_all: bool
-      - sync_on_boot: bool
+      - sync_on_boot: bool (mirror the remote into VIDEO_DIR at boot: files
+        absent from the remote are DELETED locally)
+        autoplay, sync_on_boot and the background services (scheduler,
+        watchdog, cache, integrity, fleet, lockstep) only run in the server
+        process: start_background(app), called by run.py. The shipped
+        settings.json has both autoplay and sync_on_boot on.
+      - thumb_seek_mode: 'accurate' | 'fast' | 'keyframe'
+      - thumb_workers: int (parallel ffmpeg processes)
+      - schedule: dict (see SchedulerService)
+      - library_recursive: bool (scan sub-folders; folders become collections)
+      - watchdog_enabled: bool (player/worker supervisor, see Supervisor)
+      - rclone_mode: 'cli' | 'rcd' (see RcloneService)
+      - sync_delta: bool (plan + copy changed files only, see RcloneService)
+      - cache_budget_mb / cache_reserve_mb / cache_fetch_ahead (see ContentCache)
+      - integrity_verify / integrity_rate_mb (see IntegrityVerifier)
+      - fleet_peers / fleet_poll_interval / fleet_concurrency / fleet_beacon / fleet_name (see FleetService)
+      - lockstep_role / lockstep_master / lockstep_port / lockstep_seek_ms (see LockstepService)
+      - lan_share / lan_concurrency (see LanShare)
+      - media_max_streams: int concurrent /media downloads (see app.server)
+      - resume_on_boot: bool, resume_interval: float (see ResumeStore)
     """
 
     def __init__(self, file_path: str) -> None:
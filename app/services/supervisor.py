@@ -0,0 +1,294 @@
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from ..metrics import Counter, Histogram, Gauge
+
+try:
+    from flask import current_app
+    _svc_logger = current_app.logger
+except Exception:
+    _svc_logger = logging.getLogger('rpi_avp')
+
+
+DEFAULT_INTERVAL = 2.0        # s entre deux controles du lecteur
+DEFAULT_STALL_SECONDS = 8.0   # position figee en "playing" (ou ouverture / erreur qui perdure)
+DEFAULT_EVENT_SECONDS = 10.0  # position qui avance sans aucun evenement backend
+PROBE_TIMEOUT = 2.0           # un appel libVLC plus long = lecteur bloque
+MAX_BACKOFF = 60.0
+WORKER_RETRIES = 3
+WORKER_BACKOFF = 5.0
+
+PLAYER_RESTARTS = Counter(
+    "rpi_avp_player_restarts_total", "Redemarrages du lecteur par le superviseur (par cause et resultat).")
+PLAYER_RECOVERY_SECONDS = Histogram(
+    "rpi_avp_player_recovery_seconds", "Derniere progression saine -> lecture reprise (MTTR).",
+    buckets=(1, 2, 5, 10, 15, 30, 60, 120, 300))
+WORKER_FAILURES = Counter(
+    "rpi_avp_worker_failures_total", "Echecs de workers de fond (miniatures, sync...).")
+WORKER_RUNNING = Gauge(
+    "rpi_avp_worker_running", "Workers de fond en cours (1 = actif).")
+
+
+class _Probe:
+    """Backend getters run in a throwaway thread: a wedged libVLC cannot hang the supervisor."""
+
+    def __init__(self, backend) -> None:
+        self.backend = backend
+        self.result: Optional[Dict[str, Any]] = None
+
+    def _run(self) -> None:
+        self.result = {"state": self.backend.get_state(), "time": self.backend.get_time()}
+
+    def __call__(self, timeout: float) -> Optional[Dict[str, Any]]:
+        t = threading.Thread(target=self._run, name="player-probe", daemon=True)
+        t.start()
+        t.join(timeout)
+        return self.result
+
+
+class Supervisor:
+    """
+    Watchdog for the player backend and the background workers.
+
+    Player: every `interval` seconds the backend is probed (state + time,
+    with a timeout). It is declared unhealthy when
+      - a probe does not return within PROBE_TIMEOUT (libVLC wedged),
+      - it reports 'playing' but the position has not moved for
+        `stall_seconds` (frozen decoder / output),
+      - the position moves but no backend event arrived for
+        `event_seconds` (event thread dead: end-of-media chaining would
+        never fire),
+      - it sits in 'opening'/'buffering' or 'error' for `stall_seconds`.
+    'ended' is healthy: chaining to the next item is the end-of-media
+    handler's job, and it is deliberately off with loop_all false or on a
+    lockstep follower.
+    It is then restarted (backend.restart(), which reuses the libVLC
+    options that last worked) and `restore(snapshot)` reloads the item
+    that was playing at its last known position, or moves on to the next
+    one (snapshot "skip") when the player went to 'error' or the same item
+    already needed a recovery that never got playback moving again. MTTR
+    is measured from the last healthy observation to the first position
+    change after restore. A restart only counts as successful once playback
+    progresses: until then consecutive restarts back off exponentially up
+    to MAX_BACKOFF.
+
+    Workers: spawn() runs a target in a named thread; an exception (or an
+    explicit False return) is retried with exponential backoff, at most
+    `retries` times.
+
+    Settings used:
+      - watchdog_enabled: bool (default True)
+    """
+
+    def __init__(self, settings_service, player, interval: float = DEFAULT_INTERVAL,
+                 stall_seconds: float = DEFAULT_STALL_SECONDS,
+                 event_seconds: float = DEFAULT_EVENT_SECONDS,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self._settings = settings_service
+        self.player = player
+        self.interval = float(interval)
+        self.stall_seconds = float(stall_seconds)
+        self.event_seconds = float(event_seconds)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._restore: Optional[Callable[[Dict[str, Any]], bool]] = None
+        self._current: Callable[[], Optional[str]] = lambda: None
+        # derniere observation saine
+        self._healthy_at: Optional[float] = None
+        self._last_time: Optional[int] = None
+        self._last_item: Optional[str] = None
+        self._moved_at: Optional[float] = None
+        self._bad_state_since: Optional[float] = None
+        self._event_at = clock()
+        self._failures = 0
+        self._next_attempt = 0.0
+        self._recovering: Optional[Dict[str, Any]] = None
+        self.last_probe: Optional[Dict[str, Any]] = None  # reutilise par /metrics (pas d'appel libVLC)
+        self._restarts: list = []
+        self._workers: Dict[str, Dict[str, Any]] = {}
+        player.on_state_change(self._on_event)
+        player.on_position(self._on_event)
+
+    def enabled(self) -> bool:
+        return bool(self._settings.get("watchdog_enabled", True))
+
+    # ----- player -----
+    def start(self, restore: Callable[[Dict[str, Any]], bool],
+              current: Callable[[], Optional[str]]) -> None:
+        """Start the watchdog thread (idempotent). `current()` = item loaded in the player."""
+        with self._lock:
+            self._restore = restore
+            self._current = current
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="supervisor", daemon=True)
+            self._thread.start()
+
+    def _on_event(self, _value) -> None:
+        self._event_at = self._clock()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            if not self.enabled() or not self.player.ready:
+                continue
+            try:
+                self.check()
+            except Exception as e:
+                _svc_logger.warning("supervisor check failed: %s", e)
+
+    def check(self) -> Optional[str]:
+        """One watchdog pass; returns the failure reason when a restart was triggered."""
+        now = self._clock()
+        probe = _Probe(self.player)(PROBE_TIMEOUT)
+        self.last_probe = dict(probe or {"state": "hung"}, at=now)
+        if self._recovering is not None and probe is not None:
+            self._check_recovered(probe, now)
+        reason = None
+        item = self._current()
+        if probe is None:
+            reason = "hung"
+        else:
+            state, pos = probe["state"], probe["time"]
+            if item != self._last_item:
+                self._last_item, self._last_time, self._moved_at = item, None, now
+            if state == "playing":
+                self._bad_state_since = None
+                if self._last_time is None or pos != self._last_time:
+                    self._last_time, self._moved_at = pos, now
+                    if now - self._event_at > self.event_seconds:
+                        reason = "events"
+                    else:
+                        self._healthy_at = now
+                elif now - (self._moved_at or now) > self.stall_seconds:
+                    reason = "frozen"
+            elif state in ("opening", "buffering", "error"):
+                self._bad_state_since = self._bad_state_since or now
+                self._moved_at = now
+                self._event_at = max(self._event_at, now - self.event_seconds / 2)
+                if now - self._bad_state_since > self.stall_seconds:
+                    reason = "error" if state == "error" else "stalled"
+            else:
+                # pause, arret volontaire, fin de media : rien a surveiller
+                self._bad_state_since = None
+                self._moved_at = now
+                self._event_at = max(self._event_at, now - self.event_seconds / 2)
+                self._healthy_at = now
+        if reason is None or now < self._next_attempt:
+            return None
+        self._recover(reason, item, now)
+        return reason
+
+    def _recover(self, reason: str, item: Optional[str], now: float) -> None:
+        pending = self._recovering
+        # fichier illisible, ou deja relance sans jamais repartir : on passe au suivant
+        skip = reason == "error" or (pending is not None and pending["entry"]["media"] == item)
+        snapshot = {
+            "reason": reason,
+            "media": item,
+            "position_ms": self._last_time or 0,
+            "skip": skip,
+        }
+        _svc_logger.warning("supervisor: player unhealthy (%s), restarting (item=%s, pos=%sms%s)",
+                            reason, item, snapshot["position_ms"], ", skip" if skip else "")
+        ok = False
+        try:
+            ok = self.player.restart() and bool(self._restore and self._restore(snapshot))
+        except Exception as e:
+            _svc_logger.error("supervisor: restart failed: %s", e)
+        PLAYER_RESTARTS.inc(reason=reason, result="ok" if ok else "error")
+        entry = dict(snapshot, at=time.time(), ok=ok, mttr_s=None)
+        self._restarts = (self._restarts + [entry])[-20:]
+        # remis a zero par _check_recovered, quand la lecture progresse a nouveau
+        self._failures += 1
+        delay = min(MAX_BACKOFF, self.interval * (2 ** self._failures))
+        if ok:
+            self._next_attempt = now + max(self.stall_seconds, delay)
+            if item is not None:
+                since = pending["since"] if pending is not None else (self._healthy_at or now)
+                self._recovering = {"entry": entry, "since": since, "time": None}
+        else:
+            self._next_attempt = now + delay
+        # on repart de zero pour la detection
+        self._last_time, self._moved_at, self._bad_state_since = None, now, None
+        self._event_at = now
+
+    def _check_recovered(self, probe: Dict[str, Any], now: float) -> None:
+        rec = self._recovering
+        if probe["state"] != "playing":
+            return
+        if rec["time"] is None or probe["time"] == rec["time"]:
+            rec["time"] = probe["time"]  # 1re position vue : il faut qu'elle bouge
+            return
+        self._recovering, self._failures = None, 0
+        mttr = now - rec["since"]
+        rec["entry"]["mttr_s"] = round(mttr, 2)
+        PLAYER_RECOVERY_SECONDS.observe(mttr)
+        _svc_logger.info("supervisor: playback restored in %.1fs", mttr)
+
+    def probed_state(self) -> str:
+        """Player state from the last watchdog probe ('unknown' if stale or watchdog off)."""
+        probe = self.last_probe
+        if probe is None or self._clock() - probe["at"] > 3 * self.interval + PROBE_TIMEOUT:
+            return "unknown"
+        return probe["state"]
+
+    # ----- workers -----
+    def spawn(self, name: str, target: Callable[..., Any], *args: Any,
+              retries: int = WORKER_RETRIES, backoff: float = WORKER_BACKOFF, **kwargs: Any) -> bool:
+        """Run `target` in thread `name` under supervision. False if already running."""
+        with self._lock:
+            w = self._workers.get(name)
+            if w is not None and w["running"]:
+                return False
+            w = self._workers[name] = {"running": True, "attempts": 0, "failures": 0,
+                                       "last_error": None, "started_at": time.time(), "finished_at": None}
+        threading.Thread(target=self._worker_loop, args=(name, w, target, args, kwargs, retries, backoff),
+                         name=name, daemon=True).start()
+        return True
+
+    def _worker_loop(self, name, w, target, args, kwargs, retries, backoff) -> None:
+        WORKER_RUNNING.set(1, worker=name)
+        try:
+            while True:
+                w["attempts"] += 1
+                try:
+                    failed = target(*args, **kwargs) is False
+                    error = "returned False" if failed else None
+                except Exception as e:
+                    failed, error = True, f"{type(e).__name__}: {e}"
+                if not failed:
+                    w["last_error"] = None
+                    return
+                w["failures"] += 1
+                w["last_error"] = error
+                WORKER_FAILURES.inc(worker=name)
+                if w["attempts"] > retries:
+                    _svc_logger.error("worker %s failed %d times, giving up: %s", name, w["attempts"], error)
+                    return
+                delay = backoff * (2 ** (w["attempts"] - 1))
+                _svc_logger.warning("worker %s failed (%s), retry in %.1fs", name, error, delay)
+                time.sleep(delay)
+        finally:
+            w["running"] = False
+            w["finished_at"] = time.time()
+            WORKER_RUNNING.set(0, worker=name)
+
+    # ----- status -----
+    def status(self) -> Dict[str, Any]:
+        mttrs = [r["mttr_s"] for r in self._restarts if r["mttr_s"] is not None]
+        return {
+            "enabled": self.enabled(),
+            "running": self._thread is not None,
+            "player": {
+                "restarts": list(self._restarts),
+                "consecutive_failures": self._failures,
+                "recovering": self._recovering is not None,
+                "mttr_last_s": mttrs[-1] if mttrs else None,
+                "mttr_max_s": max(mttrs) if mttrs else None,
+            },
+            "workers": {k: dict(v) for k, v in self._workers.items()},
+        }
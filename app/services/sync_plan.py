@@ -0,0 +1,202 @@
+import json
+import os
+import re
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    from flask import current_app
+    _svc_logger = current_app.logger
+except Exception:
+    _svc_logger = logging.getLogger('rpi_avp')
+
+
+MTIME_TOLERANCE = 1.0   # s (rclone recopie la date du remote, precision variable selon le backend)
+_FRACTION_RE = re.compile(r"(\.\d{1,6})\d*")
+
+Manifest = Dict[str, Dict[str, Any]]
+
+
+def parse_modtime(value: str) -> Optional[float]:
+    """RFC 3339 from rclone ("2024-01-01T10:00:00.123456789Z") -> epoch seconds."""
+    if not value:
+        return None
+    text = _FRACTION_RE.sub(r"\1", value.strip()).replace("Z", "+00:00")
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+
+def remote_manifest(items: Iterable[Dict[str, Any]]) -> Manifest:
+    """lsjson / operations/list entries -> {path: {size, mtime, hash}} (files only)."""
+    out: Manifest = {}
+    for it in items:
+        if it.get("IsDir"):
+            continue
+        hashes = sorted((it.get("Hashes") or {}).items())
+        out[it["Path"]] = {
+            "size": int(it.get("Size") or 0),
+            "mtime": parse_modtime(it.get("ModTime", "")),
+            "hash": f"{hashes[0][0]}:{hashes[0][1]}" if hashes else None,
+        }
+    return out
+
+
+def local_manifest(root: str, exclude_dirs: Iterable[str] = ("thumbnails",)) -> Manifest:
+    """Files under `root` (relative "/" paths), skipping `exclude_dirs` at the top level."""
+    out: Manifest = {}
+    exclude = set(exclude_dirs)
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            it = os.scandir(os.path.join(root, rel_dir) if rel_dir else root)
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                rel = f"{rel_dir}/{e.name}" if rel_dir else e.name
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        if not (rel_dir == "" and e.name in exclude):
+                            stack.append(rel)
+                    elif e.is_file():
+                        st = e.stat()
+                        out[rel] = {"size": st.st_size, "mtime": st.st_mtime}
+                except OSError:
+                    continue
+    return out
+
+
+def _differs(remote: Dict[str, Any], local: Optional[Dict[str, Any]]) -> bool:
+    if local is None or local["size"] != remote["size"]:
+        return True
+    if remote.get("mtime") is None or local.get("mtime") is None:
+        return False
+    return abs(remote["mtime"] - local["mtime"]) > MTIME_TOLERANCE
+
+
+def _same_version(remote: Dict[str, Any], known: Dict[str, Any]) -> bool:
+    if _differs(remote, known):
+        return False
+    return not (remote.get("hash") and known.get("hash") and remote["hash"] != known["hash"])
+
+
+def plan(remote: Manifest, local: Manifest, previous: Optional[Manifest] = None,
+         rejected: Optional[Manifest] = None) -> Dict[str, Any]:
+    """
+    Local delta for a one-way sync remote -> local.
+
+    `copy`: remote files missing or different locally (size, or modtime
+    beyond MTIME_TOLERANCE); `delete`: local files absent from the remote.
+    `quarantined`: files not copied because the remote version is the one
+    the integrity check rejected (`rejected`: {path: {size, mtime, hash}});
+    they are copied again once the remote changes.
+    `added`/`modified`/`removed` compare the remote with the previous
+    run's manifest (what changed upstream since last time).
+    """
+    copy = sorted(p for p, r in remote.items() if _differs(r, local.get(p)))
+    held: List[str] = []
+    if rejected:
+        held = [p for p in copy if p in rejected and _same_version(remote[p], rejected[p])]
+        if held:
+            skip = set(held)
+            copy = [p for p in copy if p not in skip]
+    delete = sorted(p for p in local if p not in remote and not p.endswith(".partial"))
+    prev = previous or {}
+    added = sorted(p for p in remote if p not in prev)
+    modified = sorted(p for p, r in remote.items() if p in prev and (
+        prev[p].get("size") != r["size"] or prev[p].get("mtime") != r.get("mtime")
+        or (r.get("hash") and prev[p].get("hash") and r["hash"] != prev[p]["hash"])))
+    removed = sorted(p for p in prev if p not in remote)
+    return {
+        "copy": copy,
+        "delete": delete,
+        "bytes": sum(remote[p]["size"] for p in copy),
+        "unchanged": len(remote) - len(copy) - len(held),
+        "remote_files": len(remote),
+        "quarantined": held,
+        "added": added,
+        "modified": modified,
+        "removed": removed,
+        "noop": not copy and not delete,
+    }
+
+
+def summary(p: Dict[str, Any], limit: int = 20) -> str:
+    """Human-readable plan for the sync log."""
+    lines = [f"plan: copy {len(p['copy'])} file(s) ({p['bytes']} B), delete {len(p['delete'])}, "
+             f"unchanged {p['unchanged']}/{p['remote_files']}"]
+    if p.get("quarantined"):
+        lines.append(f"skipped {len(p['quarantined'])} quarantined file(s) (remote unchanged)")
+    for p_ in p["copy"][:limit]:
+        lines.append(f"  + {p_}")
+    for p_ in p["delete"][:limit]:
+        lines.append(f"  - {p_}")
+    if "budget" in p:
+        lines.append(f"cache: budget {p['budget']} B, kept {p['cache_bytes']} B, evict {len(p['evict'])}, "
+                     f"deferred {len(p['deferred'])}")
+        for p_ in p["evict"][:limit]:
+            lines.append(f"  x {p_}")
+    hidden = max(0, len(p["copy"]) - limit) + max(0, len(p["delete"]) - limit)
+    hidden += max(0, len(p.get("evict", ())) - limit)
+    if hidden:
+        lines.append(f"  ... ({hidden} more)")
+    return "\n".join(lines) + "\n"
+
+
+def remove_local(root: str, paths: Iterable[str]) -> List[str]:
+    """Delete `paths` under `root` and prune directories left empty; returns failures."""
+    failed = []
+    dirs = set()
+    for rel in paths:
+        full = os.path.join(root, *rel.split("/"))
+        try:
+            os.remove(full)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            failed.append(f"{rel}: {e}")
+            continue
+        d = os.path.dirname(rel)
+        while d:
+            dirs.add(d)
+            d = os.path.dirname(d)
+    for d in sorted(dirs, key=len, reverse=True):
+        try:
+            os.rmdir(os.path.join(root, *d.split("/")))
+        except OSError:
+            pass  # non vide
+    return failed
+
+
+class ManifestStore:
+    """Remote manifest of the last successful sync, per target (JSON file)."""
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+
+    def _load_all(self) -> Dict[str, Any]:
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                return json.load(f) or {}
+        except (OSError, ValueError):
+            return {}
+
+    def load(self, target: str) -> Optional[Manifest]:
+        entry = self._load_all().get(target)
+        return entry.get("files") if entry else None
+
+    def save(self, target: str, manifest: Manifest, saved_at: float) -> None:
+        data = self._load_all()
+        data[target] = {"saved_at": saved_at, "files": manifest}
+        try:
+            os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+            tmp = self.file_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.file_path)
+        except OSError as e:
+            _svc_logger.warning("sync manifest save failed: %s", e)
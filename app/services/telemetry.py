@@ -0,0 +1,207 @@
+import threading
+import time
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from ..metrics import Counter, Histogram, TRACK_CHANGE_SECONDS
+
+try:
+    from flask import current_app
+    _svc_logger = current_app.logger
+except Exception:
+    _svc_logger = logging.getLogger('rpi_avp')
+
+
+DEFAULT_HISTORY = 200
+DEFAULT_STALL_THRESHOLD = 1.0  # s sans avance de position en "playing"
+
+TRANSITION_GAP_SECONDS = Histogram(
+    "rpi_avp_transition_gap_seconds", "Fin de media -> Playing du media suivant (enchainement auto).",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0))
+PLAYBACK_STALLS = Counter(
+    "rpi_avp_playback_stalls_total", "Blocages en cours de lecture (buffering ou position figee).")
+
+
+def _pct(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+class PlaybackTelemetry:
+    """
+    Per-item playback timeline built from player backend events.
+
+    Each play command opens an item (begin()); backend events then fill in
+    open/start latency, the gap after the previous item ended (auto-advance),
+    stalls (input cache below 100% after the start, from the backend's
+    buffering events, or position frozen for more than `stall_threshold`
+    seconds while playing) and how the item finished.
+    Closed items are kept in a bounded in-memory history.
+    """
+
+    def __init__(self, history: int = DEFAULT_HISTORY, stall_threshold: float = DEFAULT_STALL_THRESHOLD) -> None:
+        self.stall_threshold = float(stall_threshold)
+        self._lock = threading.Lock()
+        self._history: Deque[Dict[str, Any]] = deque(maxlen=max(1, int(history)))
+        self._current: Optional[Dict[str, Any]] = None
+        self._last_end: Optional[float] = None  # monotonic, fin du media precedent
+        self._attached: List[int] = []
+
+    # ----- wiring -----
+    def attach(self, backend) -> None:
+        """Subscribe to a backend's events (idempotent per backend)."""
+        if id(backend) in self._attached:
+            return
+        self._attached.append(id(backend))
+        backend.on_state_change(self._on_state)
+        backend.on_position(self._on_position)
+        backend.on_buffering(self._on_buffering)
+
+    # ----- commands -----
+    def begin(self, media: Optional[str], reason: str) -> None:
+        """A play command was issued for `media` ("user", "loop", "autoplay"...)."""
+        now = time.monotonic()
+        with self._lock:
+            if self._current is not None:
+                self._close(now, "replaced")
+            gap_from = self._last_end if reason == "loop" else None
+            self._last_end = None
+            self._current = {
+                "media": media,
+                "reason": reason,
+                "requested_at": time.time(),
+                "_t0": now,
+                "_gap_from": gap_from,
+                "_state": "requested",
+                "_last_pos_at": None,
+                "_last_pos": None,
+                "_stall_at": None,
+                "open_ms": None,
+                "start_ms": None,
+                "gap_ms": None,
+                "stalls": 0,
+                "stall_ms": 0.0,
+                "position_ms": 0,
+                "end": None,
+            }
+
+    # ----- backend events (backend threads) -----
+    def _on_state(self, state: str) -> None:
+        now = time.monotonic()
+        start_s = gap_s = None
+        stalled = False
+        with self._lock:
+            cur = self._current
+            if cur is None:
+                return
+            if cur["_state"] == "requested" and state in ("idle", "stopped", "ended"):
+                return  # evenement tardif du media precedent (stop() avant play())
+            cur["_state"] = state
+            if state == "opening" and cur["open_ms"] is None:
+                cur["open_ms"] = round((now - cur["_t0"]) * 1000, 1)
+            elif state == "playing":
+                if cur["start_ms"] is None:
+                    start_s = now - cur["_t0"]
+                    cur["start_ms"] = round(start_s * 1000, 1)
+                    if cur["_gap_from"] is not None:
+                        gap_s = now - cur["_gap_from"]
+                        cur["gap_ms"] = round(gap_s * 1000, 1)
+                elif cur["_stall_at"] is not None:
+                    self._add_stall(cur, now - cur["_stall_at"])
+                    stalled = True
+                cur["_stall_at"] = None
+                cur["_last_pos_at"] = now
+            elif state in ("ended", "stopped", "error"):
+                if state == "ended":
+                    self._last_end = now
+                self._close(now, state)
+        if start_s is not None:
+            TRACK_CHANGE_SECONDS.observe(start_s)
+        if gap_s is not None:
+            TRANSITION_GAP_SECONDS.observe(gap_s)
+        if stalled:
+            PLAYBACK_STALLS.inc(kind="buffering")
+
+    def _on_position(self, ms: int) -> None:
+        now = time.monotonic()
+        stalled = False
+        with self._lock:
+            cur = self._current
+            if cur is None or cur["_state"] != "playing":
+                return
+            last_at, last_pos = cur["_last_pos_at"], cur["_last_pos"]
+            if last_pos is not None and ms == last_pos:
+                return  # meme position : on attend qu'elle reparte
+            if cur["_stall_at"] is None and last_at is not None and last_pos is not None and now - last_at > self.stall_threshold:
+                self._add_stall(cur, now - last_at)
+                stalled = True
+            cur["_last_pos_at"], cur["_last_pos"] = now, ms
+            cur["position_ms"] = int(ms)
+        if stalled:
+            PLAYBACK_STALLS.inc(kind="frozen")
+
+    def _on_buffering(self, percent: float) -> None:
+        """Cache fill during playback: < 100 opens a stall, 100 closes it."""
+        now = time.monotonic()
+        stalled = False
+        with self._lock:
+            cur = self._current
+            if cur is None or cur["start_ms"] is None or cur["_state"] != "playing":
+                return  # remplissage initial (avant la 1re image) : compte dans start_ms
+            if percent < 100.0:
+                if cur["_stall_at"] is None:
+                    cur["_stall_at"] = now
+            elif cur["_stall_at"] is not None:
+                self._add_stall(cur, now - cur["_stall_at"])
+                cur["_stall_at"] = None
+                cur["_last_pos_at"] = now
+                stalled = True
+        if stalled:
+            PLAYBACK_STALLS.inc(kind="buffering")
+
+    # ----- helpers (lock held) -----
+    @staticmethod
+    def _add_stall(cur: Dict[str, Any], seconds: float) -> None:
+        cur["stalls"] += 1
+        cur["stall_ms"] = round(cur["stall_ms"] + seconds * 1000, 1)
+
+    def _close(self, now: float, end: str) -> None:
+        cur, self._current = self._current, None
+        cur["end"] = end
+        cur["duration_ms"] = round((now - cur["_t0"]) * 1000, 1)
+        self._history.append(self._public(cur))
+
+    @staticmethod
+    def _public(item: Dict[str, Any]) -> Dict[str, Any]:
+        out = {k: v for k, v in item.items() if not k.startswith("_")}
+        out["state"] = item["_state"]
+        return out
+
+    # ----- read API -----
+    def current(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._public(self._current) if self._current is not None else None
+
+    def history(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = list(self._history)
+        return items[-limit:] if limit else items
+
+    def summary(self) -> Dict[str, Any]:
+        items = self.history()
+        starts = [i["start_ms"] for i in items if i["start_ms"] is not None]
+        gaps = [i["gap_ms"] for i in items if i["gap_ms"] is not None]
+        return {
+            "items": len(items),
+            "start_ms_p50": _pct(starts, 50),
+            "start_ms_p95": _pct(starts, 95),
+            "gap_ms_p50": _pct(gaps, 50),
+            "gap_ms_p95": _pct(gaps, 95),
+            "stalls": sum(i["stalls"] for i in items),
+            "stall_ms": round(sum(i["stall_ms"] for i in items), 1),
+            "errors": sum(1 for i in items if i["end"] == "error"),
+            "never_started": sum(1 for i in items if i["start_ms"] is None),
+        }
@@ -39,21 +39,49 @@ async function parseJsonSafe(res) {
 // API: commandes VLC & lecture
 // ==============================
 
-async function sendAction(action) {
-  try {
-    const res = await fetchWithTimeout(`/control/${encodeURIComponent(action)}`, { method: "POST" });
-    if (!res.ok) {
-      const body = await res.text().catch(() => "");
-      console.error("[control] HTTP", res.status, body);
-      return null;
+// Clics rapprochés regroupés en un lot /api/control (5 x "suivante" = un seul chargement).
+// Chaque commande porte un ID : un lot renvoyé après timeout n'est pas rejoué.
+const COMMAND_BATCH_MS = 150;
+const commandQueue = [];
+let commandTimer = null;
+let commandSeq = 0;
+const commandClient = Math.random().toString(36).slice(2, 10);
+
+function sendAction(action) {
+  return new Promise((resolve) => {
+    commandQueue.push({ cmd: { id: `${commandClient}-${++commandSeq}`, action }, resolve });
+    clearTimeout(commandTimer);
+    commandTimer = setTimeout(flushCommands, COMMAND_BATCH_MS);
+  });
+}
+
+async function flushCommands() {
+  const pending = commandQueue.splice(0);
+  if (!pending.length) return;
+  const body = JSON.stringify({ commands: pending.map((p) => p.cmd) });
+  let data = null;
+  for (let attempt = 0; attempt < 2 && data === null; attempt++) {
+    try {
+      const res = await fetchWithTimeout("/api/control", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body,
+      });
+      data = await parseJsonSafe(res);
+      if (!res.ok) {
+        console.error("[control] HTTP", res.status, data);
+        break;
+      }
+      log("[control]", pending.map((p) => p.cmd.action).join(","), data);
+    } catch (err) {
+      console.error("[control][error]", err);  // réseau : même lot (mêmes IDs) renvoyé une fois
     }
-    const data = await parseJsonSafe(res);
-    log("[control]", action, data);
-    return data;
-  } catch (err) {
-    console.error("[control][error]", action, err);
-    return null;
   }
+  if (data && data.state) {
+    updatePlayPauseUI(data.state.state === "playing");
+    updateStatusPanelPayload(data.state);
+  }
+  pending.forEach((p) => p.resolve(data));
 }
 
 async function playVideo(videoName) {
@@ -91,7 +119,8 @@ function attachClickHandlers() {
 
   // Clic sur une carte vidéo → lecture
   document.querySelectorAll(".video-item").forEach((item) => {
-    item.addEventListener("click", () => {
+    item.addEventListener("click", (e) => {
+      if (e.target.closest(".video-open")) return; // lien /media : ouvert par le navigateur
       const name = item.dataset.name || item.getAttribute("data-name");
       if (name) playVideo(name);
     }, { passive: true });
@@ -1,7 +1,9 @@
 # app/utils.py
 import os
 import subprocess
-from PIL import Image, ImageColor
+import time
+
+from .metrics import THUMBNAIL_SECONDS
 
 
 # ==============================
@@ -51,71 +53,167 @@ def refresh_videos_list(video_dir):
     return files
 
 
+def scan_video_tree(video_dir, cache=None, exclude_dirs=("thumbnails",)):
+    """
+    Parcours RECURSIF de `video_dir` (un seul os.scandir par dossier).
+
+    Renvoie la liste triee (insensible a la casse) des chemins RELATIFS
+    ("campagne/clip.mp4", separateur "/"). Les dossiers caches et
+    `exclude_dirs` (au premier niveau, ex. miniatures) sont ignores.
+
+    `cache` (dict, conserve par l'appelant entre deux scans) :
+      rel_dir -> (mtime_ns, [(nom, taille, mtime)], [sous-dossiers])
+    Un dossier dont le mtime n'a pas change n'est pas relu : seul un stat()
+    par dossier est paye. NB : le mtime d'un dossier ne change que si ses
+    entrees DIRECTES changent, on descend donc quand meme dans les
+    sous-dossiers (stat seulement).
+    """
+    if not os.path.isdir(video_dir):
+        return []
+    if cache is None:
+        cache = {}
+    files = []
+    seen = set()
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        full = os.path.join(video_dir, rel) if rel else video_dir
+        try:
+            mtime = os.stat(full).st_mtime_ns
+        except OSError:
+            continue
+        seen.add(rel)
+        entry = cache.get(rel)
+        if entry is None or entry[0] != mtime:
+            vids, subdirs = [], []
+            try:
+                with os.scandir(full) as it:
+                    for de in it:
+                        if de.name.startswith("."):
+                            continue
+                        try:
+                            if de.is_dir(follow_symlinks=False):
+                                if not (rel == "" and de.name in exclude_dirs):
+                                    subdirs.append(de.name)
+                            elif de.is_file() and de.name.lower().endswith(VIDEO_EXTENSIONS):
+                                st = de.stat()
+                                vids.append((de.name, st.st_size, st.st_mtime))
+                        except OSError:
+                            continue
+            except OSError:
+                pass
+            entry = (mtime, vids, subdirs)
+            cache[rel] = entry
+        prefix = rel + "/" if rel else ""
+        files.extend(prefix + name for name, _size, _mtime in entry[1])
+        stack.extend(prefix + d for d in entry[2])
+    for gone in set(cache) - seen:
+        del cache[gone]
+    files.sort(key=lambda s: s.lower())
+    return files
+
+
 # ==============================
 # Miniatures : gÃ©nÃ©ration via ffmpeg (+fallback)
 # ==============================
-def generate_thumbnails(video_dir, thumb_dir, seek_seconds=5):
+# Strategies d'extraction (comparees par benchmarks/thumbnails.py)
+#  - accurate : -ss APRES -i  -> decode jusqu'a t (precis, lent)
+#  - fast     : -ss AVANT -i  -> seek sur keyframe puis decode (rapide)
+#  - keyframe : fast + -skip_frame nokey -> ne decode que des keyframes
+SEEK_MODES = ("accurate", "fast", "keyframe")
+
+
+def _ffmpeg_frame_cmd(video_path, thumb_path, seek_seconds, seek_mode):
+    """Commande ffmpeg d'extraction d'une frame (seek_seconds=None : 1re frame)."""
+    scale = ["-vf", f"scale={THUMB_WIDTH}:-1"]
+    if seek_seconds is None:
+        return ["ffmpeg", "-y", "-i", video_path, "-vframes", "1"] + scale + [thumb_path]
+    ss = ["-ss", str(int(seek_seconds))]
+    if seek_mode == "fast":
+        return ["ffmpeg", "-y"] + ss + ["-i", video_path, "-vframes", "1"] + scale + [thumb_path]
+    if seek_mode == "keyframe":
+        return (["ffmpeg", "-y", "-skip_frame", "nokey"] + ss + ["-i", video_path, "-vframes", "1"]
+                + scale + [thumb_path])
+    return ["ffmpeg", "-y", "-i", video_path] + ss + ["-vframes", "1"] + scale + [thumb_path]
+
+
+def generate_thumbnail(video_path, thumb_path, seek_seconds=5, seek_mode="accurate"):
+    """
+    Genere UNE miniature. Renvoie True si ffmpeg a reussi, False si un
+    placeholder a ete ecrit a la place.
+    """
+    t0 = time.perf_counter()
+    success = False
+
+    # Tentative 1 : frame Ã  t = seek_seconds
+    # position de -ss selon seek_mode (cf. SEEK_MODES : accurate = apres -i, fast/keyframe = avant)
+    cmd = _ffmpeg_frame_cmd(video_path, thumb_path, seek_seconds, seek_mode)
+    try:
+        subprocess.run(
+            cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
+        )
+        success = True
+    except subprocess.CalledProcessError:
+        # Tentative 2 : prendre la premiÃ¨re frame
+        cmd2 = _ffmpeg_frame_cmd(video_path, thumb_path, None, seek_mode)
+        try:
+            subprocess.run(
+                cmd2, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
+            )
+            success = True
+        except subprocess.CalledProcessError:
+            success = False
+
+    # Fallback : image placeholder si ffmpeg a Ã©chouÃ©
+    if not success:
+        from PIL import Image, ImageColor  # import paresseux (lent sur Pi)
+        img = Image.new("RGB", (THUMB_WIDTH, 180), ImageColor.getrgb(THUMB_PLACEHOLDER_COLOR))
+        img.save(thumb_path)
+        print(f"[Thumbnail] Placeholder: {thumb_path}")
+    else:
+        print(f"[Thumbnail] Created: {thumb_path}")
+    THUMBNAIL_SECONDS.observe(time.perf_counter() - t0, result="created" if success else "placeholder")
+    return success
+
+
+def thumbnail_path(thumb_dir, rel_video):
+    """Miniature d'une video (chemin relatif) : meme arborescence, extension .png."""
+    base, _ = os.path.splitext(rel_video)
+    return os.path.join(thumb_dir, *(base + ".png").split("/"))
+
+
+def generate_thumbnails(video_dir, thumb_dir, seek_seconds=5, seek_mode="accurate", workers=1, recursive=False):
     """
     Gnre des miniatures PNG (THUMB_WIDTH px de large) dans `thumb_dir` pour
     chaque vido de `video_dir`.
 
-    - Essaye d'extraire 1 frame  `seek_seconds` via ffmpeg.
+    - Essaye d'extraire 1 frame  `seek_seconds` via ffmpeg (cf. SEEK_MODES).
     - Si chec, essaye la premire frame.
     - Si encore chec, cre une image grise placeholder.
     - Ne rgnre pas les miniatures dj prsentes.
-    - Ne parcourt PAS rcursivement les sous-dossiers (cohrent avec refresh_videos_list).
+    - Ne parcourt les sous-dossiers que si `recursive` (miniatures rangees dans la
+      meme arborescence sous `thumb_dir`, cf. thumbnail_path()).
+    - `workers` > 1 : plusieurs ffmpeg en parallele (pool de threads).
 
     Renvoie le nombre de miniatures effectivement cres (hors placeholders).
     """
     os.makedirs(thumb_dir, exist_ok=True)
-    videos = refresh_videos_list(video_dir)
+    videos = scan_video_tree(video_dir) if recursive else refresh_videos_list(video_dir)
 
-    created = 0
+    jobs = []
     for v in videos:
-        base, _ = os.path.splitext(v)
-        thumb_path = os.path.join(thumb_dir, base + ".png")
+        thumb_path = thumbnail_path(thumb_dir, v)
 
         # DÃ©jÃ  gÃ©nÃ©rÃ©e â†’ on passe
         if os.path.exists(thumb_path):
             continue
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        jobs.append((os.path.join(video_dir, v), thumb_path))
 
-        video_path = os.path.join(video_dir, v)
-        success = False
+    if workers <= 1 or len(jobs) <= 1:
+        return sum(1 for vp, tp in jobs if generate_thumbnail(vp, tp, seek_seconds, seek_mode))
 
-        # Tentative 1 : frame Ã  t = seek_seconds
-        # NOTE: placer -ss APRÃˆS -i â†’ seek prÃ©cis (un peu plus lent, mais fiable)
-        cmd = [
-            "ffmpeg", "-y", "-i", video_path,
-            "-ss", str(int(seek_seconds)), "-vframes", "1",
-            "-vf", f"scale={THUMB_WIDTH}:-1", thumb_path
-        ]
-        try:
-            subprocess.run(
-                cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
-            )
-            success = True
-        except subprocess.CalledProcessError:
-            # Tentative 2 : prendre la premiÃ¨re frame
-            cmd2 = [
-                "ffmpeg", "-y", "-i", video_path,
-                "-vframes", "1",
-                "-vf", f"scale={THUMB_WIDTH}:-1", thumb_path
-            ]
-            try:
-                subprocess.run(
-                    cmd2, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
-                )
-                success = True
-            except subprocess.CalledProcessError:
-                success = False
-
-        # Fallback : image placeholder si ffmpeg a Ã©chouÃ©
-        if not success:
-            img = Image.new("RGB", (THUMB_WIDTH, 180), ImageColor.getrgb(THUMB_PLACEHOLDER_COLOR))
-            img.save(thumb_path)
-            print(f"[Thumbnail] Placeholder: {thumb_path}")
-        else:
-            created += 1
-            print(f"[Thumbnail] Created: {thumb_path}")
-
-    return created
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumb") as pool:
+        results = pool.map(lambda job: generate_thumbnail(job[0], job[1], seek_seconds, seek_mode), jobs)
+        return sum(1 for ok in results if ok)
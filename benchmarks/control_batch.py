@@ -0,0 +1,112 @@
+"""
+Benchmark des commandes groupees : une rafale de N "suivante" envoyee
+comme le faisait la telecommande (un POST /control/next par clic) puis en
+un seul lot POST /api/control. Une instance locale (HOME temporaire,
+lecteur "fake" avec une latence d'ouverture par chargement).
+
+  python benchmarks/control_batch.py --burst 5 --rounds 10
+
+Mesure la duree de la rafale cote client (N chargements contre un seul)
+et verifie que les deux aboutissent au meme element (playlist sequentielle).
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLIPS = 12
+
+
+def start_player(work, port, open_delay):
+    video_dir = os.path.join(work, "Videos", "RPi-Autonomous-Video-Player")
+    os.makedirs(video_dir)
+    for j in range(CLIPS):
+        # non vides et sans structure MP4 a verifier : pas de mise en quarantaine
+        with open(os.path.join(video_dir, f"clip{j:02d}.mkv"), "wb") as f:
+            f.write(b"\0" * 1024)
+    settings_path = os.path.join(work, "settings.json")
+    with open(settings_path, "w", encoding="utf-8") as f:
+        json.dump({"autoplay": False, "sync_on_boot": False, "fleet_beacon": False}, f)
+    env = dict(os.environ, HOME=work, RPI_AVP_PORT=str(port), RPI_AVP_SETTINGS=settings_path,
+               RPI_AVP_PLAYER="fake", RPI_AVP_FAKE_DURATION="600",
+               RPI_AVP_FAKE_OPEN_DELAY=str(open_delay), PYTHONPATH=ROOT)
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "run.py")], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1).read()
+            return proc
+        except OSError:
+            if time.monotonic() > deadline:
+                proc.kill()
+                raise RuntimeError(f"instance {port} ne repond pas")
+            time.sleep(0.2)
+
+
+def post(url, body=None):
+    data = json.dumps(body).encode() if body is not None else b""
+    req = urllib.request.Request(url, data=data, method="POST", headers={"Content-Type": "application/json"})
+    return json.loads(urllib.request.urlopen(req, timeout=30).read())
+
+
+def current(base):
+    return json.loads(urllib.request.urlopen(base + "/status_min", timeout=5).read())["current"]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--burst", type=int, default=5)
+    ap.add_argument("--rounds", type=int, default=10)
+    ap.add_argument("--open-delay", type=float, default=0.1, help="latence fake par chargement (s)")
+    ap.add_argument("--port", type=int, default=5311)
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args(argv)
+
+    work = tempfile.mkdtemp(prefix="control-bench-")
+    proc = start_player(work, args.port, args.open_delay)
+    base = f"http://127.0.0.1:{args.port}"
+    try:
+        post(base + "/play-video", {"video": "clip00.mkv"})
+        report = {"burst": args.burst, "rounds": args.rounds, "open_delay_s": args.open_delay}
+        for mode in ("single", "batch"):
+            samples, landed = [], 0
+            for r in range(args.rounds):
+                expected = f"clip{(int(current(base)[4:6]) + args.burst) % CLIPS:02d}.mkv"
+                t0 = time.perf_counter()
+                if mode == "single":
+                    for _ in range(args.burst):
+                        post(base + "/control/next")
+                else:
+                    post(base + "/api/control",
+                         {"commands": [{"id": f"r{r}-{i}", "action": "next"} for i in range(args.burst)]})
+                samples.append((time.perf_counter() - t0) * 1000)
+                landed += current(base) == expected
+            report[mode] = {"p50_ms": round(statistics.median(samples), 1), "max_ms": round(max(samples), 1),
+                            "landed_ok": f"{landed}/{args.rounds}"}
+        report["control"] = json.loads(urllib.request.urlopen(base + "/api/control", timeout=5).read())
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(work, ignore_errors=True)
+
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
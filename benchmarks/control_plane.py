@@ -0,0 +1,240 @@
+"""
+Benchmark du plan de controle (routes Flask + services) sur des bibliotheques
+synthetiques (fichiers video factices), avec le backend lecteur "fake".
+
+Pour chaque taille de bibliotheque (process enfant neuf, HOME temporaire) :
+  - client de test Flask : p50/p99, req/s et attente sur videos_lock par
+    endpoint (passe sans tracemalloc), puis allocations (tracemalloc) dans
+    une seconde passe, qui ne sert qu'au comptage ;
+  - optionnel (--http) : charge HTTP reelle via waitress + http_load.
+
+  python benchmarks/control_plane.py --sizes 100,1000,5000,20000 --json results.json
+  python benchmarks/control_plane.py --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ENDPOINTS = [
+    ("GET", "/status_min", None),
+    ("GET", "/status", None),
+    ("POST", "/control/next", None),
+    ("POST", "/play-video", "random_video"),
+    ("GET", "/", None),
+]
+
+
+def make_library(home, count):
+    """Cree `count` fichiers video factices (vides) dans le VIDEO_DIR de `home`."""
+    video_dir = os.path.join(home, "Videos", "RPi-Autonomous-Video-Player")
+    os.makedirs(os.path.join(video_dir, "thumbnails"), exist_ok=True)
+    exts = (".mp4", ".mkv", ".webm", ".avi")
+    for i in range(count):
+        with open(os.path.join(video_dir, f"clip_{i:06d}{exts[i % len(exts)]}"), "wb"):
+            pass
+    return video_dir
+
+
+class TimedLock:
+    """Proxy de RLock qui cumule le temps d'attente a l'acquisition."""
+
+    def __init__(self, inner):
+        self._inner = inner
+        self.wait_s = 0.0
+        self.acquisitions = 0
+
+    def acquire(self, blocking=True, timeout=-1):
+        t0 = time.perf_counter()
+        got = self._inner.acquire(blocking, timeout)
+        self.wait_s += time.perf_counter() - t0
+        self.acquisitions += 1
+        return got
+
+    def release(self):
+        self._inner.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _pct(vals, pct):
+    if not vals:
+        return None
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(round(pct / 100.0 * (len(vals) - 1))))]
+
+
+def _drive(client, method, path, body, n, rnd, names):
+    """`n` requetes ; (latences en s, duree totale en s)."""
+    lat = []
+    start = time.perf_counter()
+    for _ in range(n):
+        kw = {"json": {"video": rnd.choice(names)}} if body == "random_video" else {}
+        t = time.perf_counter()
+        resp = client.open(path, method=method, **kw)
+        lat.append(time.perf_counter() - t)
+        resp.close()
+    return lat, time.perf_counter() - start
+
+
+def bench_child(size, requests, http, http_duration, port):
+    """Execute dans un process enfant (HOME deja pointe sur la bibliotheque)."""
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    from app.blueprints import legacy
+
+    app = create_app()
+    legacy._thumb_thread_started = True  # pas de ffmpeg sur des fichiers factices
+    lock = TimedLock(legacy.videos_lock)
+    legacy.videos_lock = lock
+    client = app.test_client()
+    names = [f for f in os.listdir(app.extensions["paths"]["VIDEO_DIR"]) if not f.startswith("thumb")]
+    rnd = random.Random(42)
+
+    t0 = time.perf_counter()
+    client.get("/status_min")  # premier scan de la bibliotheque
+    first_scan_ms = (time.perf_counter() - t0) * 1000
+
+    results = {}
+    for method, path, body in ENDPOINTS:
+        n = requests if path != "/" else max(10, requests // 10)
+        # 1) latence sans tracemalloc (il ralentit chaque allocation)
+        lock.wait_s, lock.acquisitions = 0.0, 0
+        lat, elapsed = _drive(client, method, path, body, n, rnd, names)
+        lock_wait_s, lock_acquisitions = lock.wait_s, lock.acquisitions
+        # 2) allocations seulement
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        snap0 = tracemalloc.take_snapshot()
+        _drive(client, method, path, body, n, rnd, names)
+        snap1 = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats = snap1.compare_to(snap0, "filename")
+        alloc_blocks = sum(max(0, s.count_diff) for s in stats)
+        alloc_bytes = sum(max(0, s.size_diff) for s in stats)
+        results[f"{method} {path}"] = {
+            "requests": n,
+            "rps": round(n / elapsed, 1),
+            "p50_ms": round(_pct(lat, 50) * 1000, 3),
+            "p99_ms": round(_pct(lat, 99) * 1000, 3),
+            "mean_ms": round(statistics.mean(lat) * 1000, 3),
+            "lock_wait_ms_total": round(lock_wait_s * 1000, 3),
+            "lock_acquisitions": lock_acquisitions,
+            "retained_alloc_bytes_per_req": round(alloc_bytes / n, 1),
+            "retained_alloc_blocks_per_req": round(alloc_blocks / n, 2),
+            "peak_traced_kb": round(peak / 1024, 1),
+        }
+
+    report = {"size": size, "first_scan_ms": round(first_scan_ms, 2), "test_client": results}
+
+    if http:
+        sys.path.insert(0, BENCH_DIR)
+        from http_load import run_load
+        from waitress.server import create_server
+
+        srv = create_server(app, host="127.0.0.1", port=port, threads=8)
+        threading.Thread(target=srv.run, daemon=True).start()
+        time.sleep(0.3)
+        report["http"] = run_load(f"http://127.0.0.1:{port}", ["/status_min", "/status"], 16, http_duration)
+        srv.close()
+    return report
+
+
+def run_size(size, args):
+    home = tempfile.mkdtemp(prefix=f"rpi-avp-bench-{size}-")
+    try:
+        make_library(home, size)
+        env = dict(os.environ, HOME=home, RPI_AVP_PLAYER="fake", RPI_AVP_FAKE_DURATION="3600")
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", str(size),
+               "--requests", str(args.requests), "--http-duration", str(args.http_duration),
+               "--port", str(args.port)]
+        if args.http:
+            cmd.append("--http")
+        out = subprocess.check_output(cmd, env=env, cwd=ROOT, text=True, stderr=subprocess.DEVNULL)
+        return json.loads(out.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+
+def _git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = {r["size"]: r for r in json.load(f)["runs"]}
+    with open(new_path, encoding="utf-8") as f:
+        new = {r["size"]: r for r in json.load(f)["runs"]}
+    print(f"{'size':>6}  {'endpoint':<22} {'p99 old':>9} {'p99 new':>9} {'delta':>8}")
+    for size in sorted(set(old) & set(new)):
+        for ep, nv in new[size]["test_client"].items():
+            ov = old[size]["test_client"].get(ep)
+            if not ov:
+                continue
+            delta = (nv["p99_ms"] - ov["p99_ms"]) / ov["p99_ms"] * 100 if ov["p99_ms"] else 0.0
+            print(f"{size:>6}  {ep:<22} {ov['p99_ms']:>9.3f} {nv['p99_ms']:>9.3f} {delta:>+7.1f}%")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="100,1000,5000,20000")
+    ap.add_argument("--requests", type=int, default=300, help="requetes par endpoint (/ : 1/10)")
+    ap.add_argument("--http", action="store_true", help="ajoute une charge HTTP reelle (waitress)")
+    ap.add_argument("--http-duration", type=float, default=5.0)
+    ap.add_argument("--port", type=int, default=5056)
+    ap.add_argument("--json", default=None)
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    ap.add_argument("--child", type=int, default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    if args.child is not None:
+        print(json.dumps(bench_child(args.child, args.requests, args.http, args.http_duration, args.port)))
+        return 0
+
+    report = {
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "runs": [],
+    }
+    for size in [int(x) for x in args.sizes.split(",") if x.strip()]:
+        run = run_size(size, args)
+        report["runs"].append(run)
+        for ep, r in run["test_client"].items():
+            print(f"[{size:>6}] {ep:<22} p50={r['p50_ms']:.3f}ms p99={r['p99_ms']:.3f}ms "
+                  f"rps={r['rps']:.0f} lock_wait={r['lock_wait_ms_total']:.1f}ms "
+                  f"alloc/req={r['retained_alloc_bytes_per_req']:.0f}B", file=sys.stderr)
+    out = json.dumps(report, indent=2)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
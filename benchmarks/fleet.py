@@ -0,0 +1,117 @@
+"""
+Benchmark du mode flotte : N instances locales (ports differents, HOME
+temporaire, lecteur "fake") pilotees par un FleetService.
+
+  python benchmarks/fleet.py --players 12 --rounds 20
+
+Compare un tour de statut "un onglet par lecteur" (une connexion neuve
+par requete, en sequence) avec FleetService.poll() (connexions keep-alive,
+requetes concurrentes bornees), puis mesure une commande groupee
+("play-video" sur tous).
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.services.fleet import FleetService  # noqa: E402
+
+
+class DictSettings(dict):
+    def get(self, key, default=None):
+        return dict.get(self, key, default)
+
+
+def start_players(count, base_port, work):
+    procs = []
+    for i in range(count):
+        home = os.path.join(work, f"p{i}")
+        video_dir = os.path.join(home, "Videos", "RPi-Autonomous-Video-Player")
+        os.makedirs(video_dir)
+        for j in range(3):
+            # non vides et sans structure MP4 a verifier : pas de mise en quarantaine
+            with open(os.path.join(video_dir, f"clip{j}.mkv"), "wb") as f:
+                f.write(b"\0" * 1024)
+        env = dict(os.environ, HOME=home, RPI_AVP_PORT=str(base_port + i), RPI_AVP_PLAYER="fake",
+                   RPI_AVP_FAKE_DURATION="600", PYTHONPATH=ROOT)
+        procs.append(subprocess.Popen([sys.executable, os.path.join(ROOT, "run.py")], cwd=ROOT, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    deadline = time.monotonic() + 60
+    for i in range(count):
+        while True:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{base_port + i}/health", timeout=1).read()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"instance {base_port + i} ne repond pas")
+                time.sleep(0.2)
+    return procs
+
+
+def timed(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return {"p50_ms": round(statistics.median(samples), 1), "max_ms": round(max(samples), 1)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--players", type=int, default=6)
+    ap.add_argument("--base-port", type=int, default=5101)
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args(argv)
+
+    work = tempfile.mkdtemp(prefix="fleet-bench-")
+    procs = start_players(args.players, args.base_port, work)
+    urls = [f"http://127.0.0.1:{args.base_port + i}" for i in range(args.players)]
+    try:
+        def tabs():
+            for url in urls:
+                urllib.request.urlopen(url + "/status", timeout=5).read()
+
+        fleet = FleetService(DictSettings(fleet_peers=urls, fleet_concurrency=args.concurrency, fleet_beacon=False))
+        fleet.poll()  # connexions ouvertes hors mesure
+        report = {"players": args.players, "rounds": args.rounds, "concurrency": args.concurrency,
+                  "tabs_round": timed(tabs, args.rounds),
+                  "fleet_round": timed(fleet.poll, args.rounds)}
+        online = sum(1 for p in fleet.poll() if p["ok"])
+        t0 = time.perf_counter()
+        res = fleet.command("play-video", {"video": "clip1.mkv"})
+        report["command_all_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        report["command_ok"] = sum(1 for r in res["results"] if r["ok"])
+        report["online"] = online
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(5)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        shutil.rmtree(work, ignore_errors=True)
+
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Generateur de charge HTTP minimal (stdlib) : N clients keep-alive en parallele
+pendant D secondes, rapporte req/s et latences p50/p99 par chemin.
+
+Exemples :
+  # contre une instance deja lancee
+  python benchmarks/http_load.py --url http://127.0.0.1:5000 -c 16 -d 20
+
+  # avant/apres : serveur dev Werkzeug vs waitress, lances en process
+  python benchmarks/http_load.py --spawn dev --json before.json
+  python benchmarks/http_load.py --spawn waitress --json after.json
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_PATHS = ["/status_min", "/status", "/static/css/style.css", "/static/js/scripts.js"]
+
+
+def percentile(sorted_vals, pct):
+    if not sorted_vals:
+        return None
+    k = min(len(sorted_vals) - 1, max(0, int(round(pct / 100.0 * (len(sorted_vals) - 1)))))
+    return sorted_vals[k]
+
+
+def _worker(host, port, paths, deadline, results, lock, method="GET"):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    local = {p: [] for p in paths}
+    errors = 0
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            conn.request(method, path)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status >= 500:
+                errors += 1
+        except Exception:
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=10)
+            continue
+        local[path].append(time.perf_counter() - t0)
+    conn.close()
+    with lock:
+        for p, lat in local.items():
+            results["latencies"].setdefault(p, []).extend(lat)
+        results["errors"] += errors
+
+
+def run_load(base_url, paths, concurrency, duration, method="GET"):
+    u = urlsplit(base_url)
+    host, port = u.hostname, u.port or 80
+    results = {"latencies": {}, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=_worker, args=(host, port, paths, deadline, results, lock, method))
+        for _ in range(concurrency)
+    ]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    report = {"concurrency": concurrency, "duration_s": round(elapsed, 2), "errors": results["errors"], "paths": {}}
+    total = 0
+    for p, lat in results["latencies"].items():
+        lat.sort()
+        total += len(lat)
+        report["paths"][p] = {
+            "requests": len(lat),
+            "rps": round(len(lat) / elapsed, 1),
+            "p50_ms": round(percentile(lat, 50) * 1000, 2) if lat else None,
+            "p99_ms": round(percentile(lat, 99) * 1000, 2) if lat else None,
+        }
+    report["total_rps"] = round(total / elapsed, 1)
+    return report
+
+
+def spawn_server(kind, port, threads=8):
+    """Lance l'app dans ce process (thread daemon) avec le serveur demande."""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import create_app
+
+    app = create_app()
+    if kind == "waitress":
+        from waitress.server import create_server
+        srv = create_server(app, host="127.0.0.1", port=port, threads=threads)
+        target = srv.run
+    else:
+        from werkzeug.serving import make_server
+        srv = make_server("127.0.0.1", port, app, threaded=True)
+        target = srv.serve_forever
+    threading.Thread(target=target, daemon=True).start()
+    time.sleep(0.5)
+    return f"http://127.0.0.1:{port}"
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default=None, help="URL de base (sinon --spawn)")
+    ap.add_argument("--spawn", choices=["dev", "waitress"], default=None)
+    ap.add_argument("--port", type=int, default=5055)
+    ap.add_argument("--threads", type=int, default=8, help="threads serveur (--spawn waitress)")
+    ap.add_argument("-c", "--concurrency", type=int, default=16)
+    ap.add_argument("-d", "--duration", type=float, default=10.0)
+    ap.add_argument("-p", "--path", action="append", dest="paths")
+    ap.add_argument("--json", default=None, help="fichier de sortie JSON")
+    args = ap.parse_args(argv)
+
+    base = args.url or spawn_server(args.spawn or "waitress", args.port, args.threads)
+    report = run_load(base, args.paths or DEFAULT_PATHS, args.concurrency, args.duration)
+    report["server"] = args.spawn or base
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+Benchmark de la lecture synchronisee (lockstep) : un maitre + N suiveurs
+lances en local (ports HTTP differents, HOME et settings.json par instance,
+lecteur "fake" dont l'horloge derive de --drift % par instance).
+
+  python benchmarks/lockstep.py --followers 3 --seconds 30
+
+Deux passes : instances independantes (lockstep_role "off"), puis maitre
++ suiveurs. L'ecart est mesure de l'exterieur : /api/lockstep renvoie la
+position et l'horloge monotone (commune aux process d'une meme machine),
+l'ecart d'un suiveur est sa position moins celle du maitre ramenee au
+meme instant ; un element different compte comme "desaligne".
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_instance(work, index, port, settings, speed, open_delay, duration):
+    home = os.path.join(work, f"p{index}")
+    video_dir = os.path.join(home, "Videos", "RPi-Autonomous-Video-Player")
+    os.makedirs(video_dir)
+    for j in range(3):
+        # non vides et sans structure MP4 a verifier : pas de mise en quarantaine
+        with open(os.path.join(video_dir, f"clip{j}.mkv"), "wb") as f:
+            f.write(b"\0" * 1024)
+    settings_path = os.path.join(home, "settings.json")
+    with open(settings_path, "w", encoding="utf-8") as f:
+        json.dump(dict(settings, autoplay=True, loop_all=True, sync_on_boot=False, fleet_beacon=False), f)
+    env = dict(os.environ, HOME=home, RPI_AVP_PORT=str(port), RPI_AVP_SETTINGS=settings_path,
+               RPI_AVP_PLAYER="fake", RPI_AVP_FAKE_DURATION=str(duration),
+               RPI_AVP_FAKE_SPEED=str(speed), RPI_AVP_FAKE_OPEN_DELAY=str(open_delay), PYTHONPATH=ROOT)
+    return subprocess.Popen([sys.executable, os.path.join(ROOT, "run.py")], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def get(url):
+    return json.loads(urllib.request.urlopen(url, timeout=2).read())
+
+
+def wait_up(ports):
+    deadline = time.monotonic() + 60
+    for port in ports:
+        while True:
+            try:
+                get(f"http://127.0.0.1:{port}/health")
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"instance {port} ne repond pas")
+                time.sleep(0.2)
+
+
+def sample(ports):
+    """Statut de toutes les instances, releve en parallele."""
+    out = [None] * len(ports)
+
+    def _one(i):
+        try:
+            out[i] = get(f"http://127.0.0.1:{ports[i]}/api/lockstep")
+        except (OSError, ValueError):
+            pass
+
+    threads = [threading.Thread(target=_one, args=(i,)) for i in range(len(ports))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return out
+
+
+def run_pass(args, work, lockstep):
+    ports = [args.base_port + i for i in range(args.followers + 1)]
+    procs = []
+    for i, port in enumerate(ports):
+        settings = {}
+        if lockstep:
+            settings = {"lockstep_role": "master" if i == 0 else "follower", "lockstep_port": args.udp_port,
+                        "lockstep_master": f"127.0.0.1:{args.udp_port}", "fleet_name": f"p{i}"}
+        # horloges des lecteurs legerement differentes (le maitre a la vitesse nominale)
+        speed = 1.0 + (args.drift / 100.0) * (i if i % 2 else -i)
+        procs.append(start_instance(os.path.join(work, "on" if lockstep else "off"), i, port, settings,
+                                    speed, args.open_delay * (i + 1), args.duration))
+    skews, misaligned, total = [], 0, 0
+    try:
+        wait_up(ports)
+        started = time.monotonic()
+        while time.monotonic() - started < args.seconds:
+            time.sleep(args.interval)
+            states = sample(ports)
+            master = states[0]
+            if time.monotonic() - started < args.warmup or not master or master.get("state") != "playing":
+                continue
+            for st in states[1:]:
+                if not st:
+                    continue
+                total += 1
+                if st.get("media") != master.get("media") or st.get("position_ms") is None:
+                    misaligned += 1
+                    continue
+                expected = master["position_ms"] + (st["clock"] - master["clock"]) * 1000.0
+                skews.append(abs(st["position_ms"] - expected))
+        followers = sample(ports)[1:] if lockstep else []
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(5)
+            except subprocess.TimeoutExpired:
+                p.kill()
+    skews.sort()
+    report = {
+        "samples": total,
+        "misaligned_pct": round(100.0 * misaligned / total, 1) if total else None,
+        "skew_p50_ms": round(statistics.median(skews), 1) if skews else None,
+        "skew_p95_ms": round(skews[int(0.95 * (len(skews) - 1))], 1) if skews else None,
+        "skew_max_ms": round(skews[-1], 1) if skews else None,
+    }
+    if followers:
+        report["reported"] = [{k: (f or {}).get(k) for k in ("name", "skew_p50_ms", "skew_p95_ms", "rtt_ms",
+                                                              "rate", "leads_ms", "corrections")}
+                              for f in followers]
+    return report
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--followers", type=int, default=3)
+    ap.add_argument("--seconds", type=float, default=30.0)
+    ap.add_argument("--warmup", type=float, default=5.0, help="s ignorees au debut (boot, premier chargement)")
+    ap.add_argument("--duration", type=float, default=8.0, help="duree des clips fake (s)")
+    ap.add_argument("--drift", type=float, default=1.0, help="derive d'horloge par instance (%%)")
+    ap.add_argument("--open-delay", type=float, default=0.05, help="latence de demarrage fake (s, x rang)")
+    ap.add_argument("--interval", type=float, default=0.2)
+    ap.add_argument("--base-port", type=int, default=5201)
+    ap.add_argument("--udp-port", type=int, default=5198)
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args(argv)
+
+    work = tempfile.mkdtemp(prefix="lockstep-bench-")
+    try:
+        report = {"followers": args.followers, "seconds": args.seconds, "drift_pct": args.drift,
+                  "independent": run_pass(args, work, lockstep=False),
+                  "lockstep": run_pass(args, work, lockstep=True)}
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Benchmark rclone CLI vs daemon rcd : latence d'operations repetees (list,
+sync sans changement) contre un remote local (dossier temporaire), donc
+sans reseau ni compte Drive.
+
+  python benchmarks/rclone_rcd.py --files 200 --runs 10
+
+En mode CLI chaque operation relance un process rclone (lecture de la
+config, init du backend) ; en mode rcd un seul daemon sert toutes les
+requetes sur une connexion HTTP keep-alive (RcdClient).
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.services.rclone_rcd import RcdClient  # noqa: E402
+
+
+def make_tree(root, files, size):
+    for i in range(files):
+        d = os.path.join(root, f"dir{i % 10}")
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, f"clip{i:04d}.mp4"), "wb") as f:
+            f.write(os.urandom(size))
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return {"p50_ms": round(statistics.median(samples), 1), "max_ms": round(max(samples), 1)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--files", type=int, default=200)
+    ap.add_argument("--size", type=int, default=4096, help="octets par fichier")
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--rclone", default=shutil.which("rclone"))
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args(argv)
+    if not args.rclone:
+        print("rclone introuvable", file=sys.stderr)
+        return 2
+
+    work = tempfile.mkdtemp(prefix="rcd-bench-")
+    src, dst = os.path.join(work, "src"), os.path.join(work, "dst")
+    make_tree(src, args.files, args.size)
+    os.makedirs(dst)
+    env = dict(os.environ, RCLONE_CONFIG=os.path.join(work, "rclone.conf"))
+    open(env["RCLONE_CONFIG"], "w").close()
+
+    def cli(*cmd):
+        subprocess.run([args.rclone, *cmd], env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # premier sync hors mesure : les runs suivants ne transferent rien
+    cli("sync", src, dst)
+    report = {"files": args.files, "runs": args.runs}
+    report["cli"] = {
+        "list": timed(lambda: cli("lsjson", "-R", src), args.runs),
+        "sync_noop": timed(lambda: cli("sync", src, dst, "--fast-list"), args.runs),
+    }
+    client = RcdClient(args.rclone, env=env)
+    t0 = time.perf_counter()
+    client.start()
+    report["rcd_start_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    try:
+        report["rcd"] = {
+            "list": timed(lambda: client.list(src, recurse=True), args.runs),
+            "sync_noop": timed(lambda: client.sync(src, dst, config={"UseListR": True}), args.runs),
+        }
+    finally:
+        client.stop()
+        shutil.rmtree(work, ignore_errors=True)
+
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
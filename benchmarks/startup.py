@@ -0,0 +1,80 @@
+"""
+Benchmark de demarrage : temps d'import du paquet `app`, de create_app() et
+de la premiere requete (/status_min via le client de test), chacun mesure
+dans un interpreteur neuf. Verifie aussi qu'aucun effet de bord n'a lieu
+avant la premiere requete (python-vlc non importe, VIDEO_DIR non scanne).
+
+  python benchmarks/startup.py --runs 5 --budget-import-ms 400 --budget-first-request-ms 600
+
+Code de sortie 1 si un budget (mediane) est depasse ou si un effet de bord
+est detecte.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+flask_app = app.create_app()
+t2 = time.perf_counter()
+from app.blueprints import legacy
+side_effects = {"vlc_imported": "vlc" in sys.modules, "library_scanned": legacy._library_loaded}
+client = flask_app.test_client()
+client.get("/status_min")
+t3 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "create_app_ms": (t2 - t1) * 1000,
+    "first_request_ms": (t3 - t2) * 1000,
+    "time_to_first_request_ms": (t3 - t0) * 1000,
+    "side_effects": side_effects,
+}))
+"""
+
+
+def probe_once():
+    out = subprocess.check_output([sys.executable, "-c", _PROBE], cwd=ROOT, text=True)
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--budget-import-ms", type=float, default=400.0)
+    ap.add_argument("--budget-first-request-ms", type=float, default=600.0,
+                    help="budget import + create_app + premiere requete")
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args(argv)
+
+    samples = [probe_once() for _ in range(max(1, args.runs))]
+    keys = ("import_ms", "create_app_ms", "first_request_ms", "time_to_first_request_ms")
+    report = {k: round(statistics.median(s[k] for s in samples), 1) for k in keys}
+    report["side_effects"] = samples[0]["side_effects"]
+    report["budgets"] = {"import_ms": args.budget_import_ms, "time_to_first_request_ms": args.budget_first_request_ms}
+    failures = []
+    if report["import_ms"] > args.budget_import_ms:
+        failures.append("import_ms")
+    if report["time_to_first_request_ms"] > args.budget_first_request_ms:
+        failures.append("time_to_first_request_ms")
+    if samples[0]["side_effects"]["vlc_imported"] or samples[0]["side_effects"]["library_scanned"]:
+        failures.append("side_effects")
+    report["failures"] = failures
+
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
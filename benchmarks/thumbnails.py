@@ -0,0 +1,159 @@
+"""
+Benchmark listing + miniatures sur medias synthetiques.
+
+1. Fabrique de courts clips avec les sources lavfi de ffmpeg (testsrc2 + sine)
+   pour plusieurs resolutions / codecs (cache dans --media-dir).
+2. refresh_videos_list() : fichiers/s sur des dossiers de N fichiers video
+   factices (+10 % de fichiers non video), cf. --list-sizes.
+3. generate_thumbnails() : miniatures/s pour chaque strategie de seek
+   (accurate / fast / keyframe) et chaque nombre de workers.
+
+  python benchmarks/thumbnails.py --resolutions 640x360,1280x720,1920x1080 \\
+      --codecs libx264,mpeg4 --clips 8 --workers 1,2,4 --json thumbs.json
+
+La partie miniatures necessite ffmpeg dans le PATH.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.utils import SEEK_MODES, generate_thumbnails, refresh_videos_list  # noqa: E402
+
+CODEC_EXT = {"libx264": ".mp4", "mpeg4": ".avi", "libvpx": ".webm", "libvpx-vp9": ".webm", "libx265": ".mkv"}
+
+
+def make_clip(path, resolution, codec, duration, fps=25):
+    """Clip lavfi (mire + sinus) avec GOP de 2 s (comme une source 'reelle')."""
+    cmd = [
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={resolution}:rate={fps}:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-c:v", codec, "-g", str(fps * 2), "-pix_fmt", "yuv420p",
+        "-shortest", path,
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def ensure_media(media_dir, resolutions, codecs, clips, duration):
+    """Genere (une fois) les clips ; renvoie {(res, codec): [chemins]}."""
+    os.makedirs(media_dir, exist_ok=True)
+    sets = {}
+    for res, codec in itertools.product(resolutions, codecs):
+        ext = CODEC_EXT.get(codec, ".mkv")
+        paths = []
+        for i in range(clips):
+            p = os.path.join(media_dir, f"{codec}_{res}_{duration}s_{i:02d}{ext}")
+            if not os.path.isfile(p):
+                make_clip(p, res, codec, duration)
+            paths.append(p)
+        sets[(res, codec)] = paths
+    return sets
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def bench_listing(work, size, repeats=5):
+    """refresh_videos_list() sur `size` fichiers factices (+ bruit non video)."""
+    d = os.path.join(work, f"list_{size}")
+    os.makedirs(d, exist_ok=True)
+    for i in range(size):
+        open(os.path.join(d, f"v{i:06d}.mp4"), "wb").close()
+        if i % 10 == 0:
+            open(os.path.join(d, f"note{i:06d}.txt"), "wb").close()
+    best = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        n = len(refresh_videos_list(d))
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return {"files": n, "best_s": round(best, 4), "files_per_s": round(n / best, 1) if best else None}
+
+
+def bench_thumbs(work, clips, seek_mode, workers, seek_seconds):
+    vdir = tempfile.mkdtemp(prefix="v", dir=work)
+    tdir = os.path.join(vdir, "thumbnails")
+    for p in clips:
+        _link_or_copy(p, os.path.join(vdir, os.path.basename(p)))
+    devnull = open(os.devnull, "w")
+    stdout, sys.stdout = sys.stdout, devnull  # generate_thumbnails print() chaque fichier
+    try:
+        t0 = time.perf_counter()
+        created = generate_thumbnails(vdir, tdir, seek_seconds, seek_mode=seek_mode, workers=workers)
+        dt = time.perf_counter() - t0
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+        shutil.rmtree(vdir, ignore_errors=True)
+    return {"clips": len(clips), "created": created, "seconds": round(dt, 3),
+            "thumbs_per_s": round(len(clips) / dt, 2) if dt else None}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--resolutions", default="640x360,1280x720,1920x1080")
+    ap.add_argument("--codecs", default="libx264,mpeg4")
+    ap.add_argument("--clips", type=int, default=8, help="clips par (resolution, codec)")
+    ap.add_argument("--duration", type=int, default=12, help="duree des clips (s)")
+    ap.add_argument("--seek", type=int, default=5, help="seek_seconds (VLC_START_AT)")
+    ap.add_argument("--modes", default=",".join(SEEK_MODES))
+    ap.add_argument("--workers", default="1,2,4")
+    ap.add_argument("--list-sizes", default="1000,10000")
+    ap.add_argument("--media-dir", default=os.path.join(tempfile.gettempdir(), "rpi-avp-bench-media"))
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args(argv)
+
+    resolutions = [r for r in args.resolutions.split(",") if r]
+    codecs = [c for c in args.codecs.split(",") if c]
+    modes = [m for m in args.modes.split(",") if m]
+    workers = [int(w) for w in args.workers.split(",") if w]
+
+    report = {"python": platform.python_version(), "machine": platform.machine(),
+              "cpus": os.cpu_count(), "listing": [], "thumbnails": []}
+    work = tempfile.mkdtemp(prefix="rpi-avp-thumbs-")
+    try:
+        for size in [int(x) for x in args.list_sizes.split(",") if x]:
+            r = bench_listing(work, size)
+            report["listing"].append(dict(size=size, **r))
+            print(f"[list] {size:>6} files: {r['files_per_s']:.0f} files/s", file=sys.stderr)
+
+        if not shutil.which("ffmpeg"):
+            print("ffmpeg introuvable dans le PATH : miniatures ignorees", file=sys.stderr)
+            report["thumbnails"] = None
+            media = {}
+        else:
+            media = ensure_media(args.media_dir, resolutions, codecs, args.clips, args.duration)
+        for (res, codec), clips in media.items():
+            for mode, w in itertools.product(modes, workers):
+                r = bench_thumbs(work, clips, mode, w, args.seek)
+                report["thumbnails"].append(dict(resolution=res, codec=codec, seek_mode=mode, workers=w, **r))
+                print(f"[thumb] {res:>9} {codec:<10} {mode:<8} w={w}: {r['thumbs_per_s']} thumbs/s",
+                      file=sys.stderr)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    out = json.dumps(report, indent=2)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,14 @@
-from app import create_app
+import os
+
+from app import create_app, start_background
+from app.server import serve
 app = create_app()
+# Port HTTP (plusieurs instances sur une meme machine : RPI_AVP_PORT=5001 ...)
+app.config["HTTP_PORT"] = int(os.environ.get("RPI_AVP_PORT", "5000"))
+# Sync au boot (miroir : supprime les fichiers locaux absents du remote), autoplay,
+# miniatures et services de fond : lances a l'import de ce module (process serveur,
+# ou serveur WSGI qui charge run:app), jamais par create_app() seul
+start_background(app)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
+    serve(app, host="0.0.0.0", port=app.config["HTTP_PORT"])